@@ -3,6 +3,8 @@ import json
 import datetime
 import azure.functions as func
 
+from shared_code import clients, metrics
+
 # Versi API bisa di-hardcode di sini atau diambil dari env variable jika perlu
 API_VERSION = "0.1.0-mvp" 
 
@@ -21,6 +23,11 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             "documentation": "https://github.com/dzakwanalifi/BISBI-API/blob/master/README.md" # Ganti dengan URL README Anda
         }
 
+        # Counter cache/performa per worker (hit/miss, dsb.), hanya jika diminta
+        if req.params.get('metrics', '').lower() == 'true':
+            response_data["metrics"] = metrics.snapshot()
+            response_data["connection_reuse"] = clients.connection_stats()
+
         return func.HttpResponse(
             body=json.dumps(response_data),
             mimetype="application/json",
@@ -0,0 +1,112 @@
+import logging
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import azure.functions as func
+
+from . import MAX_IMAGE_UPLOAD_SIZE_BYTES, _get_hf_inference_client, process_image, log_stage_timings
+from shared_code import upload_ingest
+
+# --- KONFIGURASI BATCH ---
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", 8))
+MAX_BATCH_UPLOAD_SIZE_BYTES = int(os.environ.get("MAX_BATCH_UPLOAD_SIZE_BYTES", 25 * 1024 * 1024)) # 25MB total default
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", 4))
+
+# Pool terpisah dari detection_executor: process_image bisa submit ke pool itu (mode paralel),
+# jadi berbagi pool yang sama bisa deadlock saat semua worker menunggu.
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_CONCURRENCY, thread_name_prefix="detect-objects-batch")
+
+
+def _process_item(hf_client, index, image_file, image_bytes):
+    item = {"index": index, "filename": image_file.filename}
+    timings = {}
+    item_start = time.perf_counter()
+    try:
+        status_code, payload = process_image(hf_client, image_bytes, timings)
+    except Exception as item_err:
+        logging.error(f"Unexpected error processing batch image {index}: {item_err}", exc_info=True)
+        status_code, payload = 500, {"error": "An unexpected error occurred."}
+    log_stage_timings(timings, (time.perf_counter() - item_start) * 1000)
+    item["status"] = status_code
+    item.update(payload)
+    return item
+
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request for DetectObjectsVisualBatch.')
+    request_start = time.perf_counter()
+
+    hf_client = _get_hf_inference_client()
+    if hf_client is None:
+        logging.error("HuggingFace InferenceClient could not be initialized or is not available.")
+        return func.HttpResponse(
+             json.dumps({"error": "Server configuration error: HuggingFace client initialization failed."}),
+             mimetype="application/json",
+             status_code=500
+        )
+
+    try:
+        max_request_bytes = MAX_BATCH_UPLOAD_SIZE_BYTES + MAX_BATCH_IMAGES * upload_ingest.MULTIPART_OVERHEAD_BYTES
+        if upload_ingest.check_request_size(req, max_request_bytes, "Batch"):
+            return upload_ingest.too_large_response("Total batch", MAX_BATCH_UPLOAD_SIZE_BYTES)
+
+        image_files = req.files.getlist('image')
+        if not image_files:
+            logging.warning("No image files found in batch request.")
+            return func.HttpResponse(json.dumps({"error": "At least one image file is required."}), mimetype="application/json", status_code=400)
+
+        if len(image_files) > MAX_BATCH_IMAGES:
+            logging.warning(f"Batch contains {len(image_files)} images, limit is {MAX_BATCH_IMAGES}.")
+            return func.HttpResponse(
+                json.dumps({"error": f"A batch may contain at most {MAX_BATCH_IMAGES} images."}),
+                mimetype="application/json",
+                status_code=413
+            )
+
+        results = [None] * len(image_files)
+        pending = []
+        total_bytes = 0
+        for index, image_file in enumerate(image_files):
+            # Sisa kuota agregat ikut membatasi pembacaan, jadi batch yang kebesaran berhenti dibaca lebih awal
+            read_limit = min(MAX_IMAGE_UPLOAD_SIZE_BYTES, MAX_BATCH_UPLOAD_SIZE_BYTES - total_bytes)
+            try:
+                image_bytes = upload_ingest.read_upload(image_file, read_limit)
+            except upload_ingest.UploadTooLargeError:
+                if read_limit < MAX_IMAGE_UPLOAD_SIZE_BYTES:
+                    logging.warning(f"Batch upload size exceeds limit of {MAX_BATCH_UPLOAD_SIZE_BYTES / (1024*1024):.2f}MB.")
+                    return upload_ingest.too_large_response("Total batch", MAX_BATCH_UPLOAD_SIZE_BYTES)
+                results[index] = {
+                    "index": index, "filename": image_file.filename, "status": 413,
+                    "error": f"Image size exceeds the limit of {MAX_IMAGE_UPLOAD_SIZE_BYTES // (1024*1024)}MB."
+                }
+                continue
+            total_bytes += len(image_bytes)
+
+            if not image_bytes:
+                results[index] = {"index": index, "filename": image_file.filename, "status": 400, "error": "Image file cannot be empty."}
+            elif upload_ingest.sniff_mimetype(image_bytes, upload_ingest.IMAGE_SIGNATURES) is None:
+                results[index] = {
+                    "index": index, "filename": image_file.filename, "status": 415,
+                    "error": "Image file format is not supported or the file is corrupted."
+                }
+            else:
+                pending.append((index, image_file, image_bytes))
+
+        logging.info(f"Received batch of {len(image_files)} images ({total_bytes} bytes), processing {len(pending)} with concurrency {BATCH_MAX_CONCURRENCY}.")
+
+        futures = [batch_executor.submit(_process_item, hf_client, index, image_file, image_bytes) for index, image_file, image_bytes in pending]
+        for future in futures:
+            item = future.result()
+            results[item["index"]] = item
+
+        logging.info(f"DetectObjectsVisualBatch processed {len(results)} images in {(time.perf_counter() - request_start) * 1000:.1f}ms.")
+        return func.HttpResponse(json.dumps({"results": results}), mimetype="application/json", status_code=200)
+
+    except ValueError as ve:
+        logging.error(f"ValueError during batch processing: {ve}", exc_info=True)
+        return func.HttpResponse(json.dumps({"error": f"Error processing data: {str(ve)}"}), mimetype="application/json", status_code=500)
+    except Exception as e:
+        logging.error(f"An unexpected error occurred in DetectObjectsVisualBatch: {e}", exc_info=True)
+        return func.HttpResponse(json.dumps({"error": "An unexpected error occurred."}), mimetype="application/json", status_code=500)
@@ -0,0 +1,55 @@
+import hashlib
+
+from shared_code import metrics
+from shared_code.ttl_cache import build_tiered_cache
+
+
+def image_digest(image_bytes):
+    """
+    Returns the SHA-256 hex digest of the uploaded image bytes.
+    """
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def detection_cache_key(digest, model_id, iou_threshold, score_threshold, pipeline_params=()):
+    """
+    Builds the detection result cache key.
+
+    Preprocessing is deterministic, so the digest of the uploaded bytes together with the
+    preprocessing and NMS parameters (pipeline_params) identifies the normalized image
+    sent to the model without having to decode it on the lookup path.
+    """
+    parts = [digest, model_id, repr(float(iou_threshold)), repr(float(score_threshold))]
+    parts.extend(str(param) for param in pipeline_params)
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+def build_cache(name, max_entries, ttl_seconds, sqlite_path=None):
+    """
+    Builds a TieredCache named `name` with an optional SQLite tier.
+
+    If the SQLite file cannot be opened the cache falls back to memory only.
+    """
+    return build_tiered_cache(name, max_entries, ttl_seconds, sqlite_path)
+
+def get_counted(cache, key, counter_name):
+    """
+    Looks up `key` in `cache` and counts the outcome as `<counter_name>.hit` / `<counter_name>.miss`
+    across both tiers.
+    """
+    value = cache.get(key)
+    metrics.increment(f"{counter_name}.{'hit' if value is not None else 'miss'}")
+    return value
+
+def cache_stats():
+    """
+    Returns hit/miss counters of the DetectObjectsVisual caches.
+    """
+    return {
+        "detection": {
+            "hits": metrics.get("detect_objects.detection_cache.hit"),
+            "misses": metrics.get("detect_objects.detection_cache.miss"),
+        },
+        "safety_verdict": {
+            "hits": metrics.get("content_safety.verdict_cache.hit"),
+            "misses": metrics.get("content_safety.verdict_cache.miss"),
+        },
+    }
@@ -0,0 +1,129 @@
+import io
+import logging
+import time
+from dataclasses import dataclass
+
+from PIL import ExifTags, Image, ImageOps
+
+# Estimasi throughput uplink ke HuggingFace untuk melaporkan ms yang dihemat dari byte yang tidak dikirim
+DEFAULT_UPLINK_BYTES_PER_MS = 12500 # ~100 Mbit/s
+# Orientasi EXIF 5-8 memutar gambar 90/270 derajat: lebar dan tinggi tertukar saat ditampilkan
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+@dataclass
+class PreparedImage:
+    """
+    Result of preparing an uploaded image for the object detection model.
+
+    Attributes:
+        image_bytes (bytes): JPEG bytes to send to HuggingFace.
+        original_size (tuple): (width, height) of the uploaded image, upright (EXIF orientation applied).
+        sent_size (tuple): (width, height) of the image that is sent.
+        passthrough (bool): True if the upload was forwarded without decoding.
+        elapsed_ms (float): Time spent in preprocessing.
+        bytes_saved (int): Upload size minus sent size (negative if re-encoding grew the payload).
+    """
+    image_bytes: bytes
+    original_size: tuple
+    sent_size: tuple
+    passthrough: bool
+    elapsed_ms: float
+    bytes_saved: int
+
+    @property
+    def scale_x(self):
+        return self.original_size[0] / self.sent_size[0] if self.sent_size[0] else 1.0
+
+    @property
+    def scale_y(self):
+        return self.original_size[1] / self.sent_size[1] if self.sent_size[1] else 1.0
+
+def _fit_within(size, max_side):
+    """
+    Returns the (width, height) of size scaled down so that its longest side is at most max_side.
+    """
+    width, height = size
+    longest = max(width, height)
+    if max_side <= 0 or longest <= max_side:
+        return size
+    ratio = max_side / longest
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+def prepare_image_for_detection(image_bytes, max_side=1333, jpeg_quality=90, allow_passthrough=True):
+    """
+    Prepares an uploaded image for the object detection model.
+
+    The image is sent upright: the EXIF orientation (photos taken in portrait) is applied,
+    so boxes are always in the coordinates of the upright image, whatever its resolution.
+    Upright RGB JPEGs that already fit within max_side are forwarded untouched. Larger JPEGs are
+    decoded at a reduced scale with Image.draft() (the JPEG decoder skips DCT work for
+    1/2, 1/4 or 1/8 scales) and then downscaled to max_side. Other formats are decoded,
+    converted to RGB, downscaled and re-encoded as JPEG.
+
+    Args:
+        image_bytes (bytes): The uploaded image.
+        max_side (int): Maximum length of the longest side sent upstream. DETR resizes to
+                        ~800px (shortest side, max 1333px) internally, so more is wasted.
+        jpeg_quality (int): JPEG quality used when re-encoding.
+        allow_passthrough (bool): Whether suitable JPEGs may be forwarded without re-encoding.
+
+    Returns:
+        PreparedImage: The bytes to send and the geometry needed to map boxes back.
+
+    Raises:
+        PIL.UnidentifiedImageError, OSError: If the image cannot be decoded.
+    """
+    start = time.perf_counter()
+    pil_image = Image.open(io.BytesIO(image_bytes)) # Lazy: hanya header yang dibaca
+    orientation = pil_image.getexif().get(ExifTags.Base.Orientation, 1)
+    stored_size = pil_image.size
+    original_size = stored_size[::-1] if orientation in _ROTATED_ORIENTATIONS else stored_size # Ukuran tegak
+    target_size = _fit_within(original_size, max_side)
+
+    if (allow_passthrough and pil_image.format == 'JPEG' and pil_image.mode == 'RGB' and orientation == 1
+            and target_size == original_size):
+        return PreparedImage(
+            image_bytes=bytes(image_bytes),
+            original_size=original_size,
+            sent_size=original_size,
+            passthrough=True,
+            elapsed_ms=(time.perf_counter() - start) * 1000,
+            bytes_saved=0
+        )
+
+    if pil_image.format == 'JPEG' and target_size != original_size:
+        # draft() memilih skala decode terkecil yang masih >= target_size (dalam orientasi tersimpan)
+        pil_image.draft('RGB', target_size[::-1] if orientation in _ROTATED_ORIENTATIONS else target_size)
+    if orientation != 1:
+        pil_image = ImageOps.exif_transpose(pil_image)
+
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    if pil_image.size != target_size:
+        pil_image = pil_image.resize(target_size, Image.BILINEAR, reducing_gap=2.0)
+
+    img_byte_arr = io.BytesIO()
+    pil_image.save(img_byte_arr, format='JPEG', quality=jpeg_quality)
+    processed_bytes = img_byte_arr.getvalue()
+
+    return PreparedImage(
+        image_bytes=processed_bytes,
+        original_size=original_size,
+        sent_size=pil_image.size,
+        passthrough=False,
+        elapsed_ms=(time.perf_counter() - start) * 1000,
+        bytes_saved=len(image_bytes) - len(processed_bytes)
+    )
+
+def log_preprocessing_savings(prepared, uplink_bytes_per_ms=DEFAULT_UPLINK_BYTES_PER_MS):
+    """
+    Logs bytes saved on the upload to HuggingFace and the estimated upload time saved.
+    """
+    estimated_ms_saved = prepared.bytes_saved / uplink_bytes_per_ms if uplink_bytes_per_ms > 0 else 0.0
+    logging.info(
+        f"Image preprocessing: passthrough={prepared.passthrough}, "
+        f"original={prepared.original_size[0]}x{prepared.original_size[1]}, sent={prepared.sent_size[0]}x{prepared.sent_size[1]}, "
+        f"sent_bytes={len(prepared.image_bytes)}, bytes_saved={prepared.bytes_saved}, "
+        f"preprocess_ms={prepared.elapsed_ms:.1f}, est_upload_ms_saved={estimated_ms_saved:.1f}"
+    )
@@ -1,6 +1,7 @@
 import azure.functions as func
 import logging
 from . import main as detect_objects_main
+from .batch import main as detect_objects_batch_main
 
 # Create Blueprint
 bp = func.Blueprint()
@@ -8,4 +9,9 @@ bp = func.Blueprint()
 @bp.route(route="DetectObjectsVisual", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
 def DetectObjectsVisual_handler(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Blueprint: Routing to DetectObjectsVisual")
-    return detect_objects_main(req)
\ No newline at end of file
+    return detect_objects_main(req)
+
+@bp.route(route="DetectObjectsVisualBatch", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
+def DetectObjectsVisualBatch_handler(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Blueprint: Routing to DetectObjectsVisualBatch")
+    return detect_objects_batch_main(req)
@@ -1,5 +1,7 @@
 import logging # Ensure logging is imported
 
+import numpy as np
+
 def calculate_iou(box1, box2):
     """
     Calculates Intersection over Union (IoU) between two bounding boxes.
@@ -76,7 +78,7 @@ def apply_nms(detections, iou_threshold=0.5, score_threshold=0.5):
         
     return selected_detections
 
-def transform_hf_predictions_to_custom_format(hf_predictions):
+def transform_hf_predictions_to_custom_format(hf_predictions, scale_x=1.0, scale_y=1.0):
     """
     Transforms predictions from HuggingFace object detection format
     (e.g., from DETR models like facebook/detr-resnet-50) to the custom format.
@@ -86,6 +88,11 @@ def transform_hf_predictions_to_custom_format(hf_predictions):
     
     Custom format item (dict):
         {'confidence': float, 'objectName': str, 'boundingBox': {'x': int, 'y': int, 'width': int, 'height': int}}
+
+    Args:
+        hf_predictions (list): Predictions returned by the HuggingFace model.
+        scale_x (float): Factor mapping x coordinates of the image sent to the model back to the original image.
+        scale_y (float): Factor mapping y coordinates of the image sent to the model back to the original image.
     """
     custom_results = []
     if not isinstance(hf_predictions, list):
@@ -119,10 +126,10 @@ def transform_hf_predictions_to_custom_format(hf_predictions):
                 'confidence': float(score),
                 'objectName': str(label),
                 'boundingBox': {
-                    'x': int(xmin),
-                    'y': int(ymin),
-                    'width': int(xmax - xmin),
-                    'height': int(ymax - ymin)
+                    'x': int(xmin * scale_x),
+                    'y': int(ymin * scale_y),
+                    'width': int((xmax - xmin) * scale_x),
+                    'height': int((ymax - ymin) * scale_y)
                 }
             }
             # Ensure width and height are non-negative
@@ -136,4 +143,221 @@ def transform_hf_predictions_to_custom_format(hf_predictions):
         except Exception as e:
             logging.error(f"transform_hf_predictions_to_custom_format: Unexpected error transforming prediction: {pred}. Error: {e}", exc_info=True)
             
-    return custom_results
\ No newline at end of file
+    return custom_results
+
+# --- NUMPY NMS ENGINE ---
+# Engine vektor untuk NMS: box dipadatkan ke array kontigu, IoU dihitung per kelas dalam satu batch.
+
+NMS_METHODS = ("hard", "linear", "gaussian")
+
+# Di atas jumlah box ini per kelas, matriks IoU N x N terlalu besar (10k box = 800MB float64),
+# sehingga IoU dihitung per baris secara vektor.
+NMS_IOU_MATRIX_MAX_BOXES = 2048
+
+# Untuk input sangat kecil overhead NumPy lebih besar dari loop Python (lihat benchmarks/bench_nms.py)
+NMS_VECTORIZE_MIN_BOXES = 32
+
+
+def _pack_detections(detections):
+    """
+    Packs detection dicts into contiguous NumPy arrays.
+
+    Args:
+        detections (list): Detection dictionaries in the custom format.
+
+    Returns:
+        tuple: (boxes, scores, labels) where boxes is a float64 array of shape (N, 4)
+               holding [x1, y1, x2, y2], scores is a float64 array of shape (N,), and
+               labels is an int64 array of shape (N,) with one id per distinct objectName.
+    """
+    count = len(detections)
+    boxes = np.empty((count, 4), dtype=np.float64)
+    scores = np.empty(count, dtype=np.float64)
+    labels = np.empty(count, dtype=np.int64)
+    label_ids = {}
+
+    for i, det in enumerate(detections):
+        box = det['boundingBox']
+        x, y = box['x'], box['y']
+        boxes[i, 0] = x
+        boxes[i, 1] = y
+        boxes[i, 2] = x + box['width']
+        boxes[i, 3] = y + box['height']
+        scores[i] = det.get('confidence', 0)
+        labels[i] = label_ids.setdefault(det.get('objectName'), len(label_ids))
+
+    return boxes, scores, labels
+
+def _iou_one_to_many(box, boxes):
+    """
+    Calculates IoU between one [x1, y1, x2, y2] box and an (N, 4) array of boxes.
+
+    Returns:
+        numpy.ndarray: IoU scores of shape (N,). Pairs with a zero union score 0.0,
+                       matching calculate_iou.
+    """
+    inter_w = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    inter_h = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter_area = inter_w * inter_h
+
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union_area = area + areas - inter_area
+
+    return np.divide(inter_area, union_area, out=np.zeros_like(inter_area), where=union_area != 0)
+
+def _iou_matrix(boxes):
+    """
+    Calculates the full (N, N) IoU matrix for an (N, 4) array of [x1, y1, x2, y2] boxes.
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    inter_w = np.clip(np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]), 0, None)
+    inter_h = np.clip(np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]), 0, None)
+    inter_area = inter_w * inter_h
+
+    areas = (x2 - x1) * (y2 - y1)
+    union_area = areas[:, None] + areas[None, :] - inter_area
+
+    return np.divide(inter_area, union_area, out=np.zeros_like(inter_area), where=union_area != 0)
+
+def _hard_nms_indices(boxes, iou_threshold):
+    """
+    Greedy hard NMS over boxes already sorted by descending score.
+
+    Returns:
+        list: Indices (into boxes) of the kept boxes, in input order.
+    """
+    count = len(boxes)
+    suppressed = np.zeros(count, dtype=bool)
+    iou = _iou_matrix(boxes) if count <= NMS_IOU_MATRIX_MAX_BOXES else None
+    keep = []
+
+    for i in range(count):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        if i + 1 == count:
+            break
+        row = iou[i, i + 1:] if iou is not None else _iou_one_to_many(boxes[i], boxes[i + 1:])
+        suppressed[i + 1:] |= row >= iou_threshold
+
+    return keep
+
+def _soft_nms_scores(boxes, scores, iou_threshold, score_threshold, method, sigma):
+    """
+    Soft-NMS (Bodla et al., 2017): instead of discarding overlapping boxes, their
+    scores are decayed, linearly by (1 - IoU) for IoU >= iou_threshold or with a
+    gaussian penalty exp(-IoU^2 / sigma). Boxes that decay below score_threshold
+    are dropped.
+
+    Returns:
+        tuple: (indices, decayed_scores) of the kept boxes, in selection order.
+    """
+    scores = scores.copy()
+    remaining = np.arange(len(boxes))
+    keep = []
+    kept_scores = []
+
+    while remaining.size:
+        best = int(np.argmax(scores[remaining]))
+        current = remaining[best]
+        keep.append(int(current))
+        kept_scores.append(float(scores[current]))
+        remaining = np.delete(remaining, best)
+        if not remaining.size:
+            break
+
+        iou = _iou_one_to_many(boxes[current], boxes[remaining])
+        if method == "linear":
+            decay = np.where(iou >= iou_threshold, 1.0 - iou, 1.0)
+        else:
+            decay = np.exp(-(iou * iou) / sigma)
+        scores[remaining] *= decay
+        remaining = remaining[scores[remaining] >= score_threshold]
+
+    return keep, kept_scores
+
+def apply_nms_vectorized(detections, iou_threshold=0.5, score_threshold=0.5, method="hard",
+                         sigma=0.5, class_agnostic=False):
+    """
+    NumPy-backed Non-Maximum Suppression with the same input and output format as apply_nms.
+
+    With method="hard" and class_agnostic=False the result is identical to apply_nms.
+
+    Args:
+        detections (list): A list of detection dictionaries. Each dictionary
+                           should have "confidence", "objectName", and "boundingBox".
+        iou_threshold (float): The IoU threshold for suppressing (hard) or decaying (linear) overlapping boxes.
+        score_threshold (float): The minimum confidence score for a detection to be considered.
+                                 For Soft-NMS it is also the score below which decayed boxes are dropped.
+        method (str): "hard", "linear" (Soft-NMS) or "gaussian" (Soft-NMS).
+        sigma (float): Gaussian Soft-NMS penalty parameter.
+        class_agnostic (bool): If True, boxes suppress each other regardless of objectName.
+
+    Returns:
+        list: A list of filtered detections after applying NMS, sorted by confidence (highest first).
+              Soft-NMS returns copies of the detections with their decayed confidence.
+    """
+    if method not in NMS_METHODS:
+        raise ValueError(f"Unknown NMS method '{method}'. Expected one of: {', '.join(NMS_METHODS)}")
+
+    candidates = [d for d in detections if d.get('confidence', 0) >= score_threshold and 'boundingBox' in d]
+    # Deteksi tanpa boundingBox tidak pernah disuppress oleh apply_nms, jadi dipertahankan apa adanya
+    passthrough = [d for d in detections if d.get('confidence', 0) >= score_threshold and 'boundingBox' not in d]
+    if not candidates:
+        passthrough.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+        return passthrough
+
+    candidates.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+    boxes, scores, labels = _pack_detections(candidates)
+    if class_agnostic:
+        labels = np.zeros_like(labels)
+
+    if method == "hard":
+        kept = []
+        for label in np.unique(labels):
+            class_indices = np.flatnonzero(labels == label)
+            kept.extend(class_indices[_hard_nms_indices(boxes[class_indices], iou_threshold)])
+        kept.sort()
+        results = [candidates[i] for i in kept]
+    else:
+        results = []
+        for label in np.unique(labels):
+            class_indices = np.flatnonzero(labels == label)
+            keep, kept_scores = _soft_nms_scores(
+                boxes[class_indices], scores[class_indices], iou_threshold, score_threshold, method, sigma
+            )
+            for i, score in zip(keep, kept_scores):
+                detection = dict(candidates[class_indices[i]])
+                detection['confidence'] = score
+                results.append(detection)
+
+    if passthrough:
+        results.extend(passthrough)
+    results.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+    return results
+
+def run_nms(detections, iou_threshold=0.5, score_threshold=0.5, engine="numpy", method="hard",
+            sigma=0.5, class_agnostic=False):
+    """
+    Dispatches NMS to the configured engine.
+
+    The "python" engine (apply_nms) only implements class-aware hard NMS; any other
+    combination always runs on the NumPy engine. Class-aware hard NMS on fewer than
+    NMS_VECTORIZE_MIN_BOXES detections also uses apply_nms, since the result is identical.
+
+    Returns:
+        list: A list of filtered detections after applying NMS.
+    """
+    if method == "hard" and not class_agnostic and (engine == "python" or len(detections) < NMS_VECTORIZE_MIN_BOXES):
+        return apply_nms(detections, iou_threshold=iou_threshold, score_threshold=score_threshold)
+    if engine not in ("python", "numpy"):
+        logging.warning(f"run_nms: Unknown NMS engine '{engine}', falling back to 'numpy'.")
+    return apply_nms_vectorized(
+        detections,
+        iou_threshold=iou_threshold,
+        score_threshold=score_threshold,
+        method=method,
+        sigma=sigma,
+        class_agnostic=class_agnostic,
+    )
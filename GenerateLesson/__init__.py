@@ -1,13 +1,20 @@
 import logging
 import os
 import json
+import time
 import azure.functions as func
+from concurrent.futures import ThreadPoolExecutor
 
-# Import SDK untuk Azure OpenAI
-from openai import AzureOpenAI # Pastikan versi openai >= 1.0.0
-from azure.ai.contentsafety.models import AnalyzeTextOptions, TextCategory # Import untuk Content Safety
-from azure.ai.contentsafety import ContentSafetyClient # Import untuk Content Safety
-from azure.core.credentials import AzureKeyCredential # Import untuk Content Safety
+from . import cache
+from . import similarity
+from . import streaming
+from shared_code import audio_prewarm # Antrean prewarm audio TTS untuk kosakata/frasa pelajaran baru
+from shared_code import clients # Registry client bersama (AzureOpenAI dengan connection pool)
+from shared_code import content_safety # Gateway Content Safety bersama (client tunggal + cache verdict)
+from shared_code import lexicon_filter # Pra-filter lexicon lokal (id/en/es) sebelum panggilan Content Safety
+from shared_code import llm_json # Parser JSON keluaran model (fence/prosa, perbaikan output terpotong)
+from shared_code import metrics
+from shared_code import singleflight # Menggabungkan request identik yang sedang berjalan ke satu panggilan upstream
 
 # Helper untuk mapping bahasa (bisa diperluas)
 LANGUAGE_FULL_NAMES = {
@@ -17,113 +24,70 @@ LANGUAGE_FULL_NAMES = {
     # Tambahkan bahasa lain jika perlu
 }
 
+# Kode bahasa pelajaran -> languageCode GetTTSAudio (voice default), untuk prewarm audio kosakata/frasa
+TTS_LANGUAGE_CODES = {
+    "en": "en-US",
+    "id": "id-ID",
+}
+
 DEFAULT_PROFICIENCY = "intermediate"
-CONTENT_SAFETY_TEXT_THRESHOLD = 1 # Threshold untuk content safety text analysis
-
-# Inisialisasi Content Safety Client di luar fungsi main agar bisa di-reuse
-# atau Anda bisa membuatnya sebagai singleton/dependency injection jika menggunakan framework
-content_safety_client = None
-try:
-    CONTENT_SAFETY_ENDPOINT = os.environ.get("CONTENT_SAFETY_ENDPOINT")
-    CONTENT_SAFETY_KEY = os.environ.get("CONTENT_SAFETY_KEY")
-    if CONTENT_SAFETY_ENDPOINT and CONTENT_SAFETY_KEY:
-        content_safety_client = ContentSafetyClient(CONTENT_SAFETY_ENDPOINT, AzureKeyCredential(CONTENT_SAFETY_KEY))
-        logging.info("ContentSafetyClient initialized successfully.")
-    else:
-        logging.warning("Content Safety Endpoint or Key is not configured. Text safety checks will be skipped.")
-except Exception as cs_init_err:
-    logging.error(f"Error initializing ContentSafetyClient: {cs_init_err}", exc_info=True)
-    content_safety_client = None
 
+LESSON_MAX_TOKENS = 1500 # Mungkin perlu lebih besar untuk konten yang kaya
+LESSON_TEMPERATURE = 0.5 # Cukup seimbang antara kreativitas dan keteraturan
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request for GenerateSituationalLesson.')
+# Cache pelajaran: skenario populer ("at the airport", "ordering food") diminta berulang kali
+# dengan pasangan bahasa & level yang sama. Hanya pelajaran yang lolos safety output yang disimpan.
+LESSON_CACHE_ENABLED = os.environ.get("LESSON_CACHE_ENABLED", "true").lower() == "true"
+LESSON_CACHE_MAX_ENTRIES = int(os.environ.get("LESSON_CACHE_MAX_ENTRIES", 1024))
+LESSON_CACHE_FRESH_SECONDS = int(os.environ.get("LESSON_CACHE_FRESH_SECONDS", 24 * 3600))
+LESSON_CACHE_STALE_SECONDS = int(os.environ.get("LESSON_CACHE_STALE_SECONDS", 7 * 24 * 3600)) # Masih disajikan, sambil di-refresh di background
+LESSON_CACHE_SQLITE_PATH = os.environ.get("LESSON_CACHE_SQLITE_PATH") # Opsional, mis. /tmp/bisbi/lesson_cache.sqlite3
+LESSON_REFRESH_WORKERS = int(os.environ.get("LESSON_REFRESH_WORKERS", 2))
 
-    try:
-        # 1. Ambil konfigurasi Azure OpenAI dari environment variables
-        openai_endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
-        openai_key = os.environ.get("AZURE_OPENAI_KEY")
-        openai_deployment_name = os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME") # Nama deployment gpt-4.1 Anda
-
-        if not all([openai_endpoint, openai_key, openai_deployment_name]):
-            logging.error("Konfigurasi Azure OpenAI tidak lengkap.")
-            return func.HttpResponse(
-                json.dumps({"error": "Server configuration missing for OpenAI."}), 
-                mimetype="application/json", status_code=500
-            )
-
-        # 2. Dapatkan input JSON dari request body
-        try:
-            req_body = req.get_json()
-        except ValueError:
-            logging.warning("Request body bukan JSON yang valid.")
-            return func.HttpResponse(
-                json.dumps({"error": "Harap kirim request body dalam format JSON."}), 
-                mimetype="application/json", status_code=400
-            )
-
-        scenario_description = req_body.get('scenarioDescription')
-        native_lang_code = req_body.get('userNativeLanguageCode', 'id') # Default ke Indonesia
-        learning_lang_code = req_body.get('learningLanguageCode', 'en') # Default ke Inggris
-        proficiency_level = req_body.get('userProficiencyLevel', DEFAULT_PROFICIENCY).lower()
-
-        if not scenario_description:
-            logging.warning("Parameter 'scenarioDescription' tidak ada di request body.")
-            return func.HttpResponse(
-                json.dumps({"error": "Harap sertakan 'scenarioDescription' dalam request body JSON."}),
-                mimetype="application/json", status_code=400
-            )
-
-        # Content Safety Check untuk Input scenarioDescription
-        if content_safety_client and scenario_description:
-            try:
-                logging.info(f"Performing content safety analysis on scenarioDescription: '{scenario_description[:100]}...'")
-                analyze_text_request = AnalyzeTextOptions(
-                    text=scenario_description,
-                    categories=[TextCategory.SEXUAL, TextCategory.VIOLENCE, TextCategory.HATE, TextCategory.SELF_HARM]
-                )
-                response_text_safety = content_safety_client.analyze_text(analyze_text_request)
-
-                blocked_input_categories = []
-                if response_text_safety and hasattr(response_text_safety, 'categories_analysis'):
-                    for category_result in response_text_safety.categories_analysis:
-                        if category_result.severity >= CONTENT_SAFETY_TEXT_THRESHOLD:
-                            blocked_input_categories.append(f"{category_result.category.value if hasattr(category_result.category, 'value') else category_result.category} (Score: {category_result.severity})")
-                
-                if blocked_input_categories:
-                    logging.warning(f"Input scenarioDescription blocked by Content Safety. Categories: {', '.join(blocked_input_categories)}")
-                    return func.HttpResponse(
-                        json.dumps({"error": "Input scenario description contains inappropriate content.", "details": f"Blocked categories: {', '.join(blocked_input_categories)}"}),
-                        mimetype="application/json",
-                        status_code=400
-                    )
-                logging.info("Input scenarioDescription passed content safety check.")
-            except Exception as text_safety_err:
-                logging.error(f"Error during text content safety analysis for input: {text_safety_err}", exc_info=True)
-                # Jika safety check gagal, putuskan apakah akan melanjutkan atau mengembalikan error
-                # Untuk keamanan, lebih baik kembalikan error
-                return func.HttpResponse(
-                    json.dumps({"error": "Failed to verify safety of input scenario description."}),
-                    mimetype="application/json",
-                    status_code=500 
-                )
+# Index near-duplicate atas skenario yang sudah di-cache: "ordering food at a restaurant" dan "ordering food
+# in a restaurant" memakai pelajaran yang sama, "... to the hotel" dan "... to the hospital" tidak (lebih dari
+# LESSON_SIMILARITY_MAX_EDITS huruf berbeda). Hanya di memori per worker.
+LESSON_SIMILARITY_ENABLED = os.environ.get("LESSON_SIMILARITY_ENABLED", "true").lower() == "true"
+LESSON_SIMILARITY_THRESHOLD = float(os.environ.get("LESSON_SIMILARITY_THRESHOLD", 0.8)) # Cosine similarity minimum (char n-gram)
+LESSON_SIMILARITY_MAX_EDITS = int(os.environ.get("LESSON_SIMILARITY_MAX_EDITS", 2)) # Jumlah huruf maksimum yang boleh berbeda (typo)
+LESSON_SIMILARITY_MAX_ENTRIES = int(os.environ.get("LESSON_SIMILARITY_MAX_ENTRIES", 100000))
 
-        learning_lang_name = LANGUAGE_FULL_NAMES.get(learning_lang_code, "English")
-        native_lang_name = LANGUAGE_FULL_NAMES.get(native_lang_code, "Indonesian")
+# Satu kelas yang meminta skenario yang sama bersamaan: hanya satu panggilan OpenAI (+ safety output) yang berjalan,
+# request lain menunggu hasilnya. Waiter menyerah setelah LESSON_SINGLEFLIGHT_WAIT_SECONDS (504).
+LESSON_SINGLEFLIGHT_ENABLED = os.environ.get("LESSON_SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+LESSON_SINGLEFLIGHT_WAIT_SECONDS = float(os.environ.get("LESSON_SINGLEFLIGHT_WAIT_SECONDS", 120))
 
-        # 3. Inisialisasi klien Azure OpenAI
-        client = AzureOpenAI(
-            azure_endpoint=openai_endpoint,
-            api_key=openai_key,
-            api_version="2024-02-01" # Sesuaikan dengan versi API yang Anda gunakan
-        )
+lesson_refresh_executor = ThreadPoolExecutor(max_workers=LESSON_REFRESH_WORKERS, thread_name_prefix="lesson-refresh")
+
+lesson_cache = cache.LessonCache(
+    "generate_lesson.lesson_cache",
+    max_entries=LESSON_CACHE_MAX_ENTRIES,
+    fresh_seconds=LESSON_CACHE_FRESH_SECONDS,
+    stale_seconds=LESSON_CACHE_STALE_SECONDS,
+    executor=lesson_refresh_executor,
+    sqlite_path=LESSON_CACHE_SQLITE_PATH
+)
+
+scenario_index = similarity.ScenarioIndex(max_entries=LESSON_SIMILARITY_MAX_ENTRIES, max_edits=LESSON_SIMILARITY_MAX_EDITS)
+
+lesson_flights = singleflight.SingleFlight("generate_lesson.singleflight", wait_timeout=LESSON_SINGLEFLIGHT_WAIT_SECONDS)
 
-        # 4. Susun Prompt untuk Azure OpenAI (Model Teks)
-        # Ini adalah bagian yang paling membutuhkan iterasi (prompt engineering)
-        
-        # Definisikan skema JSON yang kita inginkan dalam prompt
-        # (Menyederhanakan: menghilangkan exampleDialogue untuk MVP awal, fokus pada vocab, phrases, grammar)
-        json_schema_instruction = f"""
+
+def _json_response(payload, status_code):
+    return func.HttpResponse(json.dumps(payload), mimetype="application/json", status_code=status_code)
+
+def _build_messages(scenario_description, learning_lang_code, native_lang_code, proficiency_level):
+    """
+    Builds the chat completion messages for a situational lesson.
+    """
+    learning_lang_name = LANGUAGE_FULL_NAMES.get(learning_lang_code, "English")
+    native_lang_name = LANGUAGE_FULL_NAMES.get(native_lang_code, "Indonesian")
+
+    # Ini adalah bagian yang paling membutuhkan iterasi (prompt engineering)
+    
+    # Definisikan skema JSON yang kita inginkan dalam prompt
+    # (Menyederhanakan: menghilangkan exampleDialogue untuk MVP awal, fokus pada vocab, phrases, grammar)
+    json_schema_instruction = f"""
 Respond ONLY with a single, valid JSON object matching this exact schema. Do not add any text before or after the JSON object.
 The JSON object should contain:
 1.  "scenarioTitle": an object with two keys, "{learning_lang_code}" and "{native_lang_code}", containing a concise and relevant title for the learning scenario in both languages.
@@ -136,7 +100,7 @@ Example of a key phrase item: {{ "phrase": {{ "{learning_lang_code}": "Where is
 Example of a grammar tip item: {{ "tip": {{ "{learning_lang_code}": "Use 'the' for specific nouns.", "{native_lang_code}": "Gunakan 'the' untuk kata benda spesifik." }}, "example": {{ "{learning_lang_code}": "The airport is big.", "{native_lang_code}": "Bandara itu besar." }} }}
 """
 
-        system_message_content = f"""
+    system_message_content = f"""
 You are an expert AI language tutor creating personalized learning content. 
 The user wants to learn {learning_lang_name} (target language, code: '{learning_lang_code}'). 
 Their native language is {native_lang_name} (source language, code: '{native_lang_code}').
@@ -146,138 +110,396 @@ Ensure all generated content is strictly appropriate for young children, avoidin
 The content should be positive, educational, and encouraging.
 {json_schema_instruction}
 """
-        
-        user_message_content = f'Generate learning material for the following scenario: "{scenario_description}"'
+    
+    user_message_content = f'Generate learning material for the following scenario: "{scenario_description}"'
 
-        messages_payload = [
-            {"role": "system", "content": system_message_content},
-            {"role": "user", "content": user_message_content}
-        ]
+    messages_payload = [
+        {"role": "system", "content": system_message_content},
+        {"role": "user", "content": user_message_content}
+    ]
+    return messages_payload
 
-        # 5. Panggil Azure OpenAI
-        logging.info(f"Memanggil Azure OpenAI deployment '{openai_deployment_name}' untuk pelajaran situasional...")
-        try:
-            response = client.chat.completions.create(
-                model=openai_deployment_name, 
-                messages=messages_payload,
-                max_tokens=1500, # Mungkin perlu lebih besar untuk konten yang kaya
-                temperature=0.5, # Cukup seimbang antara kreativitas dan keteraturan
-                # response_format={ "type": "json_object" } # Coba ini jika model mendukung, bisa meningkatkan keandalan JSON
-            )
-        except Exception as e_openai:
-            logging.error(f"Error calling Azure OpenAI: {str(e_openai)}")
-            import traceback
-            logging.error(traceback.format_exc())
-            return func.HttpResponse(
-                json.dumps({"error": "Error communicating with AI model."}), 
-                mimetype="application/json", status_code=500
-            )
-
-        # 6. Proses respons dari Azure OpenAI
-        if response.choices and len(response.choices) > 0:
-            assistant_message = response.choices[0].message # Access the first choice's message
-            if assistant_message and assistant_message.content:
-                try:
-                    json_output_str = assistant_message.content.strip()
-                    # Hapus ```json ... ``` jika model menambahkannya
-                    if json_output_str.startswith("```json"):
-                        json_output_str = json_output_str[7:]
-                    elif json_output_str.startswith("```"): # Gunakan elif jika ```json tidak ada
-                        json_output_str = json_output_str[3:]
-                    if json_output_str.endswith("```"):
-                        json_output_str = json_output_str[:-3]
-                    
-                    parsed_json = json.loads(json_output_str.strip()) # Penting
-                    logging.info("Respon JSON dari OpenAI berhasil di-parse untuk pelajaran situasional.")
-
-                    # Content Safety Check untuk Output dari Azure OpenAI
-                    if content_safety_client:
-                        try:
-                            texts_to_check = []
-                            # Kumpulkan semua string dari output JSON
-                            if "scenarioTitle" in parsed_json and isinstance(parsed_json["scenarioTitle"], dict):
-                                texts_to_check.extend(str(v) for v in parsed_json["scenarioTitle"].values() if isinstance(v, (str, int, float)))
-                            if "vocabulary" in parsed_json and isinstance(parsed_json["vocabulary"], list):
-                                for item in parsed_json["vocabulary"]:
-                                    if isinstance(item, dict) and "term" in item and isinstance(item["term"], dict):
-                                        texts_to_check.extend(str(v) for v in item["term"].values() if isinstance(v, (str, int, float)))
-                            if "keyPhrases" in parsed_json and isinstance(parsed_json["keyPhrases"], list):
-                                for item in parsed_json["keyPhrases"]:
-                                    if isinstance(item, dict) and "phrase" in item and isinstance(item["phrase"], dict):
-                                        texts_to_check.extend(str(v) for v in item["phrase"].values() if isinstance(v, (str, int, float)))
-                            if "grammarTips" in parsed_json and isinstance(parsed_json["grammarTips"], list):
-                                for item in parsed_json["grammarTips"]:
-                                    if isinstance(item, dict):
-                                        if "tip" in item and isinstance(item["tip"], dict):
-                                            texts_to_check.extend(str(v) for v in item["tip"].values() if isinstance(v, (str, int, float)))
-                                        if "example" in item and isinstance(item["example"], dict):
-                                            texts_to_check.extend(str(v) for v in item["example"].values() if isinstance(v, (str, int, float)))
-                            
-                            combined_text_output = " . ".join(filter(None, texts_to_check))
-
-                            if combined_text_output:
-                                logging.info(f"Performing content safety analysis on generated lesson output (length: {len(combined_text_output)})...")
-                                analyze_output_request = AnalyzeTextOptions(
-                                    text=combined_text_output,
-                                    categories=[TextCategory.SEXUAL, TextCategory.VIOLENCE, TextCategory.HATE, TextCategory.SELF_HARM]
-                                )
-                                response_output_safety = content_safety_client.analyze_text(analyze_output_request)
-                                
-                                blocked_output_categories = []
-                                if response_output_safety and hasattr(response_output_safety, 'categories_analysis'):
-                                    for category_result in response_output_safety.categories_analysis:
-                                        if category_result.severity >= CONTENT_SAFETY_TEXT_THRESHOLD:
-                                            blocked_output_categories.append(f"{category_result.category.value if hasattr(category_result.category, 'value') else category_result.category} (Score: {category_result.severity})")
-
-                                if blocked_output_categories:
-                                    logging.warning(f"Generated lesson content blocked by Content Safety. Categories: {', '.join(blocked_output_categories)}")
-                                    logging.warning(f"Blocked content (first 500 chars): {combined_text_output[:500]}")
-                                    return func.HttpResponse(
-                                        json.dumps({"error": "Generated lesson content was found to be inappropriate and has been blocked."}),
-                                        mimetype="application/json",
-                                        status_code=500 
-                                    )
-                                logging.info("Generated lesson content passed content safety check.")
-                        except Exception as output_safety_err:
-                            logging.error(f"Error during content safety analysis for generated output: {output_safety_err}", exc_info=True)
-                            # Jika safety check gagal, lebih baik blokir output
-                            return func.HttpResponse(
-                                json.dumps({"error": "Failed to verify safety of generated content."}),
-                                mimetype="application/json",
-                                status_code=500
-                            )
-                    
-                    # Jika lolos, kembalikan parsed_json
-                    return func.HttpResponse(
-                        body=json.dumps(parsed_json),
-                        mimetype="application/json",
-                        status_code=200
-                    )
-                except json.JSONDecodeError as json_err:
-                    logging.error(f"Gagal mem-parse JSON dari respons OpenAI: {json_err}")
-                    logging.error(f"Respons mentah dari OpenAI: {assistant_message.content}")
-                    return func.HttpResponse(
-                        json.dumps({"error": "AI model returned non-JSON content or malformed JSON."}),
-                        mimetype="application/json", status_code=500
-                    )
-            else:
-                logging.warning("Respons OpenAI untuk pelajaran situasional tidak memiliki konten.")
-                return func.HttpResponse(
-                    json.dumps({"error": "AI model returned no content."}),
-                    mimetype="application/json", status_code=500
+def _collect_output_texts(parsed_json):
+    """
+    Collects every generated string in a lesson for the output safety check.
+    """
+    texts_to_check = []
+    # Kumpulkan semua string dari output JSON
+    if "scenarioTitle" in parsed_json and isinstance(parsed_json["scenarioTitle"], dict):
+        texts_to_check.extend(str(v) for v in parsed_json["scenarioTitle"].values() if isinstance(v, (str, int, float)))
+    if "vocabulary" in parsed_json and isinstance(parsed_json["vocabulary"], list):
+        for item in parsed_json["vocabulary"]:
+            if isinstance(item, dict) and "term" in item and isinstance(item["term"], dict):
+                texts_to_check.extend(str(v) for v in item["term"].values() if isinstance(v, (str, int, float)))
+    if "keyPhrases" in parsed_json and isinstance(parsed_json["keyPhrases"], list):
+        for item in parsed_json["keyPhrases"]:
+            if isinstance(item, dict) and "phrase" in item and isinstance(item["phrase"], dict):
+                texts_to_check.extend(str(v) for v in item["phrase"].values() if isinstance(v, (str, int, float)))
+    if "grammarTips" in parsed_json and isinstance(parsed_json["grammarTips"], list):
+        for item in parsed_json["grammarTips"]:
+            if isinstance(item, dict):
+                if "tip" in item and isinstance(item["tip"], dict):
+                    texts_to_check.extend(str(v) for v in item["tip"].values() if isinstance(v, (str, int, float)))
+                if "example" in item and isinstance(item["example"], dict):
+                    texts_to_check.extend(str(v) for v in item["example"].values() if isinstance(v, (str, int, float)))
+    return texts_to_check
+
+def _prewarm_lesson_audio(lesson, learning_lang_code):
+    """
+    Enqueues the learning-language vocabulary terms and key phrases of a verified lesson, so
+    their TTS audio is synthesized before the client asks for it.
+    """
+    tts_language_code = TTS_LANGUAGE_CODES.get(learning_lang_code)
+    if tts_language_code is None or not isinstance(lesson, dict):
+        return
+    texts = []
+    for section, field in (("vocabulary", "term"), ("keyPhrases", "phrase")):
+        items = lesson.get(section)
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            value = item.get(field) if isinstance(item, dict) else None
+            if isinstance(value, dict) and isinstance(value.get(learning_lang_code), str):
+                texts.append(value[learning_lang_code])
+    try:
+        audio_prewarm.enqueue(texts, tts_language_code)
+    except Exception as prewarm_err: # Prewarm hanya optimasi, jangan gagalkan pelajaran
+        logging.warning(f"Failed to enqueue lesson audio prewarm: {prewarm_err}")
+
+def lesson_schema(learning_lang_code, native_lang_code):
+    """
+    Expected lesson structure (see _build_messages), used to check salvaged truncated output.
+    """
+    bilingual = {learning_lang_code: str, native_lang_code: str}
+    return {
+        "scenarioTitle": bilingual,
+        "vocabulary": [{"term": bilingual}],
+        "keyPhrases": [{"phrase": bilingual}],
+        "grammarTips": [{"tip": bilingual, "example": bilingual}],
+    }
+
+def generate_lesson(client, deployment_name, messages_payload, schema=None):
+    """
+    Calls Azure OpenAI, parses the lesson JSON and runs the output safety check.
+
+    If the completion was truncated, the complete sections/items are salvaged when they
+    still match schema, instead of failing the request.
+
+    Returns:
+        tuple: (status_code, payload, verified). payload is the lesson on success or an
+               error dict otherwise; verified is True only if the lesson is complete and
+               passed the output Content Safety check (and may therefore be cached).
+    """
+    # 5. Panggil Azure OpenAI
+    logging.info(f"Memanggil Azure OpenAI deployment '{deployment_name}' untuk pelajaran situasional...")
+    try:
+        response = client.chat.completions.create(
+            model=deployment_name, 
+            messages=messages_payload,
+            max_tokens=LESSON_MAX_TOKENS,
+            temperature=LESSON_TEMPERATURE,
+            # response_format={ "type": "json_object" } # Coba ini jika model mendukung, bisa meningkatkan keandalan JSON
+        )
+    except Exception as e_openai:
+        logging.error(f"Error calling Azure OpenAI: {str(e_openai)}", exc_info=True)
+        return 500, {"error": "Error communicating with AI model."}, False
+
+    # 6. Proses respons dari Azure OpenAI
+    if not response.choices:
+        logging.warning("Respons OpenAI untuk pelajaran situasional tidak memiliki choices.")
+        return 500, {"error": "AI model returned no choices."}, False
+
+    assistant_message = response.choices[0].message # Access the first choice's message
+    if not (assistant_message and assistant_message.content):
+        logging.warning("Respons OpenAI untuk pelajaran situasional tidak memiliki konten.")
+        return 500, {"error": "AI model returned no content."}, False
+
+    try:
+        parse_result = llm_json.parse(assistant_message.content, schema, name="generate_lesson.llm_json")
+    except llm_json.LLMJSONError as json_err:
+        logging.error(f"Gagal mem-parse JSON dari respons OpenAI (finish_reason={response.choices[0].finish_reason}): {json_err}")
+        logging.error(f"Respons mentah dari OpenAI: {assistant_message.content}")
+        return 500, {"error": "AI model returned non-JSON content or malformed JSON."}, False
+    parsed_json = parse_result.value
+    if parse_result.repaired:
+        logging.warning(f"Respons OpenAI terpotong (finish_reason={response.choices[0].finish_reason}); bagian yang lengkap dipakai tanpa generate ulang.")
+    logging.info("Respon JSON dari OpenAI berhasil di-parse untuk pelajaran situasional.")
+
+    # Content Safety Check untuk Output dari Azure OpenAI
+    if not content_safety.is_configured():
+        return 200, parsed_json, False
+
+    try:
+        texts_to_check = _collect_output_texts(parsed_json)
+        if texts_to_check:
+            logging.info(f"Performing content safety analysis on generated lesson output ({len(texts_to_check)} strings, {sum(len(t) for t in texts_to_check)} chars)...")
+            # Dipecah per chunk seukuran batas layanan dan dianalisis paralel; string yang sudah terverifikasi dilewati
+            output_verdict = content_safety.analyze_texts(texts_to_check)
+
+            if output_verdict.blocked:
+                logging.warning(f"Generated lesson content blocked by Content Safety. Categories: {', '.join(output_verdict.blocked_categories)}")
+                logging.warning(f"Blocked content (first 500 chars): {' . '.join(texts_to_check)[:500]}")
+                return 500, {"error": "Generated lesson content was found to be inappropriate and has been blocked."}, False
+            logging.info("Generated lesson content passed content safety check.")
+    except Exception as output_safety_err:
+        logging.error(f"Error during content safety analysis for generated output: {output_safety_err}", exc_info=True)
+        # Jika safety check gagal, lebih baik blokir output
+        return 500, {"error": "Failed to verify safety of generated content."}, False
+
+    # Pelajaran hasil perbaikan (terpotong) tetap dikirim, tetapi tidak di-cache
+    return 200, parsed_json, not parse_result.repaired
+
+def _similarity_bucket(learning_lang_code, native_lang_code, proficiency_level, deployment_name):
+    # Hanya skenario dengan pasangan bahasa, level, deployment dan versi prompt yang sama yang boleh saling menggantikan
+    return (cache.LESSON_PROMPT_VERSION, deployment_name or "", learning_lang_code, native_lang_code, proficiency_level)
+
+def _regenerate_cached_lesson(client, deployment_name, messages_payload, schema):
+    status_code, payload, verified = generate_lesson(client, deployment_name, messages_payload, schema)
+    return payload if status_code == 200 and verified else None
+
+
+def _check_section_safety(section, index, value):
+    """
+    Runs the output safety check on one streamed lesson section. Returns an error message, or None if it passed.
+    """
+    texts_to_check = _collect_output_texts({section: [value] if index is not None else value})
+    if not texts_to_check:
+        return None
+    try:
+        section_verdict = content_safety.analyze_texts(texts_to_check)
+    except Exception as section_safety_err:
+        logging.error(f"Error during content safety analysis for streamed section '{section}': {section_safety_err}", exc_info=True)
+        return "Failed to verify safety of generated content."
+    if section_verdict.blocked:
+        logging.warning(f"Streamed lesson section '{section}' blocked by Content Safety. Categories: {', '.join(section_verdict.blocked_categories)}")
+        return "Generated lesson content was found to be inappropriate and has been blocked."
+    return None
+
+def stream_lesson_events(client, deployment_name, messages_payload, event_format, on_verified_lesson=None, schema=None):
+    """
+    Streams the lesson from Azure OpenAI and yields an encoded "section" event for every
+    top-level section (or array item) as soon as it is complete and has passed the output
+    safety check, followed by a "done" event. Failures after the stream started are reported
+    as an "error" event, since the HTTP status has already been sent.
+
+    If the stream ends before the lesson object is complete (e.g. max_tokens), the sections
+    already sent are kept when they match schema and "done" carries "truncated": true.
+
+    on_verified_lesson(lesson) is called once the whole lesson streamed and every section passed
+    Content Safety (not called if Content Safety is not configured or the lesson was truncated).
+    """
+    started_at = time.perf_counter()
+    logging.info(f"Memanggil Azure OpenAI deployment '{deployment_name}' (stream) untuk pelajaran situasional...")
+    try:
+        response = client.chat.completions.create(
+            model=deployment_name,
+            messages=messages_payload,
+            max_tokens=LESSON_MAX_TOKENS,
+            temperature=LESSON_TEMPERATURE,
+            stream=True,
+        )
+    except Exception as e_openai:
+        logging.error(f"Error calling Azure OpenAI (stream): {str(e_openai)}", exc_info=True)
+        yield streaming.encode_event(event_format, "error", {"error": "Error communicating with AI model."})
+        return
+
+    parser = streaming.LessonStreamParser()
+    safety_configured = content_safety.is_configured()
+    section_count = 0
+    try:
+        for chunk in response:
+            if not chunk.choices: # Chunk awal Azure hanya berisi hasil content filter prompt
+                continue
+            delta = chunk.choices[0].delta
+            if not (delta and delta.content):
+                continue
+            for section, index, value in parser.feed(delta.content):
+                if safety_configured:
+                    safety_error = _check_section_safety(section, index, value)
+                    if safety_error:
+                        yield streaming.encode_event(event_format, "error", {"error": safety_error})
+                        return
+                if section_count == 0:
+                    logging.info(f"First lesson section '{section}' ready after {time.perf_counter() - started_at:.2f}s.")
+                section_count += 1
+                yield streaming.encode_event(event_format, "section", {"section": section, "index": index, "data": value})
+            if parser.done:
+                break
+    except json.JSONDecodeError as json_err:
+        logging.error(f"Gagal mem-parse section JSON dari stream OpenAI: {json_err}")
+        yield streaming.encode_event(event_format, "error", {"error": "AI model returned non-JSON content or malformed JSON."})
+        return
+    except Exception as stream_err:
+        logging.error(f"Error while streaming from Azure OpenAI: {stream_err}", exc_info=True)
+        yield streaming.encode_event(event_format, "error", {"error": "Error communicating with AI model."})
+        return
+    finally:
+        response.close() # Hentikan generasi jika stream dihentikan lebih awal
+
+    if not parser.done:
+        schema_errors = llm_json.validate(parser.lesson, schema) if schema is not None else ["$: incomplete"]
+        if schema_errors:
+            metrics.increment("generate_lesson.llm_json.failed")
+            logging.warning(f"Stream OpenAI berakhir sebelum objek JSON pelajaran lengkap: {'; '.join(schema_errors[:5])}")
+            yield streaming.encode_event(event_format, "error", {"error": "AI model returned incomplete JSON."})
+            return
+        metrics.increment("generate_lesson.llm_json.repaired")
+        logging.warning(f"Stream OpenAI terpotong setelah {section_count} section; bagian yang sudah lengkap dipakai.")
+        yield streaming.encode_event(event_format, "done", {"cached": False, "truncated": True})
+        return
+    logging.info(f"Streamed lesson completed in {time.perf_counter() - started_at:.2f}s ({section_count} sections).")
+    if safety_configured and on_verified_lesson is not None:
+        on_verified_lesson(parser.lesson)
+    yield streaming.encode_event(event_format, "done", {"cached": False})
+
+def _cached_lesson_events(lesson, event_format):
+    for section, index, value in streaming.lesson_sections(lesson):
+        yield streaming.encode_event(event_format, "section", {"section": section, "index": index, "data": value})
+    yield streaming.encode_event(event_format, "done", {"cached": True})
+
+def _lesson_result(lesson, event_format):
+    return 200, lesson if event_format is None else _cached_lesson_events(lesson, event_format)
+
+def handle_lesson_request(req_body, event_format=None):
+    """
+    Validates, screens and serves a lesson request (from cache, a similar cached scenario or Azure OpenAI).
+
+    Returns:
+        tuple: (status_code, payload). payload is a JSON-serializable dict, except for successful
+               requests with an event_format (streaming.EVENT_FORMAT_NDJSON / EVENT_FORMAT_SSE),
+               where it is an iterator of encoded stream events.
+    """
+    # 1. Ambil konfigurasi Azure OpenAI dari environment variables
+    openai_endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+    openai_key = os.environ.get("AZURE_OPENAI_KEY")
+    openai_deployment_name = os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME") # Nama deployment gpt-4.1 Anda
+
+    if not all([openai_endpoint, openai_key, openai_deployment_name]):
+        logging.error("Konfigurasi Azure OpenAI tidak lengkap.")
+        return 500, {"error": "Server configuration missing for OpenAI."}
+
+    # 2. Validasi input JSON dari request body
+    scenario_description = req_body.get('scenarioDescription')
+    native_lang_code = req_body.get('userNativeLanguageCode', 'id') # Default ke Indonesia
+    learning_lang_code = req_body.get('learningLanguageCode', 'en') # Default ke Inggris
+    proficiency_level = req_body.get('userProficiencyLevel', DEFAULT_PROFICIENCY).lower()
+
+    if not scenario_description:
+        logging.warning("Parameter 'scenarioDescription' tidak ada di request body.")
+        return 400, {"error": "Harap sertakan 'scenarioDescription' dalam request body JSON."}
+
+    # Pra-filter lokal: pelanggaran yang jelas langsung ditolak tanpa round-trip ke Content Safety
+    lexicon_result = lexicon_filter.prefilter_text(scenario_description)
+    if lexicon_result is not None and lexicon_result.blocked:
+        logging.warning(f"Input scenarioDescription blocked by lexicon pre-filter. Categories: {', '.join(lexicon_result.blocked_categories)}")
+        return 400, {"error": "Input scenario description contains inappropriate content.", "details": lexicon_result.details}
+
+    # 3. Ambil klien Azure OpenAI bersama dan susun prompt
+    client = clients.get_openai_client(openai_endpoint, openai_key, api_version="2024-02-01") # Sesuaikan dengan versi API yang Anda gunakan
+    messages_payload = _build_messages(scenario_description, learning_lang_code, native_lang_code, proficiency_level)
+    schema = lesson_schema(learning_lang_code, native_lang_code)
+
+    # Cache pelajaran. Entri hanya ada untuk skenario (setelah normalisasi) yang sudah lolos safety
+    # input & output, jadi cache hit tidak perlu memanggil Content Safety lagi.
+    cache_key = None
+    use_similarity = LESSON_CACHE_ENABLED and LESSON_SIMILARITY_ENABLED
+    normalized_scenario = cache.normalize_scenario(scenario_description)
+    similarity_bucket = _similarity_bucket(learning_lang_code, native_lang_code, proficiency_level, openai_deployment_name)
+    if LESSON_CACHE_ENABLED:
+        cache_key = cache.lesson_cache_key(
+            normalized_scenario, learning_lang_code, native_lang_code, proficiency_level, openai_deployment_name
+        )
+        cached_lesson, cache_state = lesson_cache.lookup(cache_key)
+        if cached_lesson is not None:
+            logging.info(f"Lesson cache {cache_state} hit for scenario '{scenario_description[:100]}'.")
+            if use_similarity:
+                scenario_index.add(similarity_bucket, normalized_scenario, normalized_scenario) # Menghangatkan index dari tier SQLite
+            if cache_state == "stale":
+                lesson_cache.refresh_in_background(
+                    cache_key, lambda: _regenerate_cached_lesson(client, openai_deployment_name, messages_payload, schema)
                 )
-        else:
-            logging.warning("Respons OpenAI untuk pelajaran situasional tidak memiliki choices.")
-            return func.HttpResponse(
-                json.dumps({"error": "AI model returned no choices."}),
-                mimetype="application/json", status_code=500
-            )
+            return _lesson_result(cached_lesson, event_format)
+
+    # Content Safety Check untuk Input scenarioDescription
+    if content_safety.is_configured() and scenario_description:
+        try:
+            logging.info(f"Performing content safety analysis on scenarioDescription: '{scenario_description[:100]}...'")
+            input_verdict = content_safety.analyze_text(scenario_description)
+
+            if input_verdict.blocked:
+                logging.warning(f"Input scenarioDescription blocked by Content Safety. Categories: {', '.join(input_verdict.blocked_categories)}")
+                return 400, {"error": "Input scenario description contains inappropriate content.", "details": input_verdict.details}
+            logging.info("Input scenarioDescription passed content safety check.")
+        except Exception as text_safety_err:
+            logging.error(f"Error during text content safety analysis for input: {text_safety_err}", exc_info=True)
+            # Jika safety check gagal, putuskan apakah akan melanjutkan atau mengembalikan error
+            # Untuk keamanan, lebih baik kembalikan error
+            return 500, {"error": "Failed to verify safety of input scenario description."}
+
+    # Skenario mirip (setelah input lolos safety): pakai pelajaran yang sudah di-cache untuk skenario terdekat
+    if use_similarity:
+        similar_scenario, similarity_score = scenario_index.lookup(similarity_bucket, normalized_scenario, LESSON_SIMILARITY_THRESHOLD)
+        if similar_scenario is not None:
+            similar_lesson, _ = lesson_cache.lookup(cache.lesson_cache_key(
+                similar_scenario, learning_lang_code, native_lang_code, proficiency_level, openai_deployment_name
+            ))
+            if similar_lesson is not None:
+                metrics.increment("generate_lesson.similarity.hit")
+                logging.info(f"Serving cached lesson of similar scenario '{similar_scenario[:100]}' (similarity {similarity_score:.3f}) for '{scenario_description[:100]}'.")
+                return _lesson_result(similar_lesson, event_format)
+            # Entri cache sudah kedaluwarsa/tergusur; hapus dari index
+            scenario_index.remove(similarity_bucket, similar_scenario)
+        metrics.increment("generate_lesson.similarity.miss")
+
+    def store_verified_lesson(lesson):
+        _prewarm_lesson_audio(lesson, learning_lang_code)
+        if cache_key is not None:
+            lesson_cache.store(cache_key, lesson)
+            if use_similarity:
+                scenario_index.add(similarity_bucket, normalized_scenario, normalized_scenario)
+
+    # Mode streaming: section dikirim segera setelah lengkap dan lolos safety
+    if event_format is not None:
+        return 200, stream_lesson_events(client, openai_deployment_name, messages_payload, event_format, store_verified_lesson, schema)
+
+    # 4-6. Panggil Azure OpenAI, parse JSON dan cek safety output
+    def generate_and_store():
+        status_code, payload, verified = generate_lesson(client, openai_deployment_name, messages_payload, schema)
+        if status_code == 200 and verified:
+            store_verified_lesson(payload)
+        return status_code, payload
+
+    if not LESSON_SINGLEFLIGHT_ENABLED:
+        return generate_and_store()
+    # Kunci = input yang sudah dinormalisasi; error dan blokir safety output ikut dibagikan ke semua waiter
+    flight_key = cache.lesson_cache_key(normalized_scenario, learning_lang_code, native_lang_code, proficiency_level, openai_deployment_name)
+    try:
+        (status_code, payload), shared = lesson_flights.do(flight_key, generate_and_store)
+    except singleflight.SingleFlightTimeout as wait_err:
+        logging.warning(str(wait_err))
+        return 504, {"error": "Timed out waiting for an identical lesson request that is still in progress."}
+    if shared:
+        logging.info(f"Lesson for scenario '{scenario_description[:100]}' shared from a concurrent identical request.")
+    return status_code, payload
+
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request for GenerateSituationalLesson.')
+
+    try:
+        # Dapatkan input JSON dari request body
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            logging.warning("Request body bukan JSON yang valid.")
+            return _json_response({"error": "Harap kirim request body dalam format JSON."}, 400)
+
+        status_code, payload = handle_lesson_request(req_body)
+        # Jika lolos, kembalikan parsed_json
+        return _json_response(payload, status_code)
 
     except Exception as e:
         logging.error(f"Terjadi kesalahan internal di GenerateLesson: {str(e)}")
         import traceback
         logging.error(traceback.format_exc())
-        return func.HttpResponse(
-            json.dumps({"error": "Terjadi kesalahan pada server saat memproses permintaan pelajaran."}),
-            mimetype="application/json", status_code=500
-        )
\ No newline at end of file
+        return _json_response({"error": "Terjadi kesalahan pada server saat memproses permintaan pelajaran."}, 500)
@@ -0,0 +1,104 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+from shared_code import metrics
+from shared_code.ttl_cache import build_tiered_cache
+
+# Naikkan jika prompt atau skema JSON pelajaran berubah, agar entri lama tidak dipakai lagi
+LESSON_PROMPT_VERSION = "1"
+
+_NON_WORD_PATTERN = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_scenario(text):
+    """
+    Folds case, Unicode compatibility forms, punctuation and whitespace so that
+    "At the airport!" and "  at the AIRPORT " map to the same scenario.
+    """
+    folded = unicodedata.normalize("NFKC", text or "").casefold()
+    return _NON_WORD_PATTERN.sub(" ", folded).strip()
+
+def lesson_cache_key(normalized_scenario, learning_lang_code, native_lang_code, proficiency_level, deployment_name):
+    """
+    Builds the lesson cache key from the normalized scenario, language pair, proficiency,
+    model deployment and prompt version.
+    """
+    parts = [LESSON_PROMPT_VERSION, deployment_name or "", learning_lang_code, native_lang_code, proficiency_level, normalized_scenario]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class LessonCache:
+    """
+    Two-tier (memory LRU + optional SQLite) lesson cache with stale-while-revalidate.
+
+    Entries are fresh for fresh_seconds. For a further stale_seconds they are still served,
+    but the first stale hit schedules a background regeneration on `executor` (at most one
+    per key at a time). After that the entry expires from both tiers.
+
+    Only lessons that passed the output safety check may be stored.
+    """
+
+    def __init__(self, name, max_entries, fresh_seconds, stale_seconds, executor, sqlite_path=None):
+        self.name = name
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self.executor = executor
+        self._cache = build_tiered_cache(name, max_entries, fresh_seconds + stale_seconds, sqlite_path)
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+
+    def lookup(self, key):
+        """
+        Returns (lesson, state) where state is "fresh", "stale" or None (miss).
+        """
+        entry = self._cache.get(key)
+        if entry is None:
+            metrics.increment(f"{self.name}.miss")
+            return None, None
+        age = time.time() - entry["created_at"]
+        state = "fresh" if age <= self.fresh_seconds else "stale"
+        metrics.increment(f"{self.name}.{'hit' if state == 'fresh' else 'stale_hit'}")
+        return entry["lesson"], state
+
+    def store(self, key, lesson):
+        self._cache.set(key, {"created_at": time.time(), "lesson": lesson})
+
+    def refresh_in_background(self, key, regenerate):
+        """
+        Schedules regenerate() in the background and stores its result under key.
+
+        regenerate must return a lesson that passed output safety, or None to keep the
+        current (stale) entry. Returns False if a refresh for key is already running.
+        """
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                lesson = regenerate()
+                if lesson is not None:
+                    self.store(key, lesson)
+                    metrics.increment(f"{self.name}.refreshed")
+                else:
+                    metrics.increment(f"{self.name}.refresh_failed")
+            except Exception as refresh_err:
+                metrics.increment(f"{self.name}.refresh_failed")
+                logging.error(f"Background lesson refresh failed: {refresh_err}", exc_info=True)
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        try:
+            self.executor.submit(run)
+        except RuntimeError as submit_err: # Executor sudah shutdown
+            logging.warning(f"Could not schedule background lesson refresh: {submit_err}")
+            with self._refreshing_lock:
+                self._refreshing.discard(key)
+            return False
+        return True
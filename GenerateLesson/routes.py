@@ -1,6 +1,17 @@
+import asyncio
 import azure.functions as func
+import json
 import logging
-from . import main as generate_lesson_main
+from . import main as generate_lesson_main, handle_lesson_request, streaming
+
+# HTTP streaming butuh ekstensi azurefunctions-extensions-http-fastapi (tipe Request/StreamingResponse), yang
+# sengaja tidak ada di requirements.txt: secara default route streaming tersedia tetapi event dikirim sekaligus
+# setelah pelajaran selesai. Tambahkan paket itu ke requirements.txt untuk mengaktifkan streaming.
+try:
+    from azurefunctions.extensions.http.fastapi import Request, Response, StreamingResponse
+    HTTP_STREAMING_AVAILABLE = True
+except ImportError:
+    HTTP_STREAMING_AVAILABLE = False
 
 # Create Blueprint
 bp = func.Blueprint()
@@ -8,4 +19,61 @@ bp = func.Blueprint()
 @bp.route(route="GenerateLesson", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
 def GenerateLesson_handler(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Blueprint: Routing to GenerateLesson")
-    return generate_lesson_main(req)
\ No newline at end of file
+    return generate_lesson_main(req)
+
+
+def _event_format(format_param, accept_header):
+    """
+    Picks the stream event format from ?format=ndjson|sse or the Accept header (default NDJSON).
+    """
+    if format_param:
+        return format_param.lower() if format_param.lower() in streaming.MEDIA_TYPES else None
+    if "text/event-stream" in (accept_header or ""):
+        return streaming.EVENT_FORMAT_SSE
+    return streaming.EVENT_FORMAT_NDJSON
+
+def _prepare_stream(req_body, format_param, accept_header):
+    """
+    Returns (status_code, body, event_format): body is an event iterator on success, otherwise a JSON error string.
+    """
+    event_format = _event_format(format_param, accept_header)
+    if event_format is None:
+        return 400, json.dumps({"error": "Parameter 'format' harus 'ndjson' atau 'sse'."}), None
+    if not isinstance(req_body, dict):
+        return 400, json.dumps({"error": "Harap kirim request body dalam format JSON."}), None
+    try:
+        status_code, payload = handle_lesson_request(req_body, event_format)
+    except Exception as e:
+        logging.error(f"Terjadi kesalahan internal di GenerateLessonStream: {str(e)}", exc_info=True)
+        return 500, json.dumps({"error": "Terjadi kesalahan pada server saat memproses permintaan pelajaran."}), None
+    if status_code != 200:
+        return status_code, json.dumps(payload), None
+    return status_code, payload, event_format
+
+
+if HTTP_STREAMING_AVAILABLE:
+    @bp.route(route="GenerateLessonStream", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
+    async def GenerateLessonStream_handler(req: Request) -> StreamingResponse:
+        logging.info("Blueprint: Routing to GenerateLessonStream (streaming)")
+        try:
+            req_body = await req.json()
+        except ValueError:
+            req_body = None
+        # Filter leksikon, cache/SQLite dan Content Safety input (HTTP) berjalan di thread, bukan di event loop worker
+        status_code, body, event_format = await asyncio.to_thread(_prepare_stream, req_body, req.query_params.get("format"), req.headers.get("accept"))
+        if event_format is None:
+            return Response(content=body, media_type="application/json", status_code=status_code)
+        # Iterator sinkron dijalankan di threadpool oleh StreamingResponse, jadi panggilan OpenAI/Content Safety output tidak memblokir event loop
+        return StreamingResponse(body, media_type=streaming.MEDIA_TYPES[event_format], headers={"Cache-Control": "no-cache"})
+else:
+    @bp.route(route="GenerateLessonStream", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
+    def GenerateLessonStream_handler(req: func.HttpRequest) -> func.HttpResponse:
+        logging.info("Blueprint: Routing to GenerateLessonStream (buffered, HTTP streaming extension not installed)")
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            req_body = None
+        status_code, body, event_format = _prepare_stream(req_body, req.params.get("format"), req.headers.get("accept"))
+        if event_format is None:
+            return func.HttpResponse(body, mimetype="application/json", status_code=status_code)
+        return func.HttpResponse("".join(body), mimetype=streaming.MEDIA_TYPES[event_format], status_code=status_code)
@@ -0,0 +1,203 @@
+import math
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+NGRAM_SIZE = 3
+
+
+def char_ngrams(normalized_text, size=NGRAM_SIZE):
+    """
+    Returns the character n-gram counts of an already normalized scenario (see cache.normalize_scenario),
+    padded with spaces so word starts and ends get their own n-grams.
+    """
+    padded = f" {normalized_text} "
+    return Counter(padded[i:i + size] for i in range(len(padded) - size + 1))
+
+def _sublinear_tf(counts):
+    return {ngram: 1.0 + math.log(count) if count > 1 else 1.0 for ngram, count in counts.items()}
+
+def ngram_similarity(normalized_text, other_normalized_text):
+    """
+    Returns the cosine similarity of the (sublinear tf) character n-gram vectors of two normalized scenarios.
+    """
+    return _cosine(_sublinear_tf(char_ngrams(normalized_text)), _sublinear_tf(char_ngrams(other_normalized_text)))
+
+def _cosine(tf_weights, other_tf_weights):
+    dot = sum(weight * other_tf_weights.get(ngram, 0.0) for ngram, weight in tf_weights.items())
+    norms = math.sqrt(sum(weight * weight for weight in tf_weights.values()) * sum(weight * weight for weight in other_tf_weights.values()))
+    return dot / norms if norms else 0.0
+
+def _common_prefix_length(text, other_text):
+    # Binary search dengan perbandingan slice (di C), bukan loop per karakter
+    low, high = 0, min(len(text), len(other_text))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if text[:middle] == other_text[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def within_edit_distance(text, other_text, max_edits):
+    """
+    Returns True if the Levenshtein distance between text and other_text is at most max_edits.
+    The common prefix is skipped and the first differing character is either substituted,
+    deleted or inserted, so small budgets only explore a few branches.
+    """
+    if abs(len(text) - len(other_text)) > max_edits:
+        return False
+    if text == other_text:
+        return True
+    if max_edits == 0:
+        return False
+    start = _common_prefix_length(text, other_text)
+    rest, other_rest = text[start + 1:], other_text[start + 1:]
+    return (
+        within_edit_distance(rest, other_rest, max_edits - 1)
+        or within_edit_distance(rest, other_text[start:], max_edits - 1)
+        or within_edit_distance(text[start:], other_rest, max_edits - 1)
+    )
+
+def _segment_bounds(length, segments):
+    return [(length * index // segments, length * (index + 1) // segments) for index in range(segments)]
+
+
+class ScenarioIndex:
+    """
+    Index over cached scenarios for serving near-duplicate requests (casing and punctuation
+    are folded by normalize_scenario; typos are within max_edits character edits) without
+    serving a different scenario.
+
+    Documents live in buckets (language pair, proficiency, ...) and only match within their
+    bucket. Each document is split into max_edits + 2 segments that are indexed by exact text
+    and by the document's length. An edit changes at most one segment and shifts the others by
+    at most one position, so a document within max_edits edits of the query shares at least two
+    segments with it, at a shift of at most max_edits, and has a length within max_edits of the
+    query. Lookup therefore only reads the posting lists of those exact segments for the lengths
+    that can still match, so no near-duplicate is missed and the cost does not grow with the
+    number of documents that share common n-grams ("at the station").
+
+    Candidates sharing the most segments are verified with a banded edit distance, and a match
+    also needs a character n-gram cosine (without IDF, so stable as the index grows) of at least
+    the threshold. The edit budget is what keeps a one-word substitution ("... to the hotel" vs
+    "... to the hospital") from matching; words that are themselves within max_edits of each
+    other (hotel/hostel) cannot be told apart from a typo.
+
+    Removed or evicted documents are tombstoned and purged when the index is compacted.
+    """
+
+    def __init__(self, max_entries=100000, max_edits=2, max_candidates=32):
+        self.max_entries = max_entries
+        self.max_edits = max_edits
+        self.max_candidates = max_candidates
+        self.segments = max_edits + 2
+        self._lock = threading.Lock()
+        self._postings = {} # (bucket, panjang teks, indeks segmen, teks segmen) -> array('i') of doc ids
+        self._documents = {} # doc_id -> (bucket, normalized_text, value)
+        self._doc_ids = {} # (bucket, normalized_text) -> doc_id
+        self._next_doc_id = 0
+        self._tombstones = 0
+
+    def __len__(self):
+        return len(self._documents)
+
+    def _segment_keys(self, bucket, normalized_text):
+        length = len(normalized_text)
+        return [
+            (bucket, length, index, normalized_text[start:end])
+            for index, (start, end) in enumerate(_segment_bounds(length, self.segments))
+        ]
+
+    def add(self, bucket, normalized_text, value):
+        """
+        Indexes normalized_text in bucket with an associated value (e.g. a lesson cache key).
+        Re-adding an existing text replaces its value.
+        """
+        if not normalized_text:
+            return
+        with self._lock:
+            existing = self._doc_ids.get((bucket, normalized_text))
+            if existing is not None:
+                self._documents[existing] = (bucket, normalized_text, value)
+                return
+            if len(self._documents) >= self.max_entries:
+                self._remove_doc(next(iter(self._documents))) # FIFO: dokumen tertua
+            doc_id = self._next_doc_id
+            self._next_doc_id += 1
+            self._documents[doc_id] = (bucket, normalized_text, value)
+            self._doc_ids[(bucket, normalized_text)] = doc_id
+            for key in self._segment_keys(bucket, normalized_text):
+                postings = self._postings.get(key)
+                if postings is None:
+                    postings = self._postings[key] = array('i')
+                postings.append(doc_id)
+
+    def remove(self, bucket, normalized_text):
+        with self._lock:
+            doc_id = self._doc_ids.get((bucket, normalized_text))
+            if doc_id is not None:
+                self._remove_doc(doc_id)
+
+    def _remove_doc(self, doc_id):
+        bucket, normalized_text, _ = self._documents.pop(doc_id)
+        del self._doc_ids[(bucket, normalized_text)]
+        self._tombstones += 1
+        if self._tombstones > max(1024, len(self._documents) // 4):
+            self._compact()
+
+    def _compact(self):
+        live = self._documents
+        for key in list(self._postings):
+            postings = array('i', (doc_id for doc_id in self._postings[key] if doc_id in live))
+            if postings:
+                self._postings[key] = postings
+            else:
+                del self._postings[key]
+        self._tombstones = 0
+
+    def lookup(self, bucket, normalized_text, threshold):
+        """
+        Returns (value, similarity) of the most similar document in bucket that is within
+        max_edits edits of normalized_text and has a similarity of at least threshold,
+        otherwise (None, best_similarity).
+        """
+        if not normalized_text:
+            return None, 0.0
+        max_edits = self.max_edits
+        query_length = len(normalized_text)
+        with self._lock:
+            exact_doc_id = self._doc_ids.get((bucket, normalized_text))
+            if exact_doc_id is not None:
+                return self._documents[exact_doc_id][2], 1.0
+            if not self._documents:
+                return None, 0.0
+
+            # Segmen dokumen yang tidak tersentuh edit muncul persis di query, bergeser paling jauh max_edits
+            keys = set()
+            for length in range(max(1, query_length - max_edits), query_length + max_edits + 1):
+                for index, (start, end) in enumerate(_segment_bounds(length, self.segments)):
+                    for query_start in range(max(0, start - max_edits), min(start + max_edits, query_length - (end - start)) + 1):
+                        keys.add((bucket, length, index, normalized_text[query_start:query_start + end - start]))
+            posting_arrays = [np.frombuffer(postings, dtype=np.int32) for postings in map(self._postings.get, keys) if postings]
+            if not posting_arrays:
+                return None, 0.0
+            doc_ids = np.sort(np.concatenate(posting_arrays))
+            del posting_arrays # Lepaskan buffer agar array postings bisa bertambah lagi
+            # Kandidat = dokumen yang berbagi minimal dua segmen (muncul berurutan setelah sort), paling banyak segmen dulu
+            candidates, extra_hits = np.unique(doc_ids[1:][doc_ids[1:] == doc_ids[:-1]], return_counts=True)
+            candidates = candidates[np.argsort(-extra_hits, kind="stable")[:self.max_candidates]]
+            documents = [self._documents.get(doc_id) for doc_id in candidates.tolist()]
+
+        best_value, best_similarity = None, 0.0
+        for document in documents:
+            if document is None or not within_edit_distance(normalized_text, document[1], max_edits): # Tombstone atau terlalu berbeda
+                continue
+            similarity = ngram_similarity(normalized_text, document[1])
+            if similarity > best_similarity:
+                best_value, best_similarity = document[2], similarity
+        if best_similarity >= threshold:
+            return best_value, best_similarity
+        return None, best_similarity
@@ -0,0 +1,154 @@
+import json
+
+EVENT_FORMAT_NDJSON = "ndjson"
+EVENT_FORMAT_SSE = "sse"
+
+MEDIA_TYPES = {
+    EVENT_FORMAT_NDJSON: "application/x-ndjson",
+    EVENT_FORMAT_SSE: "text/event-stream",
+}
+
+
+def encode_event(event_format, event_name, data):
+    """
+    Encodes one stream event as an NDJSON line or a Server-Sent Events message.
+    """
+    if event_format == EVENT_FORMAT_SSE:
+        return f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event_name, **data}) + "\n"
+
+def lesson_sections(lesson):
+    """
+    Splits a complete lesson dict into the same (section, index, value) tuples that
+    LessonStreamParser emits, so cached lessons can be streamed in the same format.
+    """
+    sections = []
+    for key, value in lesson.items():
+        if isinstance(value, list):
+            sections.extend((key, index, item) for index, item in enumerate(value))
+        else:
+            sections.append((key, None, value))
+    return sections
+
+
+class LessonStreamParser:
+    """
+    Incremental parser for the lesson JSON object as it streams from the model.
+
+    Text is fed in arbitrary chunks. Every top-level member is returned as soon as its value
+    is complete: scalar/object members (e.g. "scenarioTitle") as (key, None, value) and each
+    item of an array member (e.g. "vocabulary") as (key, index, item). Anything before the
+    first "{" or after the closing "}" (such as ``` fences) is ignored. The members parsed
+    so far are also collected in `lesson`.
+
+    Raises json.JSONDecodeError if a completed member is not valid JSON.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._awaiting_value = False
+        self._key = None
+        self._token_start = None # Awal string key (depth 1)
+        self._value_start = None # Awal value scalar/objek (depth 1)
+        self._in_array = False
+        self._item_start = None # Awal item array (depth 2)
+        self._item_index = 0
+        self.lesson = {}
+        self.done = False
+
+    def feed(self, text):
+        """
+        Adds text and returns the list of (section, index, value) members completed by it.
+        """
+        self._text += text
+        completed = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._key = json.loads(text[self._token_start:i + 1])
+                continue
+            if self.done:
+                break
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._expect_key = True
+                continue
+            if char.isspace():
+                continue
+
+            if self._awaiting_value:
+                self._awaiting_value = False
+                if char == "[":
+                    self._in_array = True
+                    self._item_index = 0
+                    self.lesson[self._key] = []
+                    self._item_start = None
+                    self._depth = 2
+                    continue
+                self._value_start = i
+            elif self._in_array and self._depth == 2 and self._item_start is None and char not in ",]":
+                self._item_start = i
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._token_start = i
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._in_array and self._depth == 2:
+                    if self._item_start is not None: # Item scalar terakhir
+                        completed.append(self._complete_item(text[self._item_start:i]))
+                    self._in_array = False
+                    self._depth = 1
+                    self._key = None
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._value_start is not None:
+                        completed.append(self._complete_value(text[self._value_start:i]))
+                    self.done = True
+                elif self._depth == 1 and self._value_start is not None:
+                    completed.append(self._complete_value(text[self._value_start:i + 1]))
+                elif self._depth == 2 and self._in_array and self._item_start is not None:
+                    completed.append(self._complete_item(text[self._item_start:i + 1]))
+            elif char == ",":
+                if self._in_array and self._depth == 2:
+                    if self._item_start is not None:
+                        completed.append(self._complete_item(text[self._item_start:i]))
+                elif self._depth == 1:
+                    if self._value_start is not None:
+                        completed.append(self._complete_value(text[self._value_start:i]))
+                    self._expect_key = True
+            elif char == ":" and self._depth == 1 and self._expect_key:
+                self._expect_key = False
+                self._awaiting_value = True
+        self._pos = len(text)
+        return completed
+
+    def _complete_value(self, value_text):
+        self._value_start = None
+        value = self.lesson[self._key] = json.loads(value_text)
+        return (self._key, None, value)
+
+    def _complete_item(self, item_text):
+        self._item_start = None
+        index = self._item_index
+        self._item_index += 1
+        item = json.loads(item_text)
+        self.lesson[self._key].append(item)
+        return (self._key, index, item)
@@ -1,49 +1,337 @@
 import logging
 import os
 import json
-import base64 # Untuk encode gambar ke base64
 import azure.functions as func
 
-# Import SDK untuk Azure OpenAI
-from openai import AzureOpenAI # Pastikan versi openai >= 1.0.0
-
-# Import untuk Content Safety
-from azure.ai.contentsafety import ContentSafetyClient
-from azure.core.credentials import AzureKeyCredential
+# Azure OpenAI lewat registry client bersama, Content Safety lewat gateway bersama (client tunggal + cache verdict)
 from azure.core.exceptions import HttpResponseError # Untuk menangani error dari Content Safety Service
-from azure.ai.contentsafety.models import (
-    AnalyzeTextOptions,
-    TextCategory,
-    AnalyzeImageOptions, # <-- Tambahkan ini
-    ImageData,           # <-- Tambahkan ini
-    ImageCategory        # <-- Tambahkan ini
+from shared_code import clients, content_safety, llm_json, metrics, singleflight, upload_ingest
+from . import catalog, image_optimizer, phash_cache
+
+MAX_IMAGE_UPLOAD_SIZE_BYTES = int(os.environ.get("MAX_IMAGE_UPLOAD_SIZE_BYTES", 10 * 1024 * 1024)) # 10MB default
+
+# Optimasi payload vision: crop diperkecil ke resolusi yang benar-benar dipakai model dan di-encode ulang
+# dengan kualitas tertinggi yang muat di VISION_TARGET_BYTES. Crop kecil dikirim dengan detail "low" (85 token).
+VISION_OPTIMIZE_ENABLED = os.environ.get("VISION_OPTIMIZE_ENABLED", "true").lower() == "true"
+VISION_LOW_DETAIL_MAX_SIDE = int(os.environ.get("VISION_LOW_DETAIL_MAX_SIDE", image_optimizer.LOW_DETAIL_SIDE)) # 0 = selalu "high"
+VISION_TARGET_BYTES = int(os.environ.get("VISION_TARGET_BYTES", 150 * 1024))
+VISION_IMAGE_FORMAT = os.environ.get("VISION_IMAGE_FORMAT", "JPEG") # JPEG atau WEBP
+VISION_MIN_QUALITY = int(os.environ.get("VISION_MIN_QUALITY", 50))
+VISION_MAX_QUALITY = int(os.environ.get("VISION_MAX_QUALITY", 90))
+
+# Cache detail objek berdasarkan perceptual hash crop: objek yang sama (gelas, kursi, HP) difoto ribuan kali.
+# Crop yang hampir identik (pHash dalam OBJECT_DETAILS_CACHE_MAX_DISTANCE bit) dilayani tanpa panggilan
+# Content Safety maupun OpenAI. Hanya hasil yang lolos safety gambar & teks yang disimpan.
+OBJECT_DETAILS_CACHE_ENABLED = os.environ.get("OBJECT_DETAILS_CACHE_ENABLED", "true").lower() == "true"
+OBJECT_DETAILS_CACHE_MAX_ENTRIES = int(os.environ.get("OBJECT_DETAILS_CACHE_MAX_ENTRIES", 10000))
+OBJECT_DETAILS_CACHE_TTL_SECONDS = int(os.environ.get("OBJECT_DETAILS_CACHE_TTL_SECONDS", 30 * 86400))
+OBJECT_DETAILS_CACHE_MAX_DISTANCE = int(os.environ.get("OBJECT_DETAILS_CACHE_MAX_DISTANCE", 6)) # Bit Hamming pHash (dari 64)
+OBJECT_DETAILS_CACHE_DHASH_MAX_DISTANCE = int(os.environ.get("OBJECT_DETAILS_CACHE_DHASH_MAX_DISTANCE", 10)) # Verifikasi kedua dengan dHash
+OBJECT_DETAILS_CACHE_SQLITE_PATH = os.environ.get("OBJECT_DETAILS_CACHE_SQLITE_PATH") # Opsional, mis. /tmp/bisbi/object_details.sqlite3
+
+# Naikkan jika prompt atau skema JSON detail objek berubah, agar entri lama tidak dipakai lagi
+OBJECT_DETAILS_PROMPT_VERSION = "1"
+
+object_details_cache = phash_cache.PerceptualHashCache(
+    "get_object_details_cache",
+    max_entries=OBJECT_DETAILS_CACHE_MAX_ENTRIES,
+    ttl_seconds=OBJECT_DETAILS_CACHE_TTL_SECONDS,
+    max_distance=OBJECT_DETAILS_CACHE_MAX_DISTANCE,
+    dhash_max_distance=OBJECT_DETAILS_CACHE_DHASH_MAX_DISTANCE,
+    sqlite_path=OBJECT_DETAILS_CACHE_SQLITE_PATH
+) if OBJECT_DETAILS_CACHE_ENABLED else None
+
+# Katalog detail objek yang dihitung offline per label DETR (scripts/precompute_object_catalog.py).
+# Klien yang mengirim 'detectedLabel' + 'detectedConfidence' dilayani langsung dari katalog; jalur vision
+# hanya dipakai untuk label yang tidak dikenal atau confidence di bawah OBJECT_DETAILS_CATALOG_MIN_CONFIDENCE.
+OBJECT_DETAILS_CATALOG_ENABLED = os.environ.get("OBJECT_DETAILS_CATALOG_ENABLED", "true").lower() == "true"
+OBJECT_DETAILS_CATALOG_PATH = os.environ.get(
+    "OBJECT_DETAILS_CATALOG_PATH", os.path.join(os.path.dirname(__file__), "data", "object_details_catalog.bin")
 )
+OBJECT_DETAILS_CATALOG_MIN_CONFIDENCE = float(os.environ.get("OBJECT_DETAILS_CATALOG_MIN_CONFIDENCE", 0.8))
+
+object_details_catalog = catalog.load_catalog(OBJECT_DETAILS_CATALOG_PATH) if OBJECT_DETAILS_CATALOG_ENABLED else None
+
+# Singleflight: satu kelas memotret objek yang sama bersamaan; crop identik yang sedang diproses hanya
+# memicu satu rangkaian Content Safety + OpenAI, request lain menunggu hasilnya (maks. OBJECT_DETAILS_SINGLEFLIGHT_WAIT_SECONDS).
+OBJECT_DETAILS_SINGLEFLIGHT_ENABLED = os.environ.get("OBJECT_DETAILS_SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+OBJECT_DETAILS_SINGLEFLIGHT_WAIT_SECONDS = float(os.environ.get("OBJECT_DETAILS_SINGLEFLIGHT_WAIT_SECONDS", 90))
 
-# --- KONFIGURASI CONTENT SAFETY ---
-# Threshold untuk Teks (digunakan untuk output OpenAI)
-CONTENT_SAFETY_TEXT_THRESHOLD = 1
+object_details_flights = singleflight.SingleFlight("get_object_details.singleflight", wait_timeout=OBJECT_DETAILS_SINGLEFLIGHT_WAIT_SECONDS)
 
-# Threshold untuk Gambar (digunakan untuk input gambar) - bisa disamakan atau dibedakan
-CONTENT_SAFETY_IMAGE_THRESHOLD_SEXUAL = 1
-CONTENT_SAFETY_IMAGE_THRESHOLD_VIOLENCE = 1
-CONTENT_SAFETY_IMAGE_THRESHOLD_HATE = 1
-CONTENT_SAFETY_IMAGE_THRESHOLD_SELF_HARM = 1
-# ------------------------------------
+LANGUAGE_NAMES = {"en": "English", "id": "Indonesian"}
 
-# Inisialisasi Content Safety Client (Global untuk modul ini)
-content_safety_client = None
-CONTENT_SAFETY_ENDPOINT = os.environ.get("CONTENT_SAFETY_ENDPOINT")
-CONTENT_SAFETY_KEY = os.environ.get("CONTENT_SAFETY_KEY")
 
-if CONTENT_SAFETY_ENDPOINT and CONTENT_SAFETY_KEY:
+def details_schema(target_lang_code, source_lang_code):
+    """
+    Returns the llm_json schema of the bilingual object details object.
+    """
+    bilingual = {target_lang_code: str, source_lang_code: str}
+    return {"objectName": bilingual, "description": bilingual, "exampleSentences": [bilingual], "relatedAdjectives": [bilingual]}
+
+def build_system_prompt(target_lang_code, source_lang_code, from_label=False):
+    """
+    Builds the system prompt for object details. With from_label, the object is named in the
+    user message (offline catalog precompute) instead of shown in an image.
+    """
+    target_language_name = LANGUAGE_NAMES.get(target_lang_code, "English")
+    source_language_name = LANGUAGE_NAMES.get(source_lang_code, "Indonesian")
+    subject = "Describe the object named by the user" if from_label else "Analyze the provided image of an object"
+    return f"""
+You are an expert language tutor AI specializing in {target_language_name} and {source_language_name}.
+{subject} and generate detailed information.
+Provide all text outputs in {target_language_name} (code: '{target_lang_code}') AND also provide translations in {source_language_name} (code: '{source_lang_code}').
+Ensure all generated text is strictly appropriate for young children, avoiding any mature themes, violence, profanity, hate speech, or self-harm references.
+The descriptions should be factual, educational, and positive.
+Respond ONLY with a single, valid JSON object matching the following schema:
+{{
+  "objectName": {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }},
+  "description": {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }},
+  "exampleSentences": [ 
+    {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }}, 
+    {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }} 
+  ],
+  "relatedAdjectives": [ 
+    {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }},
+    {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }}
+  ]
+}}
+If you cannot identify the object or provide information, return an empty JSON object {{}}.
+"""
+
+def build_vision_messages(image_data_url, image_detail, target_lang_code, source_lang_code):
+    """
+    Builds the chat messages for one object crop.
+    """
+    target_language_name = LANGUAGE_NAMES.get(target_lang_code, "English")
+    source_language_name = LANGUAGE_NAMES.get(source_lang_code, "Indonesian")
+    return [
+        {"role": "system", "content": build_system_prompt(target_lang_code, source_lang_code)},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": f"Please analyze this object and provide details in {target_language_name} with {source_language_name} translations."},
+                {"type": "image_url", "image_url": {"url": image_data_url, "detail": image_detail}}
+            ]
+        }
+    ]
+
+def record_usage(response, name, object_count=1):
+    """
+    Adds the completion's token usage to `<name>.prompt_tokens`, `<name>.completion_tokens` and
+    `<name>.objects` in shared_code.metrics. Returns (prompt_tokens, completion_tokens).
+    """
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    metrics.increment(f"{name}.prompt_tokens", prompt_tokens)
+    metrics.increment(f"{name}.completion_tokens", completion_tokens)
+    metrics.increment(f"{name}.objects", object_count)
+    return prompt_tokens, completion_tokens
+
+def details_texts(parsed_json):
+    """
+    Collects every generated string in an object details object for the output safety check.
+    """
+    texts = []
+    if not isinstance(parsed_json, dict):
+        return texts
+    for field in ("objectName", "description"):
+        if isinstance(parsed_json.get(field), dict):
+            texts.extend(str(v) for v in parsed_json[field].values() if isinstance(v, (str, int, float)))
+    for field in ("exampleSentences", "relatedAdjectives"):
+        if isinstance(parsed_json.get(field), list):
+            for item in parsed_json[field]:
+                if isinstance(item, dict):
+                    texts.extend(str(v) for v in item.values() if isinstance(v, (str, int, float)))
+    return texts
+
+def _catalog_details(req, target_lang_code, source_lang_code):
+    """
+    Returns the catalog entry for the client-detected label, or None if the request has no
+    label, the confidence is too low or the label/language pair is not in the catalog.
+    """
+    detected_label = req.form.get('detectedLabel', req.params.get('detectedLabel'))
+    if object_details_catalog is None or not detected_label:
+        return None
+    confidence_param = req.form.get('detectedConfidence', req.params.get('detectedConfidence'))
     try:
-        content_safety_client = ContentSafetyClient(CONTENT_SAFETY_ENDPOINT, AzureKeyCredential(CONTENT_SAFETY_KEY))
-        logging.info("ContentSafetyClient initialized successfully for GetObjectDetailsVisual.")
-    except Exception as cs_init_err:
-        logging.error(f"Error initializing ContentSafetyClient for GetObjectDetailsVisual: {cs_init_err}", exc_info=True)
-        content_safety_client = None # Pastikan None jika gagal
-else:
-    logging.warning("Content Safety Endpoint or Key is not configured for GetObjectDetailsVisual. Safety checks might be skipped.")
+        detected_confidence = float(confidence_param)
+    except (TypeError, ValueError):
+        logging.warning(f"Parameter detectedConfidence tidak valid ('{confidence_param}'), memakai jalur vision.")
+        return None
+    if detected_confidence < OBJECT_DETAILS_CATALOG_MIN_CONFIDENCE:
+        metrics.increment(f"{object_details_catalog.name}.low_confidence")
+        logging.info(f"Label '{detected_label}' confidence {detected_confidence:.2f} < {OBJECT_DETAILS_CATALOG_MIN_CONFIDENCE}, memakai jalur vision.")
+        return None
+    return object_details_catalog.lookup(detected_label, target_lang_code, source_lang_code)
+
+
+def _describe_image(image_bytes, image_content_type, image_hashes, cache_bucket, openai_endpoint, openai_key, openai_deployment_name, target_lang_code, source_lang_code):
+    """
+    Runs the input safety check, the vision call and the output safety check for one crop
+    (step 3 onwards of main) and stores verified results in the perceptual hash cache.
+    """
+    image_verified = False
+    output_verified = False
+
+    # --- ANALISIS KEAMANAN GAMBAR INPUT DENGAN AZURE AI CONTENT SAFETY ---
+    # Ini adalah langkah PENTING sebelum mengirim ke OpenAI
+    if content_safety.is_configured():
+        try:
+            logging.info("Performing image safety analysis on input image...")
+            image_verdict = content_safety.analyze_image(upload_ingest.as_sdk_buffer(image_bytes))
+            logging.info(f"Input Image Content Safety Analysis: {image_verdict.summary()}")
+
+            if image_verdict.blocked:
+                logging.warning(f"Input image blocked by Content Safety. Categories: {', '.join(image_verdict.blocked_categories)}")
+                return func.HttpResponse(
+                    json.dumps({"error": "Uploaded image contains inappropriate content.", "details": image_verdict.details}),
+                    mimetype="application/json",
+                    status_code=400 
+                )
+            logging.info("Input image passed content safety check.")
+            image_verified = True
+        
+        except HttpResponseError as cs_http_err: # Menangkap error spesifik dari service Content Safety
+            logging.error(f"Azure AI Content Safety HTTPError for image: {cs_http_err.message}", exc_info=True)
+            logging.warning("Skipping image safety check due to an error with Content Safety service. Proceeding with caution to OpenAI.")
+            # Anda bisa memilih untuk blokir di sini jika Content Safety adalah syarat mutlak
+            # return func.HttpResponse(json.dumps({"error": "Failed to analyze image safety."}), mimetype="application/json", status_code=500)
+        except Exception as cs_img_err:
+            logging.error(f"Error during Azure AI Content Safety image analysis: {cs_img_err}", exc_info=True)
+            logging.warning("Skipping image safety check due to an unexpected error. Proceeding with caution to OpenAI.")
+            # Sama seperti di atas, pertimbangkan untuk blokir
+    else:
+        logging.warning("Content Safety client not available for image check, skipping image safety analysis. Proceeding to OpenAI.")
+    # --- AKHIR ANALISIS KEAMANAN GAMBAR INPUT ---
+
+    # 4. Optimasi & encode gambar ke data URL base64 SETELAH lolos Content Safety (jika lolos)
+    image_mime_type = image_content_type if image_content_type else "image/jpeg" # Tetap ambil dari file asli
+    image_detail = "auto"
+    if VISION_OPTIMIZE_ENABLED:
+        try:
+            optimized_image = image_optimizer.optimize_for_vision(
+                image_bytes,
+                low_detail_max_side=VISION_LOW_DETAIL_MAX_SIDE,
+                target_bytes=VISION_TARGET_BYTES,
+                image_format=VISION_IMAGE_FORMAT,
+                min_quality=VISION_MIN_QUALITY,
+                max_quality=VISION_MAX_QUALITY
+            )
+            image_optimizer.log_optimization(optimized_image)
+            image_bytes, image_mime_type, image_detail = optimized_image.image_bytes, optimized_image.mimetype, optimized_image.detail
+        except Exception as optimize_err: # Gambar yang tidak bisa di-decode PIL tetap dikirim apa adanya
+            logging.warning(f"Vision payload optimizer failed, sending the original upload: {optimize_err}")
+    image_data_url = image_optimizer.to_data_url(image_bytes, image_mime_type)
+    del image_bytes # Byte gambar tidak dibutuhkan lagi setelah data URL dibuat
+
+    # 5. Ambil klien Azure OpenAI bersama dari registry (connection pool per proses)
+    client = clients.get_openai_client(openai_endpoint, openai_key, api_version="2024-02-01")
+
+    # 6. Susun prompt untuk Azure OpenAI (tetap sama)
+    messages_payload = build_vision_messages(image_data_url, image_detail, target_lang_code, source_lang_code)
+
+    # 7. Panggil Azure OpenAI (tetap sama)
+    logging.info(f"Memanggil Azure OpenAI deployment '{openai_deployment_name}' untuk detail objek...")
+    try:
+        response = client.chat.completions.create(
+            model=openai_deployment_name,
+            messages=messages_payload,
+            max_tokens=1000,
+            temperature=0.3
+        )
+        prompt_tokens, completion_tokens = record_usage(response, "get_object_details")
+        logging.info(f"Object details usage: prompt_tokens={prompt_tokens}, completion_tokens={completion_tokens}.")
+    except Exception as e_openai:
+        logging.error(f"Error calling Azure OpenAI: {str(e_openai)}", exc_info=True)
+        return func.HttpResponse(
+            json.dumps({"error": "Error communicating with AI model.", "details": str(e_openai)}),
+            mimetype="application/json",
+            status_code=500
+        )
+    
+    # 8. Proses respons dari Azure OpenAI (termasuk filter teks output yang sudah ada)
+    if response.choices and len(response.choices) > 0:
+        assistant_message = response.choices[0].message
+        if assistant_message.content:
+            try:
+                # Fence/prosa diabaikan; output yang terpotong max_tokens diselamatkan jika masih sesuai skema
+                parse_result = llm_json.parse(assistant_message.content, details_schema(target_lang_code, source_lang_code), name="get_object_details.llm_json")
+                parsed_json = parse_result.value
+                if parse_result.repaired:
+                    logging.warning(f"Respons OpenAI terpotong (finish_reason={response.choices[0].finish_reason}); bagian yang lengkap dipakai.")
+                logging.info(f"Respon JSON dari OpenAI berhasil di-parse.")
+                
+                # --- FILTER KEAMANAN TEKS OUTPUT (TETAP ADA) ---
+                if content_safety.is_configured():
+                    try:
+                        texts_to_check_obj = details_texts(parsed_json)
+                        if texts_to_check_obj:
+                            logging.info(f"Performing content safety analysis on generated object details output ({len(texts_to_check_obj)} strings)...")
+                            output_verdict_obj = content_safety.analyze_texts(texts_to_check_obj)
+
+                            if output_verdict_obj.blocked:
+                                logging.warning(f"Generated object details content blocked by Content Safety. Categories: {', '.join(output_verdict_obj.blocked_categories)}")
+                                return func.HttpResponse(
+                                    json.dumps({"error": "Generated object details were found to be inappropriate and has been blocked."}),
+                                    mimetype="application/json",
+                                    status_code=500 
+                                )
+                            logging.info("Generated object details content passed content safety check.")
+                        output_verified = True
+                    except Exception as output_safety_err_obj:
+                        logging.error(f"Error during content safety analysis for generated object details: {output_safety_err_obj}", exc_info=True)
+                        return func.HttpResponse(
+                            json.dumps({"error": "Failed to verify safety of generated object details."}),
+                            mimetype="application/json",
+                            status_code=500
+                        )
+                # --- AKHIR FILTER KEAMANAN TEKS OUTPUT ---
+
+                # ---- BLOK KODE UNTUK FILTER OBJEK BERDASARKAN NAMA (OPSIONAL, JIKA DIPERLUKAN) ----
+                # FORBIDDEN_OBJECT_KEYWORDS_EN = ["handgun", "pistol", "gun", "rifle", "weapon", "knife", "blade"] 
+                # FORBIDDEN_OBJECT_KEYWORDS_ID = ["pistol", "senjata", "senapan", "pisau", "belati"] 
+
+                # object_name_en = parsed_json.get("objectName", {}).get(target_lang_code, "").lower()
+                # object_name_id = parsed_json.get("objectName", {}).get(source_lang_code, "").lower()
+
+                # is_forbidden_by_name = False
+                # if any(keyword in object_name_en for keyword in FORBIDDEN_OBJECT_KEYWORDS_EN):
+                #     is_forbidden_by_name = True
+                # if any(keyword in object_name_id for keyword in FORBIDDEN_OBJECT_KEYWORDS_ID):
+                #     is_forbidden_by_name = True
+                
+                # if is_forbidden_by_name:
+                #     logging.warning(f"Object '{object_name_en}/{object_name_id}' is on the forbidden list by name. Blocking details.")
+                #     return func.HttpResponse(
+                #         json.dumps({"error": "Details for this type of object are not available.", "reason": "Object type restricted by name"}),
+                #         mimetype="application/json",
+                #         status_code=403 # Forbidden
+                #     )
+                # ---- AKHIR BLOK KODE FILTER OBJEK BERDASARKAN NAMA ----
+
+
+                # Simpan hanya hasil lengkap yang lolos safety gambar & teks ({} = objek tidak dikenali, tidak disimpan)
+                if image_hashes is not None and image_verified and output_verified and parsed_json and not parse_result.repaired:
+                    object_details_cache.store(cache_bucket, *image_hashes, parsed_json)
+
+                return func.HttpResponse(
+                    body=json.dumps(parsed_json),
+                    mimetype="application/json",
+                    status_code=200
+                )
+            # ... (sisa error handling Anda sudah bagus) ...
+            except llm_json.LLMJSONError as json_err:
+                logging.error(f"Gagal mem-parse JSON dari respons OpenAI: {json_err}")
+                logging.error(f"Respons mentah dari OpenAI: {assistant_message.content}")
+                return func.HttpResponse(json.dumps({"error": "AI model returned non-JSON content or malformed JSON."}),mimetype="application/json",status_code=500)
+        else:
+            logging.warning("Respons OpenAI tidak memiliki konten.")
+            return func.HttpResponse(json.dumps({"error": "AI model returned no content."}),mimetype="application/json",status_code=500)
+    else:
+        logging.warning("Respons OpenAI tidak memiliki choices.")
+        return func.HttpResponse(json.dumps({"error": "AI model returned no choices."}),mimetype="application/json",status_code=500)
 
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
@@ -63,14 +351,22 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=500
             )
 
-        # 2. Dapatkan file gambar dan parameter bahasa dari request
+        # 2. Tolak request yang terlalu besar sebelum multipart di-parse
+        too_large = upload_ingest.check_request_size(req, MAX_IMAGE_UPLOAD_SIZE_BYTES + upload_ingest.MULTIPART_OVERHEAD_BYTES, "Image")
+        if too_large:
+            return too_large
+
+        # Dapatkan file gambar dan parameter bahasa dari request
         image_file = req.files.get('image')
         target_lang_code = req.form.get('targetLanguage', req.params.get('targetLanguage', 'en'))
         source_lang_code = req.form.get('sourceLanguage', req.params.get('sourceLanguage', 'id'))
-        
-        lang_names = {"en": "English", "id": "Indonesian"}
-        target_language_name = lang_names.get(target_lang_code, "English")
-        source_language_name = lang_names.get(source_lang_code, "Indonesian")
+
+        # Mode katalog: label DETR dengan confidence tinggi dilayani tanpa membaca gambar sama sekali
+        # (entri katalog sudah lolos Content Safety saat precompute)
+        catalog_details = _catalog_details(req, target_lang_code, source_lang_code)
+        if catalog_details is not None:
+            logging.info("Object details served from the precomputed catalog.")
+            return func.HttpResponse(body=json.dumps(catalog_details), mimetype="application/json", status_code=200)
 
         if not image_file:
             logging.warning("Tidak ada file gambar yang diterima.")
@@ -80,246 +376,54 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=400
             )
         
-        # 3. Baca byte gambar DULU untuk Content Safety
-        image_bytes = image_file.read() # Baca sekali saja
+        # 3. Baca byte gambar DULU untuk Content Safety (dengan batas ukuran keras)
+        try:
+            image_bytes = upload_ingest.read_upload(image_file, MAX_IMAGE_UPLOAD_SIZE_BYTES) # Baca sekali saja
+        except upload_ingest.UploadTooLargeError as too_large_err:
+            logging.warning(f"Upload gambar ditolak: {too_large_err}")
+            return upload_ingest.too_large_response("Image", MAX_IMAGE_UPLOAD_SIZE_BYTES)
         if not image_bytes:
             logging.warning("File gambar kosong.")
             return func.HttpResponse(json.dumps({"error": "File gambar tidak boleh kosong."}),mimetype="application/json",status_code=400)
+        if upload_ingest.sniff_mimetype(image_bytes, upload_ingest.IMAGE_SIGNATURES) is None:
+            logging.warning("File gambar tidak cocok dengan format gambar yang didukung.")
+            return upload_ingest.unsupported_media_response("Image")
 
-        # --- ANALISIS KEAMANAN GAMBAR INPUT DENGAN AZURE AI CONTENT SAFETY ---
-        # Ini adalah langkah PENTING sebelum mengirim ke OpenAI
-        if content_safety_client:
+        # Cache perceptual hash: crop yang (hampir) sama dengan crop yang sudah lolos semua pemeriksaan
+        image_hashes = None
+        cache_bucket = f"{OBJECT_DETAILS_PROMPT_VERSION}|{openai_deployment_name}|{target_lang_code}|{source_lang_code}"
+        if object_details_cache is not None:
             try:
-                logging.info("Performing image safety analysis on input image...")
-                image_data_for_cs = ImageData(content=image_bytes)
-                request_cs_image = AnalyzeImageOptions(image=image_data_for_cs, categories=[
-                    ImageCategory.SEXUAL, 
-                    ImageCategory.VIOLENCE,
-                    ImageCategory.HATE,
-                    ImageCategory.SELF_HARM
-                ])
-                response_cs_image = content_safety_client.analyze_image(request_cs_image)
-                
-                # Logika parsing dan pengecekan threshold untuk gambar
-                sexual_img_score = 0
-                violence_img_score = 0
-                hate_img_score = 0
-                self_harm_img_score = 0
-
-                if hasattr(response_cs_image, 'categories_analysis') and response_cs_image.categories_analysis is not None:
-                    for analysis_item in response_cs_image.categories_analysis:
-                        category_str = analysis_item.category # Ini adalah enum, gunakan .value jika perlu string
-                        severity = analysis_item.severity if analysis_item.severity is not None else 0
-                        
-                        if category_str == ImageCategory.SEXUAL:
-                            sexual_img_score = severity
-                        elif category_str == ImageCategory.VIOLENCE:
-                            violence_img_score = severity
-                        elif category_str == ImageCategory.HATE:
-                            hate_img_score = severity
-                        elif category_str == ImageCategory.SELF_HARM:
-                            self_harm_img_score = severity
-                
-                logging.info(f"Input Image Content Safety Analysis: Sexual={sexual_img_score}, Violence={violence_img_score}, Hate={hate_img_score}, SelfHarm={self_harm_img_score}")
-
-                blocked_input_image_categories = []
-                if sexual_img_score >= CONTENT_SAFETY_IMAGE_THRESHOLD_SEXUAL:
-                    blocked_input_image_categories.append(f"Sexual (Score: {sexual_img_score})")
-                if violence_img_score >= CONTENT_SAFETY_IMAGE_THRESHOLD_VIOLENCE:
-                    blocked_input_image_categories.append(f"Violence (Score: {violence_img_score})")
-                if hate_img_score >= CONTENT_SAFETY_IMAGE_THRESHOLD_HATE:
-                    blocked_input_image_categories.append(f"Hate (Score: {hate_img_score})")
-                if self_harm_img_score >= CONTENT_SAFETY_IMAGE_THRESHOLD_SELF_HARM:
-                    blocked_input_image_categories.append(f"Self-Harm (Score: {self_harm_img_score})")
-                
-                if blocked_input_image_categories:
-                    logging.warning(f"Input image blocked by Content Safety. Categories: {', '.join(blocked_input_image_categories)}")
-                    return func.HttpResponse(
-                        json.dumps({"error": "Uploaded image contains inappropriate content.", "details": f"Blocked categories: {', '.join(blocked_input_image_categories)}"}),
-                        mimetype="application/json",
-                        status_code=400 
-                    )
-                logging.info("Input image passed content safety check.")
-            
-            except HttpResponseError as cs_http_err: # Menangkap error spesifik dari service Content Safety
-                logging.error(f"Azure AI Content Safety HTTPError for image: {cs_http_err.message}", exc_info=True)
-                logging.warning("Skipping image safety check due to an error with Content Safety service. Proceeding with caution to OpenAI.")
-                # Anda bisa memilih untuk blokir di sini jika Content Safety adalah syarat mutlak
-                # return func.HttpResponse(json.dumps({"error": "Failed to analyze image safety."}), mimetype="application/json", status_code=500)
-            except Exception as cs_img_err:
-                logging.error(f"Error during Azure AI Content Safety image analysis: {cs_img_err}", exc_info=True)
-                logging.warning("Skipping image safety check due to an unexpected error. Proceeding with caution to OpenAI.")
-                # Sama seperti di atas, pertimbangkan untuk blokir
-        else:
-            logging.warning("Content Safety client not available for image check, skipping image safety analysis. Proceeding to OpenAI.")
-        # --- AKHIR ANALISIS KEAMANAN GAMBAR INPUT ---
-
-        # 4. Encode gambar ke base64 SETELAH lolos Content Safety (jika lolos)
-        base64_image_string = base64.b64encode(image_bytes).decode('utf-8')
-        image_mime_type = image_file.content_type if image_file.content_type else "image/jpeg" # Tetap ambil dari file asli
-
-        # 5. Inisialisasi klien Azure OpenAI
-        client = AzureOpenAI(
-            azure_endpoint=openai_endpoint,
-            api_key=openai_key,
-            api_version="2024-02-01" 
-        )
+                image_hashes = phash_cache.compute_hashes(image_bytes)
+                cached_details, hash_distance = object_details_cache.lookup(cache_bucket, *image_hashes)
+                if cached_details is not None:
+                    logging.info(f"Object details cache hit (pHash distance {hash_distance}).")
+                    return func.HttpResponse(body=json.dumps(cached_details), mimetype="application/json", status_code=200)
+            except Exception as hash_err:
+                logging.warning(f"Perceptual hash lookup failed, continuing without cache: {hash_err}")
+                image_hashes = None
 
-        # 6. Susun prompt untuk Azure OpenAI (tetap sama)
-        system_prompt_content = f"""
-You are an expert language tutor AI specializing in {target_language_name} and {source_language_name}.
-Analyze the provided image of an object and generate detailed information.
-Provide all text outputs in {target_language_name} (code: '{target_lang_code}') AND also provide translations in {source_language_name} (code: '{source_lang_code}').
-Ensure all generated text is strictly appropriate for young children, avoiding any mature themes, violence, profanity, hate speech, or self-harm references.
-The descriptions should be factual, educational, and positive.
-Respond ONLY with a single, valid JSON object matching the following schema:
-{{
-  "objectName": {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }},
-  "description": {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }},
-  "exampleSentences": [ 
-    {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }}, 
-    {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }} 
-  ],
-  "relatedAdjectives": [ 
-    {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }},
-    {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }}
-  ]
-}}
-If you cannot identify the object or provide information, return an empty JSON object {{}}.
-"""
-        messages_payload = [
-            {"role": "system", "content": system_prompt_content},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": f"Please analyze this object and provide details in {target_language_name} with {source_language_name} translations."},
-                    {"type": "image_url", "image_url": {"url": f"data:{image_mime_type};base64,{base64_image_string}"}}
-                ]
-            }
-        ]
-
-        # 7. Panggil Azure OpenAI (tetap sama)
-        logging.info(f"Memanggil Azure OpenAI deployment '{openai_deployment_name}' untuk detail objek...")
+        # Request identik yang sedang berjalan (crop dengan hash sama, bahasa sama) digabung ke satu panggilan upstream
+        describe = lambda: _describe_image(
+            image_bytes, image_file.content_type, image_hashes, cache_bucket,
+            openai_endpoint, openai_key, openai_deployment_name, target_lang_code, source_lang_code
+        )
+        if not OBJECT_DETAILS_SINGLEFLIGHT_ENABLED:
+            return describe()
+        flight_key = f"{cache_bucket}|{image_hashes[0]:016x}{image_hashes[1]:016x}" if image_hashes else f"{cache_bucket}|{content_safety.content_digest(image_bytes)}"
         try:
-            response = client.chat.completions.create(
-                model=openai_deployment_name,
-                messages=messages_payload,
-                max_tokens=1000,
-                temperature=0.3
-            )
-        except Exception as e_openai:
-            logging.error(f"Error calling Azure OpenAI: {str(e_openai)}", exc_info=True)
+            response, shared = object_details_flights.do(flight_key, describe)
+        except singleflight.SingleFlightTimeout as wait_err:
+            logging.warning(str(wait_err))
             return func.HttpResponse(
-                json.dumps({"error": "Error communicating with AI model.", "details": str(e_openai)}),
+                json.dumps({"error": "Timed out waiting for an identical request that is still in progress."}),
                 mimetype="application/json",
-                status_code=500
+                status_code=504
             )
-        
-        # 8. Proses respons dari Azure OpenAI (termasuk filter teks output yang sudah ada)
-        if response.choices and len(response.choices) > 0:
-            assistant_message = response.choices[0].message
-            if assistant_message.content:
-                try:
-                    json_output_str = assistant_message.content.strip()
-                    if json_output_str.startswith("```json"):
-                        json_output_str = json_output_str[7:]
-                    if json_output_str.endswith("```"):
-                        json_output_str = json_output_str[:-3]
-                    
-                    json_output_str = json_output_str.strip()
-                    parsed_json = json.loads(json_output_str)
-                    logging.info(f"Respon JSON dari OpenAI berhasil di-parse.")
-                    
-                    # --- FILTER KEAMANAN TEKS OUTPUT (TETAP ADA) ---
-                    if content_safety_client:
-                        try:
-                            texts_to_check_obj = []
-                            # (Logika pengumpulan teks Anda sudah bagus di sini)
-                            if "objectName" in parsed_json and isinstance(parsed_json["objectName"], dict):
-                                texts_to_check_obj.extend(str(v) for v in parsed_json["objectName"].values() if isinstance(v, (str, int, float)))
-                            if "description" in parsed_json and isinstance(parsed_json["description"], dict):
-                                texts_to_check_obj.extend(str(v) for v in parsed_json["description"].values() if isinstance(v, (str, int, float)))
-                            if "exampleSentences" in parsed_json and isinstance(parsed_json["exampleSentences"], list):
-                                for item in parsed_json["exampleSentences"]:
-                                    if isinstance(item, dict):
-                                        texts_to_check_obj.extend(str(v) for v in item.values() if isinstance(v, (str, int, float)))
-                            if "relatedAdjectives" in parsed_json and isinstance(parsed_json["relatedAdjectives"], list):
-                                for item in parsed_json["relatedAdjectives"]:
-                                    if isinstance(item, dict):
-                                        texts_to_check_obj.extend(str(v) for v in item.values() if isinstance(v, (str, int, float)))
-                            
-                            combined_text_output_obj = " . ".join(filter(None, texts_to_check_obj))
-
-                            if combined_text_output_obj:
-                                logging.info(f"Performing content safety analysis on generated object details output (length: {len(combined_text_output_obj)})...")
-                                analyze_output_request_obj = AnalyzeTextOptions(
-                                    text=combined_text_output_obj,
-                                    categories=[TextCategory.SEXUAL, TextCategory.VIOLENCE, TextCategory.HATE, TextCategory.SELF_HARM]
-                                )
-                                response_output_safety_obj = content_safety_client.analyze_text(analyze_output_request_obj)
-                                
-                                blocked_output_categories_obj = []
-                                if response_output_safety_obj and hasattr(response_output_safety_obj, 'categories_analysis'):
-                                    for category_result in response_output_safety_obj.categories_analysis:
-                                        if category_result.severity >= CONTENT_SAFETY_TEXT_THRESHOLD:
-                                            blocked_output_categories_obj.append(f"{category_result.category.value if hasattr(category_result.category, 'value') else category_result.category} (Score: {category_result.severity})")
-
-                                if blocked_output_categories_obj:
-                                    logging.warning(f"Generated object details content blocked by Content Safety. Categories: {', '.join(blocked_output_categories_obj)}")
-                                    return func.HttpResponse(
-                                        json.dumps({"error": "Generated object details were found to be inappropriate and has been blocked."}),
-                                        mimetype="application/json",
-                                        status_code=500 
-                                    )
-                                logging.info("Generated object details content passed content safety check.")
-                        except Exception as output_safety_err_obj:
-                            logging.error(f"Error during content safety analysis for generated object details: {output_safety_err_obj}", exc_info=True)
-                            return func.HttpResponse(
-                                json.dumps({"error": "Failed to verify safety of generated object details."}),
-                                mimetype="application/json",
-                                status_code=500
-                            )
-                    # --- AKHIR FILTER KEAMANAN TEKS OUTPUT ---
-
-                    # ---- BLOK KODE UNTUK FILTER OBJEK BERDASARKAN NAMA (OPSIONAL, JIKA DIPERLUKAN) ----
-                    # FORBIDDEN_OBJECT_KEYWORDS_EN = ["handgun", "pistol", "gun", "rifle", "weapon", "knife", "blade"] 
-                    # FORBIDDEN_OBJECT_KEYWORDS_ID = ["pistol", "senjata", "senapan", "pisau", "belati"] 
-
-                    # object_name_en = parsed_json.get("objectName", {}).get(target_lang_code, "").lower()
-                    # object_name_id = parsed_json.get("objectName", {}).get(source_lang_code, "").lower()
-
-                    # is_forbidden_by_name = False
-                    # if any(keyword in object_name_en for keyword in FORBIDDEN_OBJECT_KEYWORDS_EN):
-                    #     is_forbidden_by_name = True
-                    # if any(keyword in object_name_id for keyword in FORBIDDEN_OBJECT_KEYWORDS_ID):
-                    #     is_forbidden_by_name = True
-                    
-                    # if is_forbidden_by_name:
-                    #     logging.warning(f"Object '{object_name_en}/{object_name_id}' is on the forbidden list by name. Blocking details.")
-                    #     return func.HttpResponse(
-                    #         json.dumps({"error": "Details for this type of object are not available.", "reason": "Object type restricted by name"}),
-                    #         mimetype="application/json",
-                    #         status_code=403 # Forbidden
-                    #     )
-                    # ---- AKHIR BLOK KODE FILTER OBJEK BERDASARKAN NAMA ----
-
-
-                    return func.HttpResponse(
-                        body=json.dumps(parsed_json),
-                        mimetype="application/json",
-                        status_code=200
-                    )
-                # ... (sisa error handling Anda sudah bagus) ...
-                except json.JSONDecodeError as json_err:
-                    logging.error(f"Gagal mem-parse JSON dari respons OpenAI: {json_err}")
-                    logging.error(f"Respons mentah dari OpenAI: {assistant_message.content}")
-                    return func.HttpResponse(json.dumps({"error": "AI model returned non-JSON content or malformed JSON."}),mimetype="application/json",status_code=500)
-            else:
-                logging.warning("Respons OpenAI tidak memiliki konten.")
-                return func.HttpResponse(json.dumps({"error": "AI model returned no content."}),mimetype="application/json",status_code=500)
-        else:
-            logging.warning("Respons OpenAI tidak memiliki choices.")
-            return func.HttpResponse(json.dumps({"error": "AI model returned no choices."}),mimetype="application/json",status_code=500)
+        if shared: # Salinan per waiter; blokir safety dan error ikut dibagikan apa adanya
+            logging.info("Object details shared from a concurrent identical request.")
+            return func.HttpResponse(body=response.get_body(), mimetype=response.mimetype, status_code=response.status_code)
+        return response
 
     except ValueError as ve:
         logging.error(f"ValueError: {str(ve)}")
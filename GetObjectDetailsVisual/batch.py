@@ -0,0 +1,372 @@
+import logging
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import azure.functions as func
+from azure.core.exceptions import HttpResponseError
+
+from . import (
+    LANGUAGE_NAMES, MAX_IMAGE_UPLOAD_SIZE_BYTES, OBJECT_DETAILS_PROMPT_VERSION, VISION_IMAGE_FORMAT, VISION_LOW_DETAIL_MAX_SIDE,
+    VISION_MAX_QUALITY, VISION_MIN_QUALITY, VISION_OPTIMIZE_ENABLED, VISION_TARGET_BYTES,
+    build_vision_messages, details_schema, details_texts, image_optimizer, object_details_cache, phash_cache, record_usage
+)
+from shared_code import clients, content_safety, llm_json, upload_ingest
+
+# --- KONFIGURASI BATCH ---
+MAX_OBJECT_DETAILS_BATCH_IMAGES = int(os.environ.get("MAX_OBJECT_DETAILS_BATCH_IMAGES", 6))
+MAX_OBJECT_DETAILS_BATCH_UPLOAD_SIZE_BYTES = int(os.environ.get("MAX_OBJECT_DETAILS_BATCH_UPLOAD_SIZE_BYTES", 25 * 1024 * 1024)) # 25MB total default
+OBJECT_DETAILS_BATCH_MAX_TOKENS_PER_OBJECT = int(os.environ.get("OBJECT_DETAILS_BATCH_MAX_TOKENS_PER_OBJECT", 600))
+OBJECT_DETAILS_BATCH_MAX_TOKENS = int(os.environ.get("OBJECT_DETAILS_BATCH_MAX_TOKENS", 4096))
+OBJECT_DETAILS_BATCH_CONCURRENCY = int(os.environ.get("OBJECT_DETAILS_BATCH_CONCURRENCY", 4))
+
+# Pool untuk Content Safety gambar, optimasi crop dan panggilan fallback per crop
+batch_executor = ThreadPoolExecutor(max_workers=OBJECT_DETAILS_BATCH_CONCURRENCY, thread_name_prefix="object-details-batch")
+
+
+@dataclass
+class PreparedCrop:
+    """
+    A crop that passed validation and the input safety check, ready for the vision model.
+    """
+    index: int
+    filename: str
+    data_url: str
+    detail: str
+    hashes: tuple
+    image_verified: bool
+
+
+def build_batch_system_prompt(target_lang_code, source_lang_code):
+    target_language_name = LANGUAGE_NAMES.get(target_lang_code, "English")
+    source_language_name = LANGUAGE_NAMES.get(source_lang_code, "Indonesian")
+    return f"""
+You are an expert language tutor AI specializing in {target_language_name} and {source_language_name}.
+You will receive several images of objects, each preceded by its label "Crop <index>". Analyze every crop separately and generate detailed information for each one.
+Provide all text outputs in {target_language_name} (code: '{target_lang_code}') AND also provide translations in {source_language_name} (code: '{source_lang_code}').
+Ensure all generated text is strictly appropriate for young children, avoiding any mature themes, violence, profanity, hate speech, or self-harm references.
+The descriptions should be factual, educational, and positive.
+Respond ONLY with a single, valid JSON object with exactly one entry per crop, matching the following schema:
+{{
+  "objects": [
+    {{
+      "index": <crop index as integer>,
+      "objectName": {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }},
+      "description": {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }},
+      "exampleSentences": [ {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }}, {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }} ],
+      "relatedAdjectives": [ {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }}, {{ "{target_lang_code}": "string", "{source_lang_code}": "string" }} ]
+    }}
+  ]
+}}
+If you cannot identify the object in a crop, return only {{ "index": <crop index> }} for that crop.
+"""
+
+def build_batch_messages(crops, target_lang_code, source_lang_code):
+    target_language_name = LANGUAGE_NAMES.get(target_lang_code, "English")
+    source_language_name = LANGUAGE_NAMES.get(source_lang_code, "Indonesian")
+    content = [{"type": "text", "text": f"Please analyze these {len(crops)} objects and provide details in {target_language_name} with {source_language_name} translations."}]
+    for crop in crops:
+        content.append({"type": "text", "text": f"Crop {crop.index}"})
+        content.append({"type": "image_url", "image_url": {"url": crop.data_url, "detail": crop.detail}})
+    return [
+        {"role": "system", "content": build_batch_system_prompt(target_lang_code, source_lang_code)},
+        {"role": "user", "content": content}
+    ]
+
+def split_batch_response(value, crop_indices, schema, repaired=False):
+    """
+    Maps a parsed batch response back to crops.
+
+    Returns {crop_index: details} for items that match schema ({} for crops the model could
+    not identify). Items with an unknown or duplicate index, or that are off-schema, are left
+    out so the caller falls back to a per-crop call. If the output was truncated, the last item
+    is left out too, since truncation repair may have cut it short.
+    """
+    items = value.get("objects") if isinstance(value, dict) else None
+    if not isinstance(items, list):
+        return {}
+    if repaired:
+        items = items[:-1]
+    wanted = set(crop_indices)
+    details_by_index = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("index")
+        if isinstance(index, str) and index.strip().isdigit():
+            index = int(index)
+        if not isinstance(index, int) or index not in wanted or index in details_by_index:
+            continue
+        details = {key: item_value for key, item_value in item.items() if key != "index"}
+        if details and llm_json.validate(details, schema):
+            continue
+        details_by_index[index] = details
+    return details_by_index
+
+def request_batch_details(client, deployment, crops, target_lang_code, source_lang_code):
+    """
+    Requests details for several crops in one multi-image chat completion.
+
+    Returns:
+        tuple: ({crop_index: details} for the usable items, (prompt_tokens, completion_tokens)).
+
+    Raises:
+        llm_json.LLMJSONError: If the response holds no parseable JSON.
+    """
+    response = client.chat.completions.create(
+        model=deployment,
+        messages=build_batch_messages(crops, target_lang_code, source_lang_code),
+        max_tokens=min(OBJECT_DETAILS_BATCH_MAX_TOKENS, OBJECT_DETAILS_BATCH_MAX_TOKENS_PER_OBJECT * len(crops)),
+        temperature=0.3
+    )
+    usage = record_usage(response, "get_object_details_batch", len(crops))
+    content = response.choices[0].message.content if response.choices else None
+    parse_result = llm_json.parse(content, {"objects": [dict]}, name="get_object_details_batch.llm_json")
+    details_by_index = split_batch_response(
+        parse_result.value, [crop.index for crop in crops], details_schema(target_lang_code, source_lang_code), parse_result.repaired
+    )
+    return details_by_index, usage
+
+def request_single_details(client, deployment, crop, target_lang_code, source_lang_code):
+    """
+    Requests details for one crop (the same call GetObjectDetailsVisual makes).
+
+    Returns:
+        tuple: (llm_json.LLMJSONResult, (prompt_tokens, completion_tokens)).
+
+    Raises:
+        llm_json.LLMJSONError: If the response holds no parseable JSON.
+    """
+    response = client.chat.completions.create(
+        model=deployment,
+        messages=build_vision_messages(crop.data_url, crop.detail, target_lang_code, source_lang_code),
+        max_tokens=1000,
+        temperature=0.3
+    )
+    usage = record_usage(response, "get_object_details_batch.fallback")
+    content = response.choices[0].message.content if response.choices else None
+    parse_result = llm_json.parse(content, details_schema(target_lang_code, source_lang_code), name="get_object_details.llm_json")
+    return parse_result, usage
+
+
+def _error_item(index, filename, status_code, message, **extra):
+    item = {"index": index, "filename": filename, "status": status_code, "error": message}
+    item.update(extra)
+    return item
+
+def _prepare_crop(index, image_file, image_bytes, image_hashes):
+    """
+    Runs the input safety check and the vision payload optimizer for one crop.
+
+    Returns (PreparedCrop, None) or (None, error_item) if Content Safety blocks the image.
+    """
+    image_verified = False
+    if content_safety.is_configured():
+        try:
+            image_verdict = content_safety.analyze_image(upload_ingest.as_sdk_buffer(image_bytes))
+            if image_verdict.blocked:
+                logging.warning(f"Batch crop {index} blocked by Content Safety. Categories: {', '.join(image_verdict.blocked_categories)}")
+                return None, _error_item(index, image_file.filename, 400, "Uploaded image contains inappropriate content.", details=image_verdict.details)
+            image_verified = True
+        except HttpResponseError as cs_http_err:
+            logging.error(f"Azure AI Content Safety HTTPError for batch crop {index}: {cs_http_err.message}", exc_info=True)
+        except Exception as cs_img_err:
+            logging.error(f"Error during Azure AI Content Safety analysis of batch crop {index}: {cs_img_err}", exc_info=True)
+
+    mimetype = image_file.content_type or "image/jpeg"
+    detail = "auto"
+    if VISION_OPTIMIZE_ENABLED:
+        try:
+            optimized_image = image_optimizer.optimize_for_vision(
+                image_bytes,
+                low_detail_max_side=VISION_LOW_DETAIL_MAX_SIDE,
+                target_bytes=VISION_TARGET_BYTES,
+                image_format=VISION_IMAGE_FORMAT,
+                min_quality=VISION_MIN_QUALITY,
+                max_quality=VISION_MAX_QUALITY
+            )
+            image_bytes, mimetype, detail = optimized_image.image_bytes, optimized_image.mimetype, optimized_image.detail
+        except Exception as optimize_err:
+            logging.warning(f"Vision payload optimizer failed for batch crop {index}, sending the original upload: {optimize_err}")
+    crop = PreparedCrop(index, image_file.filename, image_optimizer.to_data_url(image_bytes, mimetype), detail, image_hashes, image_verified)
+    return crop, None
+
+def _fallback_item(client, deployment, crop, target_lang_code, source_lang_code):
+    """
+    Returns (status_code, details_or_error, complete) from a per-crop call.
+    """
+    try:
+        parse_result, _ = request_single_details(client, deployment, crop, target_lang_code, source_lang_code)
+    except llm_json.LLMJSONError as json_err:
+        logging.error(f"Fallback call for batch crop {crop.index} returned malformed JSON: {json_err}")
+        return 500, {"error": "AI model returned non-JSON content or malformed JSON."}, False
+    except Exception as e_openai:
+        logging.error(f"Error calling Azure OpenAI for batch crop {crop.index}: {e_openai}", exc_info=True)
+        return 500, {"error": "Error communicating with AI model."}, False
+    return 200, parse_result.value, not parse_result.repaired
+
+def _verify_outputs(details_by_index):
+    """
+    Runs the output safety check and returns the set of crop indices that were blocked.
+
+    All items are checked in one analyze_texts call first; only if that verdict blocks are the
+    items checked one by one, so a single unsafe item does not take the others down with it.
+
+    Raises:
+        Exception: As content_safety.analyze_texts.
+    """
+    texts = [text for details in details_by_index.values() for text in details_texts(details)]
+    if not texts or not content_safety.analyze_texts(texts).blocked:
+        return set()
+    blocked = set()
+    for index, details in details_by_index.items():
+        verdict = content_safety.analyze_texts(details_texts(details))
+        if verdict.blocked:
+            logging.warning(f"Generated details for batch crop {index} blocked by Content Safety. Categories: {', '.join(verdict.blocked_categories)}")
+            blocked.add(index)
+    return blocked
+
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request for GetObjectDetailsVisualBatch.')
+    request_start = time.perf_counter()
+
+    try:
+        openai_endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+        openai_key = os.environ.get("AZURE_OPENAI_KEY")
+        openai_deployment_name = os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME")
+        if not all([openai_endpoint, openai_key, openai_deployment_name]):
+            logging.error("Konfigurasi Azure OpenAI tidak lengkap.")
+            return func.HttpResponse(json.dumps({"error": "Server configuration missing for OpenAI."}), mimetype="application/json", status_code=500)
+
+        max_request_bytes = MAX_OBJECT_DETAILS_BATCH_UPLOAD_SIZE_BYTES + MAX_OBJECT_DETAILS_BATCH_IMAGES * upload_ingest.MULTIPART_OVERHEAD_BYTES
+        if upload_ingest.check_request_size(req, max_request_bytes, "Batch"):
+            return upload_ingest.too_large_response("Total batch", MAX_OBJECT_DETAILS_BATCH_UPLOAD_SIZE_BYTES)
+
+        image_files = req.files.getlist('image')
+        target_lang_code = req.form.get('targetLanguage', req.params.get('targetLanguage', 'en'))
+        source_lang_code = req.form.get('sourceLanguage', req.params.get('sourceLanguage', 'id'))
+        if not image_files:
+            logging.warning("No image files found in batch request.")
+            return func.HttpResponse(json.dumps({"error": "At least one image file is required."}), mimetype="application/json", status_code=400)
+        if len(image_files) > MAX_OBJECT_DETAILS_BATCH_IMAGES:
+            logging.warning(f"Batch contains {len(image_files)} images, limit is {MAX_OBJECT_DETAILS_BATCH_IMAGES}.")
+            return func.HttpResponse(
+                json.dumps({"error": f"A batch may contain at most {MAX_OBJECT_DETAILS_BATCH_IMAGES} images."}),
+                mimetype="application/json",
+                status_code=413
+            )
+
+        # 1. Baca & validasi setiap crop, layani yang sudah ada di cache perceptual hash
+        results = [None] * len(image_files)
+        pending = []
+        total_bytes = 0
+        cache_bucket = f"{OBJECT_DETAILS_PROMPT_VERSION}|{openai_deployment_name}|{target_lang_code}|{source_lang_code}"
+        for index, image_file in enumerate(image_files):
+            read_limit = min(MAX_IMAGE_UPLOAD_SIZE_BYTES, MAX_OBJECT_DETAILS_BATCH_UPLOAD_SIZE_BYTES - total_bytes)
+            try:
+                image_bytes = upload_ingest.read_upload(image_file, read_limit)
+            except upload_ingest.UploadTooLargeError:
+                if read_limit < MAX_IMAGE_UPLOAD_SIZE_BYTES:
+                    logging.warning(f"Batch upload size exceeds limit of {MAX_OBJECT_DETAILS_BATCH_UPLOAD_SIZE_BYTES / (1024*1024):.2f}MB.")
+                    return upload_ingest.too_large_response("Total batch", MAX_OBJECT_DETAILS_BATCH_UPLOAD_SIZE_BYTES)
+                results[index] = _error_item(index, image_file.filename, 413, f"Image size exceeds the limit of {MAX_IMAGE_UPLOAD_SIZE_BYTES // (1024*1024)}MB.")
+                continue
+            total_bytes += len(image_bytes)
+
+            if not image_bytes:
+                results[index] = _error_item(index, image_file.filename, 400, "Image file cannot be empty.")
+                continue
+            if upload_ingest.sniff_mimetype(image_bytes, upload_ingest.IMAGE_SIGNATURES) is None:
+                results[index] = _error_item(index, image_file.filename, 415, "Image file format is not supported or the file is corrupted.")
+                continue
+
+            image_hashes = None
+            if object_details_cache is not None:
+                try:
+                    image_hashes = phash_cache.compute_hashes(image_bytes)
+                    cached_details, _ = object_details_cache.lookup(cache_bucket, *image_hashes)
+                    if cached_details is not None:
+                        results[index] = {"index": index, "filename": image_file.filename, "status": 200, **cached_details}
+                        continue
+                except Exception as hash_err:
+                    logging.warning(f"Perceptual hash lookup failed for batch crop {index}: {hash_err}")
+                    image_hashes = None
+            pending.append((index, image_file, image_bytes, image_hashes))
+
+        # 2. Content Safety gambar + optimasi payload per crop (paralel)
+        crops = []
+        for crop, error_item in batch_executor.map(lambda args: _prepare_crop(*args), pending):
+            if error_item is not None:
+                results[error_item["index"]] = error_item
+            else:
+                crops.append(crop)
+        del pending
+
+        # 3. Satu chat completion multi-gambar untuk semua crop; crop yang hilang/rusak di respons batch diulang per crop
+        client = clients.get_openai_client(openai_endpoint, openai_key, api_version="2024-02-01")
+        details_by_index = {}
+        if len(crops) > 1:
+            try:
+                details_by_index, (prompt_tokens, completion_tokens) = request_batch_details(
+                    client, openai_deployment_name, crops, target_lang_code, source_lang_code
+                )
+                logging.info(
+                    f"Object details batch usage: {len(crops)} crops, prompt_tokens={prompt_tokens} ({prompt_tokens / len(crops):.0f}/object), "
+                    f"completion_tokens={completion_tokens} ({completion_tokens / len(crops):.0f}/object), usable items={len(details_by_index)}."
+                )
+            except llm_json.LLMJSONError as json_err:
+                logging.warning(f"Batch response is malformed, falling back to per-crop calls: {json_err}")
+            except Exception as e_openai:
+                logging.error(f"Error calling Azure OpenAI for object details batch, falling back to per-crop calls: {e_openai}", exc_info=True)
+        complete = set(details_by_index)
+
+        fallback_crops = [crop for crop in crops if crop.index not in details_by_index]
+        if fallback_crops:
+            if len(crops) > 1:
+                logging.info(f"Falling back to per-crop calls for {len(fallback_crops)} of {len(crops)} crops.")
+            fallback_results = batch_executor.map(
+                lambda crop: _fallback_item(client, openai_deployment_name, crop, target_lang_code, source_lang_code), fallback_crops
+            )
+            for crop, (status_code, payload, payload_complete) in zip(fallback_crops, fallback_results):
+                if status_code == 200:
+                    details_by_index[crop.index] = payload
+                    if payload_complete:
+                        complete.add(crop.index)
+                else:
+                    results[crop.index] = {"index": crop.index, "filename": crop.filename, "status": status_code, **payload}
+
+        # 4. Filter keamanan teks output per item
+        output_verified = content_safety.is_configured()
+        blocked = set()
+        if output_verified:
+            try:
+                blocked = _verify_outputs(details_by_index)
+            except Exception as output_safety_err:
+                logging.error(f"Error during content safety analysis for batch object details: {output_safety_err}", exc_info=True)
+                for index in details_by_index:
+                    results[index] = _error_item(index, image_files[index].filename, 500, "Failed to verify safety of generated object details.")
+                details_by_index = {}
+
+        for crop in crops:
+            if crop.index not in details_by_index:
+                continue
+            details = details_by_index[crop.index]
+            if crop.index in blocked:
+                results[crop.index] = _error_item(crop.index, crop.filename, 500, "Generated object details were found to be inappropriate and has been blocked.")
+                continue
+            if crop.hashes is not None and crop.image_verified and output_verified and details and crop.index in complete:
+                object_details_cache.store(cache_bucket, *crop.hashes, details)
+            results[crop.index] = {"index": crop.index, "filename": crop.filename, "status": 200, **details}
+
+        logging.info(f"GetObjectDetailsVisualBatch processed {len(results)} crops in {(time.perf_counter() - request_start) * 1000:.1f}ms.")
+        return func.HttpResponse(json.dumps({"results": results}), mimetype="application/json", status_code=200)
+
+    except ValueError as ve:
+        logging.error(f"ValueError: {str(ve)}")
+        return func.HttpResponse(json.dumps({"error": f"Invalid input: {str(ve)}"}), mimetype="application/json", status_code=400)
+    except Exception as e:
+        logging.error(f"An unexpected error occurred in GetObjectDetailsVisualBatch: {e}", exc_info=True)
+        return func.HttpResponse(json.dumps({"error": "An unexpected error occurred."}), mimetype="application/json", status_code=500)
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from shared_code import metrics
+
+# 80 label COCO yang bisa dikeluarkan facebook/detr-resnet-50 (id2label tanpa entri "N/A")
+COCO_LABELS = (
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
+    "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow",
+    "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
+    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket", "bottle",
+    "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange",
+    "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch", "potted plant", "bed",
+    "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone", "microwave", "oven",
+    "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors", "teddy bear", "hair drier", "toothbrush",
+)
+
+# Format file (little-endian):
+#   header : magic (8s), version (H), reserved (H), entry_count (I)
+#   index  : entry_count x (key_hash (Q), offset (I), length (I)), terurut menurut key_hash
+#   data   : blob JSON UTF-8 per entri, offset relatif terhadap awal data
+# Lookup = binary search di index lewat mmap, jadi hanya halaman yang disentuh yang dimuat ke memori.
+MAGIC = b"BISBICAT"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sHHI")
+_ENTRY = struct.Struct("<QII")
+
+
+class CatalogFormatError(ValueError):
+    """
+    Raised when a catalog file is missing its header or is otherwise malformed.
+    """
+
+
+def normalize_label(label):
+    return " ".join(str(label).strip().lower().split())
+
+def catalog_key(label, target_lang_code, source_lang_code):
+    return f"{normalize_label(label)}|{target_lang_code}|{source_lang_code}"
+
+def _key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+def write_catalog(path, entries):
+    """
+    Writes a catalog file atomically (temp file + os.replace).
+
+    Args:
+        path (str): Destination path.
+        entries (iterable): (label, target_lang_code, source_lang_code, details) tuples.
+
+    Returns:
+        int: Number of entries written.
+    """
+    records = {}
+    for label, target_lang_code, source_lang_code, details in entries:
+        key = catalog_key(label, target_lang_code, source_lang_code)
+        blob = json.dumps({"key": key, "details": details}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        records[_key_hash(key)] = blob
+
+    index = bytearray()
+    data = bytearray()
+    for key_hash in sorted(records):
+        blob = records[key_hash]
+        index += _ENTRY.pack(key_hash, len(data), len(blob))
+        data += blob
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".catalog-")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(records)))
+            tmp_file.write(index)
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(records)
+
+
+class ObjectCatalog:
+    """
+    Read-only, memory-mapped catalog of precomputed object details keyed by
+    (detector label, target language, source language).
+
+    The file is shared between worker processes through the page cache. Lookups are counted in
+    shared_code.metrics as `<name>.hit` and `<name>.miss`.
+    """
+
+    def __init__(self, path, name="object_details_catalog"):
+        self.path = path
+        self.name = name
+        with open(path, "rb") as catalog_file:
+            self._mm = mmap.mmap(catalog_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mm) < _HEADER.size:
+                raise CatalogFormatError(f"Catalog file '{path}' is too small.")
+            magic, version, _, self._count = _HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise CatalogFormatError(f"Catalog file '{path}' has an unknown format (magic={magic!r}, version={version}).")
+            self._data_start = _HEADER.size + self._count * _ENTRY.size
+            if len(self._mm) < self._data_start:
+                raise CatalogFormatError(f"Catalog file '{path}' is truncated.")
+        except CatalogFormatError:
+            self._mm.close()
+            raise
+
+    def __len__(self):
+        return self._count
+
+    def _find(self, key_hash):
+        low, high = 0, self._count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            entry_hash, offset, length = _ENTRY.unpack_from(self._mm, _HEADER.size + middle * _ENTRY.size)
+            if entry_hash == key_hash:
+                return offset, length
+            if entry_hash < key_hash:
+                low = middle + 1
+            else:
+                high = middle - 1
+        return None
+
+    def lookup(self, label, target_lang_code, source_lang_code):
+        """
+        Returns the precomputed details dict for the label and language pair, or None.
+        """
+        key = catalog_key(label, target_lang_code, source_lang_code)
+        found = self._find(_key_hash(key))
+        if found is not None:
+            offset, length = found
+            start = self._data_start + offset
+            record = json.loads(self._mm[start:start + length])
+            if record.get("key") == key: # Tabrakan hash 64-bit praktis mustahil, tetapi tetap diverifikasi
+                metrics.increment(f"{self.name}.hit")
+                return record["details"]
+        metrics.increment(f"{self.name}.miss")
+        return None
+
+    def close(self):
+        self._mm.close()
+
+
+def load_catalog(path, name="object_details_catalog"):
+    """
+    Opens the catalog at path. Returns None (catalog mode disabled) if the file does not exist
+    or cannot be read.
+    """
+    if not path or not os.path.exists(path):
+        logging.info(f"Object details catalog not found at '{path}', catalog mode disabled.")
+        return None
+    try:
+        catalog = ObjectCatalog(path, name=name)
+    except (OSError, ValueError) as catalog_err:
+        logging.error(f"Failed to load object details catalog '{path}': {catalog_err}", exc_info=True)
+        return None
+    logging.info(f"Object details catalog loaded: {len(catalog)} entries from {path}.")
+    return catalog
@@ -0,0 +1,211 @@
+import binascii
+import io
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+from PIL import ExifTags, Image, ImageOps, features
+
+# Aturan tokenisasi gambar model vision GPT-4o/4.1:
+# - detail "low": gambar dilihat pada 512x512, biaya tetap 85 token
+# - detail "high": di-fit ke 2048x2048, lalu sisi terpendek diperkecil ke 768; 170 token per tile 512px + 85
+LOW_DETAIL_SIDE = 512
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+TILE_SIDE = 512
+BASE_TOKENS = 85
+TOKENS_PER_TILE = 170
+
+SUPPORTED_FORMATS = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+# Orientasi EXIF 5-8 memutar gambar 90/270 derajat: lebar dan tinggi tertukar saat ditampilkan
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+@dataclass
+class OptimizedImage:
+    """
+    Result of preparing an object crop for the vision model.
+
+    Attributes:
+        image_bytes (bytes): Bytes to inline in the data URL.
+        mimetype (str): Mimetype of image_bytes.
+        detail (str): Vision detail level to request ("low" or "high").
+        original_size (tuple): (width, height) of the upload.
+        sent_size (tuple): (width, height) of the image that is sent.
+        original_bytes (int): Size of the upload.
+        quality (int): Encoder quality used (None if the upload was forwarded as is).
+        original_tokens (int): Estimated image tokens for the upload at detail "high".
+        sent_tokens (int): Estimated image tokens for the sent image at `detail`.
+        elapsed_ms (float): Time spent optimizing.
+    """
+    image_bytes: bytes
+    mimetype: str
+    detail: str
+    original_size: tuple
+    sent_size: tuple
+    original_bytes: int
+    quality: int
+    original_tokens: int
+    sent_tokens: int
+    elapsed_ms: float
+
+    @property
+    def passthrough(self):
+        return self.quality is None
+
+
+def _fit_within(size, max_side):
+    width, height = size
+    longest = max(width, height)
+    if longest <= max_side:
+        return size
+    ratio = max_side / longest
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+def high_detail_size(size):
+    """
+    Returns the (width, height) the vision model works with at detail "high".
+    """
+    width, height = _fit_within(size, HIGH_DETAIL_MAX_SIDE)
+    shortest = min(width, height)
+    if shortest > HIGH_DETAIL_SHORT_SIDE:
+        ratio = HIGH_DETAIL_SHORT_SIDE / shortest
+        width, height = max(1, round(width * ratio)), max(1, round(height * ratio))
+    return width, height
+
+def estimate_image_tokens(size, detail):
+    """
+    Estimates the prompt tokens billed for an image of the given size and detail level.
+    """
+    if detail == "low":
+        return BASE_TOKENS
+    width, height = high_detail_size(size)
+    return BASE_TOKENS + TOKENS_PER_TILE * math.ceil(width / TILE_SIDE) * math.ceil(height / TILE_SIDE)
+
+def _encode(pil_image, image_format, quality):
+    buffer = io.BytesIO()
+    if image_format == "WEBP":
+        pil_image.save(buffer, format="WEBP", quality=quality, method=3)
+    else:
+        pil_image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+def _encode_to_target(pil_image, image_format, target_bytes, min_quality, max_quality):
+    """
+    Binary-searches the highest quality in [min_quality, max_quality] whose output fits
+    target_bytes. Falls back to min_quality if nothing fits.
+    """
+    best = None
+    low, high = min_quality, max_quality
+    while low <= high:
+        quality = (low + high) // 2
+        encoded = _encode(pil_image, image_format, quality)
+        if len(encoded) <= target_bytes:
+            best = (encoded, quality)
+            low = quality + 1
+        else:
+            high = quality - 1
+    if best is None:
+        best = (_encode(pil_image, image_format, min_quality), min_quality)
+    return best
+
+def optimize_for_vision(image_bytes, low_detail_max_side=LOW_DETAIL_SIDE, target_bytes=150 * 1024,
+                        image_format="JPEG", min_quality=50, max_quality=90):
+    """
+    Downsizes an object crop to the resolution the vision model actually uses and re-encodes
+    it with the highest quality that fits target_bytes.
+
+    Crops whose longest side is at most low_detail_max_side are sent with detail "low" (fit
+    into 512x512, fixed 85 tokens); larger crops use detail "high" at the size the model
+    would resize them to anyway. Sizes are those of the upright image: the EXIF orientation
+    (photos taken in portrait) is applied before resizing, because the re-encoded image has
+    no EXIF. JPEG uploads that are already upright, have the target size and fit target_bytes
+    are forwarded without re-encoding.
+
+    Args:
+        image_bytes (bytes): The uploaded image (already checked by Content Safety).
+        low_detail_max_side (int): Longest side up to which detail "low" is used (0 disables it).
+        target_bytes (int): Size target for the encoded image.
+        image_format (str): "JPEG" or "WEBP" (WEBP falls back to JPEG if Pillow lacks support).
+        min_quality (int), max_quality (int): Quality range searched.
+
+    Returns:
+        OptimizedImage
+
+    Raises:
+        PIL.UnidentifiedImageError, OSError: If the image cannot be decoded.
+    """
+    start = time.perf_counter()
+    image_format = image_format.upper()
+    if image_format not in SUPPORTED_FORMATS or (image_format == "WEBP" and not features.check("webp")):
+        image_format = "JPEG"
+
+    pil_image = Image.open(io.BytesIO(image_bytes)) # Lazy: hanya header yang dibaca
+    orientation = pil_image.getexif().get(ExifTags.Base.Orientation, 1)
+    stored_size = pil_image.size
+    original_size = stored_size[::-1] if orientation in _ROTATED_ORIENTATIONS else stored_size # Ukuran tegak
+    detail = "low" if max(original_size) <= low_detail_max_side else "high"
+    target_size = _fit_within(original_size, LOW_DETAIL_SIDE) if detail == "low" else high_detail_size(original_size)
+    original_tokens = estimate_image_tokens(original_size, "high")
+
+    def result(data, mimetype, sent_size, quality):
+        return OptimizedImage(
+            image_bytes=data,
+            mimetype=mimetype,
+            detail=detail,
+            original_size=original_size,
+            sent_size=sent_size,
+            original_bytes=len(image_bytes),
+            quality=quality,
+            original_tokens=original_tokens,
+            sent_tokens=estimate_image_tokens(sent_size, detail),
+            elapsed_ms=(time.perf_counter() - start) * 1000,
+        )
+
+    if (pil_image.format == "JPEG" and pil_image.mode == "RGB" and orientation == 1 and target_size == original_size
+            and len(image_bytes) <= target_bytes):
+        return result(bytes(image_bytes), "image/jpeg", original_size, None)
+
+    if pil_image.format == "JPEG" and target_size != original_size:
+        # Decode JPEG pada skala 1/2, 1/4 atau 1/8 jika cukup; draft() bekerja pada orientasi tersimpan
+        pil_image.draft("RGB", target_size[::-1] if orientation in _ROTATED_ORIENTATIONS else target_size)
+    if orientation != 1:
+        pil_image = ImageOps.exif_transpose(pil_image)
+    if pil_image.mode in ("RGBA", "LA", "P"):
+        # Transparansi diratakan ke latar putih (JPEG tidak punya alpha)
+        rgba_image = pil_image.convert("RGBA")
+        pil_image = Image.new("RGB", rgba_image.size, (255, 255, 255))
+        pil_image.paste(rgba_image, mask=rgba_image.getchannel("A"))
+    elif pil_image.mode != "RGB":
+        pil_image = pil_image.convert("RGB")
+    if pil_image.size != target_size:
+        pil_image = pil_image.resize(target_size, Image.LANCZOS, reducing_gap=3.0)
+
+    encoded, quality = _encode_to_target(pil_image, image_format, target_bytes, min_quality, max_quality)
+    return result(encoded, SUPPORTED_FORMATS[image_format], pil_image.size, quality)
+
+def to_data_url(image_bytes, mimetype):
+    """
+    Builds the base64 data URL. The prefix is joined in bytes, so the only str built is the
+    final URL (no intermediate base64 str and f-string copy).
+    """
+    encoded = binascii.b2a_base64(image_bytes, newline=False)
+    return b"".join((b"data:", mimetype.encode("ascii"), b";base64,", encoded)).decode("ascii")
+
+def base64_length(byte_count):
+    return 4 * math.ceil(byte_count / 3)
+
+def log_optimization(optimized):
+    """
+    Logs the before/after payload bytes (as base64) and estimated image tokens.
+    """
+    original_b64 = base64_length(optimized.original_bytes)
+    sent_b64 = base64_length(len(optimized.image_bytes))
+    logging.info(
+        f"Vision payload optimizer: passthrough={optimized.passthrough}, detail={optimized.detail}, quality={optimized.quality}, "
+        f"original={optimized.original_size[0]}x{optimized.original_size[1]}, sent={optimized.sent_size[0]}x{optimized.sent_size[1]}, "
+        f"base64_bytes={original_b64}->{sent_b64} ({sent_b64 - original_b64:+d}), "
+        f"est_tokens={optimized.original_tokens}->{optimized.sent_tokens} ({optimized.sent_tokens - optimized.original_tokens:+d}), "
+        f"optimize_ms={optimized.elapsed_ms:.1f}"
+    )
@@ -0,0 +1,227 @@
+import io
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from shared_code import metrics
+
+HASH_BITS = 64
+_DCT_SIZE = 32
+_DCT_LOW_FREQUENCIES = 8
+
+
+def _dct_matrix(size):
+    # Matriks DCT-II ortonormal: DCT 2D = M @ X @ M.T
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * math.sqrt(2 / size)
+    matrix[0] /= math.sqrt(2)
+    return matrix
+
+_DCT_MATRIX = _dct_matrix(_DCT_SIZE)
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+def compute_hashes(image_bytes):
+    """
+    Returns the 64-bit (pHash, dHash) of an image.
+
+    pHash: signs of the 8x8 lowest DCT frequencies of a 32x32 grayscale version relative to
+    their median. dHash: horizontal gradient signs of a 9x8 grayscale version. Both survive
+    re-encoding, small crops/shifts and brightness changes.
+
+    Raises:
+        PIL.UnidentifiedImageError, OSError: If the image cannot be decoded.
+    """
+    pil_image = Image.open(io.BytesIO(image_bytes))
+    pil_image.draft("L", (_DCT_SIZE * 2, _DCT_SIZE * 2)) # JPEG: decode langsung pada skala 1/8 jika cukup
+    grayscale = pil_image.convert("L")
+
+    pixels = np.asarray(grayscale.resize((_DCT_SIZE, _DCT_SIZE), Image.BILINEAR, reducing_gap=2.0), dtype=np.float64)
+    low = (_DCT_MATRIX @ pixels @ _DCT_MATRIX.T)[:_DCT_LOW_FREQUENCIES, :_DCT_LOW_FREQUENCIES].ravel()
+    phash = _bits_to_int(low > np.median(low[1:])) # Komponen DC tidak ikut menentukan median
+
+    gradient = np.asarray(grayscale.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    dhash = _bits_to_int(gradient[:, 1:] > gradient[:, :-1])
+    return phash, dhash
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class MultiIndexHashIndex:
+    """
+    Multi-index hashing over 64-bit hashes for Hamming-radius search.
+
+    Each hash is split into max_distance + 1 disjoint substrings. By the pigeonhole principle
+    any hash within max_distance bits of the query equals it exactly on at least one
+    substring, so candidates come from max_distance + 1 dict lookups and are then verified
+    with the full Hamming distance. Unlike a BK-tree, removal is O(1), which keeps LRU
+    eviction cheap.
+    """
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        chunk_count = max_distance + 1
+        bounds = [round(i * HASH_BITS / chunk_count) for i in range(chunk_count + 1)]
+        self._chunks = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])] # (shift, mask)
+        self._tables = [{} for _ in self._chunks] # (bucket, substring) -> set(item_id)
+
+    def _keys(self, bucket, value):
+        return [(bucket, (value >> shift) & mask) for shift, mask in self._chunks]
+
+    def add(self, bucket, value, item_id):
+        for table, key in zip(self._tables, self._keys(bucket, value)):
+            table.setdefault(key, set()).add(item_id)
+
+    def remove(self, bucket, value, item_id):
+        for table, key in zip(self._tables, self._keys(bucket, value)):
+            items = table.get(key)
+            if items is not None:
+                items.discard(item_id)
+                if not items:
+                    del table[key]
+
+    def candidates(self, bucket, value):
+        """
+        Returns the ids of all items sharing at least one substring with value (a superset of
+        the items within max_distance).
+        """
+        found = set()
+        for table, key in zip(self._tables, self._keys(bucket, value)):
+            found.update(table.get(key, ()))
+        return found
+
+
+class PerceptualHashCache:
+    """
+    Bounded LRU cache of values keyed by (bucket, pHash), where lookups match any entry
+    within max_distance bits of pHash whose dHash is also within dhash_max_distance.
+
+    Entries expire after ttl_seconds. With sqlite_path, entries are written through to a
+    SQLite table and the most recent max_entries are reloaded at startup; entries evicted
+    from memory are deleted from the table too, so the file stays bounded as well.
+
+    Lookups are counted in shared_code.metrics as `<name>.hit` (exact pHash), `<name>.near_hit`
+    and `<name>.miss`.
+    """
+
+    def __init__(self, name, max_entries=10000, ttl_seconds=30 * 86400, max_distance=6, dhash_max_distance=10, sqlite_path=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.dhash_max_distance = dhash_max_distance
+        self._index = MultiIndexHashIndex(max_distance)
+        self._entries = OrderedDict() # item_id -> (bucket, phash, dhash, expires_at, value)
+        self._exact = {} # (bucket, phash) -> item_id
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if sqlite_path:
+            try:
+                self._open_sqlite(sqlite_path)
+            except Exception as db_err:
+                logging.error(f"Failed to open SQLite perceptual cache '{sqlite_path}' for {name}: {db_err}", exc_info=True)
+                self._conn = None
+
+    @property
+    def max_distance(self):
+        return self._index.max_distance
+
+    def _open_sqlite(self, path):
+        if not self.name.isidentifier():
+            raise ValueError(f"Invalid SQLite table name: {self.name}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Hash 64-bit disimpan sebagai hex: INTEGER SQLite bertanda dan hanya 63 bit positif
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.name} (bucket TEXT NOT NULL, phash TEXT NOT NULL, dhash TEXT NOT NULL, "
+            f"value TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (bucket, phash))"
+        )
+        self._conn.execute(f"DELETE FROM {self.name} WHERE expires_at <= ?", (time.time(),))
+        self._conn.commit()
+        rows = self._conn.execute(
+            f"SELECT bucket, phash, dhash, value, expires_at FROM {self.name} ORDER BY expires_at DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for bucket, phash, dhash, value, expires_at in reversed(rows): # Tertua dulu, agar yang terbaru paling akhir di LRU
+            self._insert(bucket, int(phash, 16), int(dhash, 16), expires_at, json.loads(value))
+        logging.info(f"Perceptual cache {self.name}: loaded {len(rows)} entries from {path}.")
+
+    def _persist(self, statement, params):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(statement, params)
+            self._conn.commit()
+        except sqlite3.Error as db_err:
+            logging.warning(f"Perceptual cache {self.name}: SQLite write failed: {db_err}")
+
+    def _insert(self, bucket, phash, dhash, expires_at, value):
+        existing = self._exact.get((bucket, phash))
+        if existing is not None:
+            self._remove(existing, persist=False)
+        item_id = self._next_id
+        self._next_id += 1
+        self._entries[item_id] = (bucket, phash, dhash, expires_at, value)
+        self._exact[(bucket, phash)] = item_id
+        self._index.add(bucket, phash, item_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, item_id, persist=True):
+        bucket, phash, _, _, _ = self._entries.pop(item_id)
+        del self._exact[(bucket, phash)]
+        self._index.remove(bucket, phash, item_id)
+        if persist:
+            self._persist(f"DELETE FROM {self.name} WHERE bucket = ? AND phash = ?", (bucket, f"{phash:016x}"))
+
+    def lookup(self, bucket, phash, dhash):
+        """
+        Returns (value, distance) of the closest live entry in bucket, or (None, None).
+        """
+        now = time.time()
+        best_id, best_distance = None, None
+        with self._lock:
+            for item_id in self._index.candidates(bucket, phash):
+                _, entry_phash, entry_dhash, expires_at, _ = self._entries[item_id]
+                distance = hamming_distance(phash, entry_phash)
+                if distance > self._index.max_distance or hamming_distance(dhash, entry_dhash) > self.dhash_max_distance:
+                    continue
+                if expires_at <= now:
+                    self._remove(item_id)
+                    continue
+                if best_distance is None or distance < best_distance:
+                    best_id, best_distance = item_id, distance
+            if best_id is None:
+                metrics.increment(f"{self.name}.miss")
+                return None, None
+            self._entries.move_to_end(best_id)
+            value = self._entries[best_id][4]
+        metrics.increment(f"{self.name}.{'hit' if best_distance == 0 else 'near_hit'}")
+        return value, best_distance
+
+    def store(self, bucket, phash, dhash, value):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._insert(bucket, phash, dhash, expires_at, value)
+            self._persist(
+                f"INSERT OR REPLACE INTO {self.name} (bucket, phash, dhash, value, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (bucket, f"{phash:016x}", f"{dhash:016x}", json.dumps(value, separators=(",", ":")), expires_at)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
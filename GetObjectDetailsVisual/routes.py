@@ -1,6 +1,7 @@
 import azure.functions as func
 import logging
 from . import main as get_object_details_main
+from .batch import main as get_object_details_batch_main
 
 # Create Blueprint
 bp = func.Blueprint()
@@ -8,4 +9,9 @@ bp = func.Blueprint()
 @bp.route(route="GetObjectDetailsVisual", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
 def GetObjectDetailsVisual_handler(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Blueprint: Routing to GetObjectDetailsVisual")
-    return get_object_details_main(req)
\ No newline at end of file
+    return get_object_details_main(req)
+
+@bp.route(route="GetObjectDetailsVisualBatch", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
+def GetObjectDetailsVisualBatch_handler(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Blueprint: Routing to GetObjectDetailsVisualBatch")
+    return get_object_details_batch_main(req)
@@ -1,10 +1,275 @@
 import logging
 import os
 import json
+import time
 import azure.functions as func
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 # Import SDK untuk Azure AI Speech (Text-to-Speech)
 import azure.cognitiveservices.speech as speechsdk
+from shared_code import clients # SpeechConfig bersama per kombinasi voice/format
+from shared_code import metrics
+from . import audio_store, formats, streaming, synthesizer_pool
+
+# Format audio dinegosiasikan per request (field 'format' atau header Accept); tanpa keduanya dipakai format default.
+# Setiap format punya audioId (namespace store) dan synthesizer pool sendiri.
+TTS_DEFAULT_AUDIO_FORMAT = formats.get_format(os.environ.get("TTS_DEFAULT_AUDIO_FORMAT", formats.MP3.name)) or formats.MP3
+
+# Store audio content-addressed (hash teks + voice + format): kosakata yang sama diputar oleh setiap pelajar.
+# File di disk lokal (dibaca lewat mmap) dengan hot tier di memori; keduanya LRU dengan batas byte.
+TTS_AUDIO_STORE_ENABLED = os.environ.get("TTS_AUDIO_STORE_ENABLED", "true").lower() == "true"
+TTS_AUDIO_STORE_PATH = os.environ.get("TTS_AUDIO_STORE_PATH", "/tmp/bisbi/tts_audio")
+TTS_AUDIO_STORE_DISK_BYTES = int(os.environ.get("TTS_AUDIO_STORE_DISK_BYTES", 512 * 1024 * 1024))
+TTS_AUDIO_STORE_MEMORY_BYTES = int(os.environ.get("TTS_AUDIO_STORE_MEMORY_BYTES", 32 * 1024 * 1024))
+TTS_AUDIO_CACHE_CONTROL = os.environ.get("TTS_AUDIO_CACHE_CONTROL", "public, max-age=86400")
+
+# GetTTSAudioStream: potongan MP3 dikirim begitu event `synthesizing` masuk; batas tunggu antar potongan
+TTS_STREAM_CHUNK_TIMEOUT_SECONDS = int(os.environ.get("TTS_STREAM_CHUNK_TIMEOUT_SECONDS", 30))
+
+# Pool SpeechSynthesizer hangat per region/kunci/voice/format dengan koneksi yang sudah dibuka lebih dulu
+# (Connection.open), jadi request tidak membayar konstruksi synthesizer + handshake WebSocket.
+TTS_SYNTHESIZER_POOL_ENABLED = os.environ.get("TTS_SYNTHESIZER_POOL_ENABLED", "true").lower() == "true"
+TTS_SYNTHESIZER_POOL_MAX_IDLE_PER_VOICE = int(os.environ.get("TTS_SYNTHESIZER_POOL_MAX_IDLE_PER_VOICE", 2))
+TTS_SYNTHESIZER_POOL_MAX_IDLE_TOTAL = int(os.environ.get("TTS_SYNTHESIZER_POOL_MAX_IDLE_TOTAL", 16))
+TTS_SYNTHESIZER_POOL_MAX_IDLE_SECONDS = int(os.environ.get("TTS_SYNTHESIZER_POOL_MAX_IDLE_SECONDS", 180)) # Layanan menutup koneksi idle
+TTS_SYNTHESIZER_PREWARM_VOICES = [v.strip() for v in os.environ.get("TTS_SYNTHESIZER_PREWARM_VOICES", "id-ID-ArdiNeural,en-US-AvaMultilingualNeural").split(",") if v.strip()]
+
+synthesizer_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tts-synthesizer-warmup")
+tts_synthesizer_pool = synthesizer_pool.SynthesizerPool(
+    max_idle_per_key=TTS_SYNTHESIZER_POOL_MAX_IDLE_PER_VOICE,
+    max_idle_total=TTS_SYNTHESIZER_POOL_MAX_IDLE_TOTAL,
+    max_idle_seconds=TTS_SYNTHESIZER_POOL_MAX_IDLE_SECONDS,
+    executor=synthesizer_executor
+) if TTS_SYNTHESIZER_POOL_ENABLED else None
+
+tts_audio_store = None
+if TTS_AUDIO_STORE_ENABLED:
+    try:
+        tts_audio_store = audio_store.AudioStore(
+            TTS_AUDIO_STORE_PATH,
+            disk_budget_bytes=TTS_AUDIO_STORE_DISK_BYTES,
+            memory_budget_bytes=TTS_AUDIO_STORE_MEMORY_BYTES
+        )
+    except OSError as store_err:
+        logging.error(f"Failed to open TTS audio store at '{TTS_AUDIO_STORE_PATH}', serving without it: {store_err}", exc_info=True)
+
+
+def _synthesizer_key(speech_key, speech_region, voice_name, output_format):
+    return (speech_region, clients.credential_fingerprint(speech_key), voice_name, output_format)
+
+@contextmanager
+def synthesizer_lease(speech_key, speech_region, voice_name, speech_config, audio_format):
+    """
+    Yields (PooledSynthesizer, warm): a warm synthesizer from the pool, or a new one if the pool is disabled.
+    speech_config must have been created for audio_format.
+    """
+    key = _synthesizer_key(speech_key, speech_region, voice_name, audio_format.output_format)
+    if tts_synthesizer_pool is not None:
+        # Setelah pembatalan karena error, synthesizer dibuang dan diganti di background
+        with tts_synthesizer_pool.lease(key, speech_config) as leased:
+            yield leased
+        return
+    # Inisialisasi SpeechSynthesizer. Kita tidak akan menulis ke file, jadi audio_config bisa None.
+    # Hasil audio akan ada di result.audio_data
+    speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+    yield synthesizer_pool.PooledSynthesizer(key, speech_synthesizer, None), False
+
+def resolve_voice(language_code, voice_name=None):
+    """
+    Returns voice_name, or the default voice for language_code (None lets the service pick).
+    """
+    if voice_name:
+        return voice_name
+    # Atur default voice jika tidak ada input (sesuaikan dengan kebutuhan)
+    # Contoh: jika language_code adalah id-ID, pilih suara Indonesia
+    if language_code.lower() == "id-id":
+        return "id-ID-ArdiNeural"
+    elif language_code.lower() == "en-us":
+        return "en-US-AvaMultilingualNeural"
+    # Tambahkan default lain jika perlu
+    return None
+
+def parse_tts_request(req_body, accept_header=None):
+    """
+    Validates a TTS request body and negotiates the output format.
+
+    Returns:
+        tuple: (status_code, payload). payload is (text, language_code, voice_name, audio_format,
+               vary_accept) with the voice resolved if status_code is 200, otherwise an error dict.
+    """
+    if not isinstance(req_body, dict):
+        return 400, {"error": "Harap kirim request body dalam format JSON."}
+    text_to_speak = req_body.get('text')
+    language_code = req_body.get('languageCode')
+    voice_name_input = req_body.get('voiceName') # Opsional
+
+    if not text_to_speak or not language_code:
+        logging.warning("Parameter 'text' atau 'languageCode' tidak ada di request body.")
+        return 400, {"error": "Harap sertakan 'text' dan 'languageCode' dalam request body JSON."}
+    audio_format, vary_accept = formats.negotiate(req_body.get('format'), accept_header, TTS_DEFAULT_AUDIO_FORMAT)
+    if audio_format is None:
+        return 400, {"error": f"Parameter 'format' harus salah satu dari: {', '.join(formats.FORMATS)}."}
+    return 200, (text_to_speak, language_code, resolve_voice(language_code, voice_name_input), audio_format, vary_accept)
+
+def prewarm_synthesizers():
+    """
+    Opens warm synthesizers for TTS_SYNTHESIZER_PREWARM_VOICES in the background (worker startup).
+    """
+    speech_key = os.environ.get("AZURE_AI_SERVICES_KEY")
+    speech_region = os.environ.get("AZURE_AI_SERVICES_REGION")
+    if tts_synthesizer_pool is None or not speech_key or not speech_region:
+        return
+    for voice_name in TTS_SYNTHESIZER_PREWARM_VOICES:
+        speech_config = clients.get_speech_config(speech_key, speech_region, voice_name=voice_name, output_format=TTS_DEFAULT_AUDIO_FORMAT.output_format)
+        tts_synthesizer_pool.prewarm(_synthesizer_key(speech_key, speech_region, voice_name, TTS_DEFAULT_AUDIO_FORMAT.output_format), speech_config)
+
+def _record_first_byte_latency(result, acquire_ms, warm):
+    """
+    Logs and counts the time to the first audio byte: synthesizer acquisition plus the SDK's
+    first-byte latency (which includes connection setup when the connection was not open yet).
+    """
+    try:
+        sdk_first_byte_ms = int(result.properties.get_property(speechsdk.PropertyId.SpeechServiceResponse_SynthesisFirstByteLatencyMs) or 0)
+        connection_ms = int(result.properties.get_property(speechsdk.PropertyId.SpeechServiceResponse_SynthesisConnectionLatencyMs) or 0)
+    except (AttributeError, ValueError):
+        return
+    first_byte_ms = round(acquire_ms) + sdk_first_byte_ms
+    pool_state = "warm" if warm else "cold"
+    metrics.increment(f"get_tts_audio.first_byte_ms.{pool_state}", first_byte_ms)
+    metrics.increment(f"get_tts_audio.syntheses.{pool_state}")
+    logging.info(f"TTS first byte after {first_byte_ms}ms ({pool_state} synthesizer, acquire {acquire_ms:.1f}ms, connection {connection_ms}ms).")
+
+def audio_response(req, blob, vary_accept=False):
+    """
+    Serves a stored AudioBlob with its strong ETag: 304 if If-None-Match matches, 206 for a
+    satisfiable single Range (416 otherwise), 200 with the full body otherwise.
+    """
+    headers = {
+        "ETag": blob.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": TTS_AUDIO_CACHE_CONTROL,
+        "X-Audio-Id": blob.audio_id
+    }
+    if vary_accept:
+        headers["Vary"] = "Accept"
+    with blob:
+        if audio_store.etag_matches(req.headers.get("If-None-Match"), blob.etag):
+            return func.HttpResponse(status_code=304, headers=headers)
+        try:
+            byte_range = audio_store.parse_range(req.headers.get("Range"), blob.size)
+        except audio_store.RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{blob.size}"
+            return func.HttpResponse(status_code=416, headers=headers)
+        if byte_range is None:
+            return func.HttpResponse(body=blob.read(), mimetype=blob.mimetype, status_code=200, headers=headers)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{blob.size}"
+        return func.HttpResponse(body=blob.read(start, end + 1), mimetype=blob.mimetype, status_code=206, headers=headers)
+
+def get_stored_audio(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    GET GetTTSAudio/{audioId}: serves audio previously synthesized by POST GetTTSAudio (id from
+    its X-Audio-Id header), so players can seek with Range requests and revalidate with ETags.
+    """
+    audio_id = (req.route_params.get("audioId") or "").lower()
+    if not audio_store.is_audio_id(audio_id):
+        return func.HttpResponse(json.dumps({"error": "audioId tidak valid."}), mimetype="application/json", status_code=400)
+    blob = tts_audio_store.get(audio_id) if tts_audio_store is not None else None
+    if blob is None:
+        # Sudah tergusur (atau tersimpan di instance lain): klien mengirim ulang POST GetTTSAudio
+        return func.HttpResponse(json.dumps({"error": "Audio tidak ditemukan, minta ulang lewat POST GetTTSAudio."}), mimetype="application/json", status_code=404)
+    return audio_response(req, blob)
+
+def _stream_synthesis(speech_key, speech_region, voice_name, speech_config, audio_format, text_to_speak, audio_id):
+    """
+    Yields audio chunks while the Speech service synthesizes text_to_speak; the complete audio is
+    put into the audio store once the synthesis finished (an aborted stream is not stored).
+    """
+    start = time.perf_counter()
+    chunks = []
+    # Exception apa pun (termasuk GeneratorExit saat klien putus) menandai synthesizer rusak lewat lease
+    with synthesizer_lease(speech_key, speech_region, voice_name, speech_config, audio_format) as (pooled, warm):
+        audio_stream = streaming.AudioChunkStream(pooled.synthesizer, text_to_speak, chunk_timeout_seconds=TTS_STREAM_CHUNK_TIMEOUT_SECONDS)
+        try:
+            for chunk in audio_stream:
+                if not chunks:
+                    first_byte_ms = round((time.perf_counter() - start) * 1000)
+                    metrics.increment("get_tts_audio.stream_first_byte_ms", first_byte_ms)
+                    metrics.increment("get_tts_audio.streams")
+                    logging.info(f"TTS stream first byte after {first_byte_ms}ms ({'warm' if warm else 'cold'} synthesizer).")
+                chunks.append(chunk)
+                yield chunk
+        except streaming.SynthesisCanceledError as cancel_err:
+            logging.error(f"Streaming synthesis canceled ({'after' if cancel_err.audio_sent else 'before'} first audio): {cancel_err}")
+            raise
+        except GeneratorExit:
+            logging.info(f"TTS stream abandoned by client after {len(chunks)} chunk(s).")
+            raise
+
+    audio_data = b"".join(chunks)
+    logging.info(f"Streaming synthesis selesai, {len(audio_data)} bytes dalam {len(chunks)} potongan.")
+    if tts_audio_store is not None and audio_data:
+        tts_audio_store.put(audio_id, audio_data, audio_format.extension)
+
+def _resume_stream(first_chunk, chunks):
+    # Tidak memakai itertools.chain: close() harus diteruskan ke generator sintesis (hentikan sintesis, kembalikan synthesizer)
+    try:
+        if first_chunk:
+            yield first_chunk
+        yield from chunks
+    finally:
+        chunks.close()
+
+def handle_stream_request(req_body, accept_header=None):
+    """
+    Prepares a streamed TTS response for GetTTSAudioStream.
+
+    Returns:
+        tuple: (status_code, body, mimetype, headers). On success body is an iterator of audio
+               chunks (from the audio store, or from the Speech service as it synthesizes);
+               otherwise body is a JSON error string and mimetype is None. Failures before the
+               first audio byte still produce an error response, because the first chunk is
+               awaited here.
+    """
+    speech_key = os.environ.get("AZURE_AI_SERVICES_KEY")
+    speech_region = os.environ.get("AZURE_AI_SERVICES_REGION")
+    if not speech_key or not speech_region:
+        logging.error("Konfigurasi Azure AI Speech (key atau region) tidak lengkap.")
+        return 500, json.dumps({"error": "Error: Server configuration missing for Speech service."}), None, {}
+
+    status_code, parsed = parse_tts_request(req_body, accept_header)
+    if status_code != 200:
+        return status_code, json.dumps(parsed), None, {}
+    text_to_speak, language_code, voice_name, audio_format, vary_accept = parsed
+
+    audio_id = audio_store.audio_key(text_to_speak, voice_name or "", audio_format.output_format.name)
+    headers = {"X-Audio-Id": audio_id, "Cache-Control": "no-cache"}
+    if vary_accept:
+        headers["Vary"] = "Accept"
+    if tts_audio_store is not None:
+        stored_blob = tts_audio_store.get(audio_id)
+        if stored_blob is not None:
+            logging.info(f"TTS audio store hit for stream '{text_to_speak[:50]}' ({stored_blob.size} bytes).")
+            headers["ETag"] = stored_blob.etag
+            return 200, streaming.iter_blob_chunks(stored_blob), stored_blob.mimetype, headers
+
+    speech_config = clients.get_speech_config(speech_key, speech_region, voice_name=voice_name, output_format=audio_format.output_format)
+    logging.info(f"Mensintesis teks (stream): '{text_to_speak}' ke bahasa '{language_code}' ({audio_format.name})...")
+    chunks = _stream_synthesis(speech_key, speech_region, voice_name, speech_config, audio_format, text_to_speak, audio_id)
+    try:
+        first_chunk = next(chunks)
+    except StopIteration:
+        first_chunk = b""
+    except streaming.SynthesisCanceledError as cancel_err:
+        return 500, json.dumps({"error": f"Gagal mensintesis audio: {cancel_err.reason}"}), None, {}
+    except TimeoutError:
+        return 504, json.dumps({"error": "Layanan Speech tidak mengirim audio tepat waktu."}), None, {}
+    return 200, _resume_stream(first_chunk, chunks), audio_format.mimetype, headers
+
+
+prewarm_synthesizers() # Saat worker start, agar request pertama juga mendapat synthesizer hangat
+
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request for GetTTSAudio.')
@@ -25,55 +290,53 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             logging.warning("Request body bukan JSON yang valid.")
             return func.HttpResponse(json.dumps({"error": "Harap kirim request body dalam format JSON."}), mimetype="application/json", status_code=400)
 
-        text_to_speak = req_body.get('text')
-        language_code = req_body.get('languageCode')
-        voice_name_input = req_body.get('voiceName') # Opsional
+        # 3. Validasi input dan tentukan suara (voiceName opsional, default per bahasa)
+        # Format output dari field 'format' atau header Accept (mis. Ogg/Opus untuk data seluler)
+        status_code, parsed = parse_tts_request(req_body, req.headers.get("Accept"))
+        if status_code != 200:
+            return func.HttpResponse(json.dumps(parsed), mimetype="application/json", status_code=status_code)
+        text_to_speak, language_code, voice_name, audio_format, vary_accept = parsed
 
-        if not text_to_speak or not language_code:
-            logging.warning("Parameter 'text' atau 'languageCode' tidak ada di request body.")
-            return func.HttpResponse(
-                json.dumps({"error": "Harap sertakan 'text' dan 'languageCode' dalam request body JSON."}),
-                mimetype="application/json",
-                 status_code=400
-            )
+        # Audio yang sudah pernah disintesis dilayani dari store tanpa memanggil Azure AI Speech
+        audio_id = audio_store.audio_key(text_to_speak, voice_name or "", audio_format.output_format.name)
+        if tts_audio_store is not None:
+            stored_blob = tts_audio_store.get(audio_id)
+            if stored_blob is not None:
+                logging.info(f"TTS audio store hit for '{text_to_speak[:50]}' ({audio_format.name}, {stored_blob.size} bytes).")
+                return audio_response(req, stored_blob, vary_accept)
 
-        # 3. Inisialisasi konfigurasi Azure AI Speech
-        speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=speech_region)
-        
-        # (Opsional) Atur suara jika diberikan oleh klien
-        if voice_name_input:
-            speech_config.speech_synthesis_voice_name = voice_name_input
-        else:
-            # Atur default voice jika tidak ada input (sesuaikan dengan kebutuhan)
-            # Contoh: jika language_code adalah id-ID, pilih suara Indonesia
-            if language_code.lower() == "id-id":
-                speech_config.speech_synthesis_voice_name = "id-ID-ArdiNeural"
-            elif language_code.lower() == "en-us":
-                speech_config.speech_synthesis_voice_name = "en-US-AvaMultilingualNeural"
-            # Tambahkan default lain jika perlu
-
-        # Atur format output audio (misalnya, MP3)
+        # Atur format output audio (lihat GetTTSAudio/formats.py)
         # Daftar format: https://docs.microsoft.com/en-us/python/api/azure-cognitiveservices-speech/azure.cognitiveservices.speech.speechsynthesisoutputformat?view=azure-python
-        speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3)
-
-        # Inisialisasi SpeechSynthesizer. Kita tidak akan menulis ke file, jadi audio_config bisa None.
-        # Hasil audio akan ada di result.audio_data
-        speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        # SpeechConfig dipakai bersama antar request, jadi jangan diubah setelah diambil
+        speech_config = clients.get_speech_config(
+            speech_key,
+            speech_region,
+            voice_name=voice_name,
+            output_format=audio_format.output_format
+        )
 
         # 4. Panggil Azure AI Speech untuk sintesis teks
-        logging.info(f"Mensintesis teks: '{text_to_speak}' ke bahasa '{language_code}'...")
-        
-        # Menggunakan speak_text_async untuk teks (SSML juga bisa dengan speak_ssml_async)
-        result = speech_synthesizer.speak_text_async(text_to_speak).get()
+        logging.info(f"Mensintesis teks: '{text_to_speak}' ke bahasa '{language_code}' ({audio_format.name})...")
+        acquire_start = time.perf_counter()
+        with synthesizer_lease(speech_key, speech_region, voice_name, speech_config, audio_format) as (pooled, warm):
+            acquire_ms = (time.perf_counter() - acquire_start) * 1000
+            # Menggunakan speak_text_async untuk teks (SSML juga bisa dengan speak_ssml_async)
+            result = pooled.synthesizer.speak_text_async(text_to_speak).get()
+            if result.reason == speechsdk.ResultReason.Canceled and result.cancellation_details.reason == speechsdk.CancellationReason.Error:
+                pooled.mark_broken()
 
         # 5. Proses respons dari Azure AI Speech
         if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
             audio_data = result.audio_data # Ini adalah bytes audio
+            _record_first_byte_latency(result, acquire_ms, warm)
             logging.info(f"Sintesis audio berhasil, ukuran data: {len(audio_data)} bytes.")
+            if tts_audio_store is not None:
+                return audio_response(req, tts_audio_store.put(audio_id, audio_data, audio_format.extension), vary_accept)
             return func.HttpResponse(
                 body=audio_data,
-                mimetype="audio/mpeg", # Sesuaikan dengan format yang dipilih di speech_config
-                status_code=200
+                mimetype=audio_format.mimetype,
+                status_code=200,
+                headers={"Vary": "Accept"} if vary_accept else None
             )
         elif result.reason == speechsdk.ResultReason.Canceled:
             cancellation_details = result.cancellation_details
@@ -101,4 +364,4 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             json.dumps({"error": "Terjadi kesalahan pada server saat memproses permintaan text-to-speech."}),
             mimetype="application/json",
             status_code=500
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,285 @@
+import hashlib
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from shared_code import metrics
+
+MIMETYPES = {
+    "mp3": "audio/mpeg",
+    "ogg": "audio/ogg; codecs=opus",
+    "webm": "audio/webm; codecs=opus",
+    "wav": "audio/wav",
+    "pcm": "audio/pcm; rate=16000; channels=1" # 16-bit little-endian (audio/L16 berarti big-endian)
+}
+
+_AUDIO_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(ValueError):
+    """
+    Raised when a Range header lies entirely outside the resource.
+    """
+
+
+def audio_key(text, voice_name, output_format, variant=None):
+    """
+    Returns the content address (SHA-256 hex) of the audio for text, resolved voice and output format.
+    A variant (e.g. bulk.BULK_CLIP_VARIANT) puts audio that is not byte-identical to a standalone
+    synthesis of the same text under its own ids.
+    """
+    key = f"{voice_name}\x00{output_format}\x00{text}"
+    if variant:
+        key = f"{variant}\x00{key}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def is_audio_id(value):
+    return bool(value) and _AUDIO_ID_PATTERN.match(value) is not None
+
+def parse_range(header, size):
+    """
+    Parses a single-range `Range: bytes=...` header.
+
+    Returns:
+        tuple: (start, end) inclusive, or None if the header is absent, malformed or
+               multi-range (the full body is served then, as RFC 9110 allows).
+
+    Raises:
+        RangeNotSatisfiable: If the range starts beyond the end of the resource.
+    """
+    match = _RANGE_PATTERN.match((header or "").strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first: # bytes=-N: N byte terakhir
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable(f"Empty suffix range for {size} bytes.")
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiable(f"Range starts at {start}, resource has {size} bytes.")
+    if end < start:
+        return None
+    return start, end
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match header against etag (RFC 9110 13.1.2).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class AudioBlob:
+    """
+    Stored audio being served: bytes from the hot tier or a read-only mmap of the file on disk.
+    Call close() once the response body has been built.
+    """
+
+    def __init__(self, audio_id, extension, etag, buffer, closer=None):
+        self.audio_id = audio_id
+        self.extension = extension
+        self.etag = etag
+        self._buffer = buffer
+        self._closer = closer
+
+    @property
+    def size(self):
+        return len(self._buffer)
+
+    @property
+    def mimetype(self):
+        return MIMETYPES.get(self.extension, "application/octet-stream")
+
+    def read(self, start=0, end=None):
+        return bytes(self._buffer[start:end])
+
+    def close(self):
+        if self._closer is not None:
+            self._closer()
+            self._closer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AudioStore:
+    """
+    Content-addressed audio store on local disk with an in-memory hot tier.
+
+    Files live at `<root>/<id[:2]>/<id>.<extension>`. Both tiers are LRU with byte budgets:
+    entries beyond memory_budget_bytes drop out of memory only, files beyond
+    disk_budget_bytes are deleted. Recency on disk is kept in the file mtime, so the LRU order
+    survives restarts. The strong ETag is the SHA-256 of the audio bytes.
+
+    Lookups are counted in shared_code.metrics as `<name>.memory_hit`, `<name>.disk_hit` and
+    `<name>.miss`; deleted files as `<name>.evicted`.
+    """
+
+    def __init__(self, root, disk_budget_bytes=512 * 1024 * 1024, memory_budget_bytes=32 * 1024 * 1024, name="tts_audio_store"):
+        self.root = root
+        self.disk_budget_bytes = disk_budget_bytes
+        self.memory_budget_bytes = memory_budget_bytes
+        self.name = name
+        self._lock = threading.Lock()
+        self._disk = OrderedDict() # audio_id -> [extension, size, etag or None]
+        self._disk_bytes = 0
+        self._memory = OrderedDict() # audio_id -> (extension, etag, bytes)
+        self._memory_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _path(self, audio_id, extension):
+        return os.path.join(self.root, audio_id[:2], f"{audio_id}.{extension}")
+
+    def _scan(self):
+        files = []
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                audio_id, _, extension = entry.name.partition(".")
+                if entry.is_file() and is_audio_id(audio_id) and extension in MIMETYPES:
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, audio_id, extension, stat.st_size))
+        for _, audio_id, extension, size in sorted(files): # Terlama dulu, agar yang terbaru paling akhir di LRU
+            self._disk[audio_id] = [extension, size, None]
+            self._disk_bytes += size
+        self._evict_disk()
+        logging.info(f"Audio store {self.name}: {len(self._disk)} files ({self._disk_bytes} bytes) in {self.root}.")
+
+    def _evict_disk(self):
+        # Dipanggil dengan _lock dipegang (atau saat __init__)
+        while self._disk_bytes > self.disk_budget_bytes and self._disk:
+            audio_id, (extension, size, _) = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._drop_memory(audio_id)
+            try:
+                os.remove(self._path(audio_id, extension))
+            except FileNotFoundError:
+                pass
+            except OSError as remove_err:
+                logging.warning(f"Audio store {self.name}: failed to delete {audio_id}: {remove_err}")
+            metrics.increment(f"{self.name}.evicted")
+
+    def _drop_memory(self, audio_id):
+        entry = self._memory.pop(audio_id, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[2])
+
+    def _remember(self, audio_id, extension, etag, data):
+        if len(data) > self.memory_budget_bytes:
+            return
+        self._drop_memory(audio_id)
+        self._memory[audio_id] = (extension, etag, data)
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_budget_bytes:
+            _, (_, _, evicted) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def get(self, audio_id):
+        """
+        Returns an AudioBlob for audio_id, or None if it is not stored.
+        """
+        with self._lock:
+            hot = self._memory.get(audio_id)
+            if hot is not None:
+                self._memory.move_to_end(audio_id)
+                if audio_id in self._disk:
+                    self._disk.move_to_end(audio_id)
+                extension, etag, data = hot
+            else:
+                disk_entry = self._disk.get(audio_id)
+                if disk_entry is None:
+                    metrics.increment(f"{self.name}.miss")
+                    return None
+                self._disk.move_to_end(audio_id)
+                extension, _, etag = disk_entry
+        if hot is not None:
+            metrics.increment(f"{self.name}.memory_hit")
+            return AudioBlob(audio_id, extension, etag, data)
+
+        path = self._path(audio_id, extension)
+        try:
+            with open(path, "rb") as audio_file:
+                mapped = mmap.mmap(audio_file.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(path) # Recency LRU tetap ada setelah restart
+        except (OSError, ValueError) as open_err: # File hilang/kosong di luar store
+            logging.warning(f"Audio store {self.name}: cannot open {audio_id}: {open_err}")
+            with self._lock:
+                entry = self._disk.pop(audio_id, None)
+                if entry is not None:
+                    self._disk_bytes -= entry[1]
+            metrics.increment(f"{self.name}.miss")
+            return None
+        if etag is None:
+            etag = f'"{hashlib.sha256(mapped).hexdigest()[:32]}"'
+            with self._lock:
+                if audio_id in self._disk:
+                    self._disk[audio_id][2] = etag
+        with self._lock:
+            if len(mapped) <= self.memory_budget_bytes:
+                self._remember(audio_id, extension, etag, mapped[:])
+        metrics.increment(f"{self.name}.disk_hit")
+        return AudioBlob(audio_id, extension, etag, mapped, mapped.close)
+
+    def put(self, audio_id, data, extension="mp3"):
+        """
+        Stores audio (write-to-temp + rename, so readers never see a partial file) and returns
+        an AudioBlob over data. Disk errors are logged and the audio is kept in memory only.
+        """
+        data = bytes(data)
+        etag = f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+        path = self._path(audio_id, extension)
+        written = False
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".audio-")
+            try:
+                with os.fdopen(fd, "wb") as tmp_file:
+                    tmp_file.write(data)
+                os.replace(tmp_path, path)
+                written = True
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as write_err:
+            logging.warning(f"Audio store {self.name}: failed to write {audio_id}: {write_err}")
+
+        with self._lock:
+            if written:
+                previous = self._disk.pop(audio_id, None)
+                if previous is not None:
+                    self._disk_bytes -= previous[1]
+                self._disk[audio_id] = [extension, len(data), etag]
+                self._disk_bytes += len(data)
+            self._remember(audio_id, extension, etag, data)
+            if written:
+                self._evict_disk()
+        return AudioBlob(audio_id, extension, etag, data)
+
+    def stats(self):
+        with self._lock:
+            return {"files": len(self._disk), "disk_bytes": self._disk_bytes, "memory_entries": len(self._memory), "memory_bytes": self._memory_bytes}
@@ -0,0 +1,315 @@
+import bisect
+import json
+import logging
+import os
+import time
+import uuid
+from xml.sax.saxutils import escape, quoteattr
+
+import azure.functions as func
+import azure.cognitiveservices.speech as speechsdk
+
+from . import TTS_DEFAULT_AUDIO_FORMAT, audio_store, formats, resolve_voice, synthesizer_lease, tts_audio_store
+from shared_code import clients
+from shared_code import metrics
+
+# --- KONFIGURASI BULK TTS ---
+# Satu pelajaran: 5-7 kosakata, 3-5 frasa kunci dan contoh grammar -> satu dokumen SSML, bukan 15+ panggilan GetTTSAudio
+MAX_TTS_BULK_ITEMS = int(os.environ.get("MAX_TTS_BULK_ITEMS", 24))
+MAX_TTS_BULK_TEXT_CHARS = int(os.environ.get("MAX_TTS_BULK_TEXT_CHARS", 400))
+# Jeda hening antar item; potongan audio jatuh di dalam jeda ini (frame MP3 16kHz = 36ms, plus delay encoder).
+# Hanya MP3 dan PCM yang bisa dipotong; Ogg/WebM Opus butuh remux container per item.
+TTS_BULK_GAP_MS = int(os.environ.get("TTS_BULK_GAP_MS", 400))
+
+# Potongan bulk berisi jeda hening dan tidak identik byte dengan sintesis teks tunggal, jadi punya audioId sendiri
+BULK_CLIP_VARIANT = "bulk"
+
+RESPONSE_JSON = "json"
+RESPONSE_MULTIPART = "multipart"
+
+_TICKS_PER_SECOND = 10_000_000 # audio_offset bookmark dalam satuan 100ns
+
+# Layer III: bitrate (kbps) per indeks untuk MPEG-1 dan MPEG-2/2.5, sample rate per versi
+_MP3_BITRATES_KBPS = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+class BulkSynthesisError(RuntimeError):
+    """
+    Raised when the bulk SSML synthesis failed or its bookmarks cannot be mapped to the audio.
+    """
+
+
+def _mp3_frame_header(data, pos):
+    """
+    Returns (frame_length, samples_per_frame, sample_rate) for an MPEG Layer III frame header at pos, or None.
+    """
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (data[pos + 1] >> 3) & 0x03
+    layer_bits = (data[pos + 1] >> 1) & 0x03
+    bitrate_index = data[pos + 2] >> 4
+    sample_rate_index = (data[pos + 2] >> 2) & 0x03
+    padding = (data[pos + 2] >> 1) & 0x01
+    if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    bitrate = _MP3_BITRATES_KBPS[1 if mpeg1 else 2][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version_bits][sample_rate_index]
+    samples_per_frame = 1152 if mpeg1 else 576
+    return (samples_per_frame // 8) * bitrate // sample_rate + padding, samples_per_frame, sample_rate
+
+def mp3_frames(data):
+    """
+    Scans MP3 data (Layer III, optional ID3v2 tag) for frame boundaries.
+
+    Returns:
+        tuple: (offsets, start_times, end): byte offset and start time in seconds of every frame,
+               and the byte offset just past the last frame.
+    """
+    pos = 0
+    if data[:3] == b"ID3" and len(data) >= 10: # Ukuran tag ID3v2 adalah syncsafe integer
+        pos = 10 + ((data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F))
+    offsets, start_times = [], []
+    elapsed = 0.0
+    while pos + 4 <= len(data):
+        header = _mp3_frame_header(data, pos)
+        if header is None:
+            pos += 1 # Sinkronisasi ulang ke header frame berikutnya
+            continue
+        frame_length, samples_per_frame, sample_rate = header
+        if pos + frame_length > len(data):
+            break
+        offsets.append(pos)
+        start_times.append(elapsed)
+        elapsed += samples_per_frame / sample_rate
+        pos += frame_length
+    end = offsets[-1] + _mp3_frame_header(data, offsets[-1])[0] if offsets else 0
+    return offsets, start_times, end
+
+def slice_mp3(data, start_seconds):
+    """
+    Cuts MP3 data into clips starting at the given (ascending) times.
+
+    Each cut is made at the last frame boundary at or before its time, so clips are valid MP3
+    streams and a cut placed in silence never clips the start of the following item (the
+    encoder delay shifts the audio slightly later than its nominal time).
+
+    Returns:
+        list[bytes]: One clip per start time; the last clip runs to the end of the audio.
+    """
+    offsets, start_times, end = mp3_frames(data)
+    if not offsets:
+        raise BulkSynthesisError("Synthesized audio contains no MP3 frames.")
+    cuts = []
+    for seconds in start_seconds:
+        frame_index = max(0, bisect.bisect_right(start_times, seconds) - 1)
+        cuts.append(offsets[frame_index])
+    cuts.append(end)
+    return [bytes(data[cuts[i]:cuts[i + 1]]) for i in range(len(start_seconds))]
+
+def slice_pcm(data, start_seconds):
+    """
+    Cuts raw 16-bit PCM at the sample boundaries of the given (ascending) times.
+
+    Returns:
+        list[bytes]: One clip per start time; the last clip runs to the end of the audio.
+    """
+    if not data:
+        raise BulkSynthesisError("Synthesized audio is empty.")
+    end = len(data) - len(data) % formats.PCM_SAMPLE_BYTES
+    cuts = [min(end, int(seconds * formats.PCM_SAMPLE_RATE) * formats.PCM_SAMPLE_BYTES) for seconds in start_seconds]
+    cuts.append(end)
+    return [bytes(data[cuts[i]:cuts[i + 1]]) for i in range(len(start_seconds))]
+
+# Format yang bisa dipotong per bookmark -> fungsi pemotong
+SLICERS = {formats.MP3.name: slice_mp3, formats.PCM.name: slice_pcm}
+
+def build_bookmark_ssml(texts, language_code, voice_name, gap_ms=TTS_BULK_GAP_MS):
+    """
+    Builds one SSML document speaking texts in order, with a <bookmark mark="i"/> before item i
+    and a silent break between items.
+    """
+    parts = []
+    for index, text in enumerate(texts):
+        if index:
+            parts.append(f'<break time="{gap_ms}ms"/>')
+        parts.append(f'<bookmark mark="{index}"/>{escape(text)}')
+    return (
+        f'<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang={quoteattr(language_code)}>'
+        f'<voice name={quoteattr(voice_name)}>{"".join(parts)}</voice></speak>'
+    )
+
+def synthesize_clips(synthesizer, texts, language_code, voice_name, audio_format=formats.MP3):
+    """
+    Synthesizes texts in a single SSML request and slices the audio at the bookmark offsets.
+    The synthesizer must produce audio_format, which must be one of SLICERS.
+
+    Returns:
+        list[bytes]: One clip per text.
+
+    Raises:
+        BulkSynthesisError: If the synthesis was canceled or bookmarks are missing.
+    """
+    marks = {}
+
+    def on_bookmark(evt):
+        marks[evt.text] = evt.audio_offset
+    synthesizer.bookmark_reached.connect(on_bookmark)
+    try:
+        result = synthesizer.speak_ssml_async(build_bookmark_ssml(texts, language_code, voice_name)).get()
+    finally:
+        synthesizer.bookmark_reached.disconnect_all() # Synthesizer dari pool dipakai ulang
+
+    if result.reason == speechsdk.ResultReason.Canceled:
+        details = result.cancellation_details
+        raise BulkSynthesisError(f"Bulk synthesis canceled: {details.reason} {details.error_details or ''}".strip())
+    if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+        raise BulkSynthesisError(f"Unexpected bulk synthesis result: {result.reason}")
+    missing = [index for index in range(len(texts)) if str(index) not in marks]
+    if missing:
+        raise BulkSynthesisError(f"Bookmarks missing for items {missing}.")
+    start_seconds = [marks[str(index)] / _TICKS_PER_SECOND for index in range(len(texts))]
+    if start_seconds != sorted(start_seconds):
+        raise BulkSynthesisError("Bookmark offsets are not in order.")
+    return SLICERS[audio_format.name](result.audio_data, start_seconds)
+
+def encode_multipart(items, mimetype):
+    """
+    Encodes (index, audio_id, audio_bytes) items as a multipart/mixed body with one mimetype part per item.
+
+    Returns:
+        tuple: (body, content_type)
+    """
+    boundary = f"bisbi-{uuid.uuid4().hex}"
+    chunks = []
+    for index, audio_id, audio_data in items:
+        chunks.append(
+            f"--{boundary}\r\nContent-Type: {mimetype}\r\nContent-ID: <{index}>\r\n"
+            f"X-Audio-Id: {audio_id}\r\nContent-Length: {len(audio_data)}\r\n\r\n".encode("ascii")
+        )
+        chunks.append(audio_data)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode("ascii"))
+    return b"".join(chunks), f"multipart/mixed; boundary={boundary}"
+
+def _response_mode(req, req_body):
+    requested = req_body.get("response")
+    if requested is None and "multipart/mixed" in (req.headers.get("Accept") or ""):
+        requested = RESPONSE_MULTIPART
+    if requested is None:
+        requested = RESPONSE_JSON
+    if requested not in (RESPONSE_JSON, RESPONSE_MULTIPART):
+        return None
+    # Tanpa store, audioId tidak bisa diambil lewat GET GetTTSAudio/{audioId}: kirim audionya langsung
+    return RESPONSE_MULTIPART if tts_audio_store is None else requested
+
+def _validate_texts(texts):
+    if not isinstance(texts, list) or not texts:
+        return "Harap sertakan 'texts' (list teks yang tidak kosong) dalam request body JSON."
+    if len(texts) > MAX_TTS_BULK_ITEMS:
+        return f"'texts' berisi paling banyak {MAX_TTS_BULK_ITEMS} item."
+    for text in texts:
+        if not isinstance(text, str) or not text.strip():
+            return "Setiap item 'texts' harus berupa teks yang tidak kosong."
+        if len(text) > MAX_TTS_BULK_TEXT_CHARS:
+            return f"Setiap item 'texts' paling panjang {MAX_TTS_BULK_TEXT_CHARS} karakter."
+    return None
+
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request for GetTTSAudioBulk.')
+    request_start = time.perf_counter()
+
+    try:
+        speech_key = os.environ.get("AZURE_AI_SERVICES_KEY")
+        speech_region = os.environ.get("AZURE_AI_SERVICES_REGION")
+        if not speech_key or not speech_region:
+            logging.error("Konfigurasi Azure AI Speech (key atau region) tidak lengkap.")
+            return func.HttpResponse(json.dumps({"error": "Error: Server configuration missing for Speech service."}), mimetype="application/json", status_code=500)
+
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            req_body = None
+        if not isinstance(req_body, dict):
+            logging.warning("Request body bukan JSON yang valid.")
+            return func.HttpResponse(json.dumps({"error": "Harap kirim request body dalam format JSON."}), mimetype="application/json", status_code=400)
+
+        texts = req_body.get("texts")
+        language_code = req_body.get("languageCode")
+        texts_error = _validate_texts(texts)
+        if texts_error or not language_code:
+            logging.warning(f"Request bulk TTS tidak valid: {texts_error or 'languageCode kosong'}")
+            return func.HttpResponse(json.dumps({"error": texts_error or "Harap sertakan 'languageCode' dalam request body JSON."}), mimetype="application/json", status_code=400)
+        voice_name = resolve_voice(language_code, req_body.get("voiceName"))
+        if not voice_name:
+            # SSML butuh elemen <voice>, jadi tidak bisa menyerahkan pilihan suara ke layanan
+            return func.HttpResponse(json.dumps({"error": f"Harap sertakan 'voiceName' untuk languageCode '{language_code}'."}), mimetype="application/json", status_code=400)
+        # Accept dipakai untuk memilih multipart, jadi format hanya lewat field 'format'
+        audio_format, _ = formats.negotiate(req_body.get("format"), None, TTS_DEFAULT_AUDIO_FORMAT)
+        if audio_format is None or audio_format.name not in SLICERS:
+            return func.HttpResponse(json.dumps({"error": f"Parameter 'format' untuk bulk harus salah satu dari: {', '.join(SLICERS)}."}), mimetype="application/json", status_code=400)
+        response_mode = _response_mode(req, req_body)
+        if response_mode is None:
+            return func.HttpResponse(json.dumps({"error": "Parameter 'response' harus 'json' atau 'multipart'."}), mimetype="application/json", status_code=400)
+
+        # 1. Layani item yang sudah ada di store; teks duplikat disintesis sekali
+        audio_ids = [audio_store.audio_key(text, voice_name, audio_format.output_format.name, variant=BULK_CLIP_VARIANT) for text in texts]
+        audio_by_id = {}
+        cached_ids = set()
+        pending = {}
+        for text, audio_id in zip(texts, audio_ids):
+            if audio_id in audio_by_id or audio_id in pending:
+                continue
+            stored_blob = tts_audio_store.get(audio_id) if tts_audio_store is not None else None
+            if stored_blob is None:
+                pending[audio_id] = text
+                continue
+            with stored_blob:
+                audio_by_id[audio_id] = stored_blob.read() if response_mode == RESPONSE_MULTIPART else stored_blob.size
+            cached_ids.add(audio_id)
+
+        # 2. Sisanya disintesis dalam satu dokumen SSML dan dipotong per bookmark
+        if pending:
+            speech_config = clients.get_speech_config(speech_key, speech_region, voice_name=voice_name, output_format=audio_format.output_format)
+            synthesis_start = time.perf_counter()
+            with synthesizer_lease(speech_key, speech_region, voice_name, speech_config, audio_format) as (pooled, _):
+                try:
+                    clips = synthesize_clips(pooled.synthesizer, list(pending.values()), language_code, voice_name, audio_format)
+                except BulkSynthesisError:
+                    pooled.mark_broken()
+                    raise
+            logging.info(f"Bulk TTS: {len(pending)} item disintesis dalam satu request SSML ({(time.perf_counter() - synthesis_start) * 1000:.1f}ms).")
+            for audio_id, clip in zip(pending, clips):
+                if tts_audio_store is not None:
+                    tts_audio_store.put(audio_id, clip, audio_format.extension)
+                audio_by_id[audio_id] = clip if response_mode == RESPONSE_MULTIPART else len(clip)
+
+        metrics.increment("get_tts_audio_bulk.requests")
+        metrics.increment("get_tts_audio_bulk.items", len(texts))
+        metrics.increment("get_tts_audio_bulk.synthesized", len(pending))
+        logging.info(f"Bulk TTS selesai: {len(texts)} item, {len(cached_ids)} dari store, {len(pending)} disintesis, total {(time.perf_counter() - request_start) * 1000:.1f}ms.")
+
+        if response_mode == RESPONSE_MULTIPART:
+            body, content_type = encode_multipart(((index, audio_id, audio_by_id[audio_id]) for index, audio_id in enumerate(audio_ids)), audio_format.mimetype)
+            return func.HttpResponse(body=body, status_code=200, headers={"Content-Type": content_type})
+        items = [
+            {"index": index, "text": text, "audioId": audio_id, "size": audio_by_id[audio_id], "cached": audio_id in cached_ids}
+            for index, (text, audio_id) in enumerate(zip(texts, audio_ids))
+        ]
+        return func.HttpResponse(json.dumps({"items": items}), mimetype="application/json", status_code=200)
+
+    except BulkSynthesisError as bulk_err:
+        logging.error(f"Bulk TTS gagal: {bulk_err}")
+        return func.HttpResponse(json.dumps({"error": "Gagal mensintesis audio."}), mimetype="application/json", status_code=500)
+    except Exception as e:
+        logging.error(f"Terjadi kesalahan internal di GetTTSAudioBulk: {str(e)}", exc_info=True)
+        return func.HttpResponse(
+            json.dumps({"error": "Terjadi kesalahan pada server saat memproses permintaan text-to-speech."}),
+            mimetype="application/json",
+            status_code=500
+        )
@@ -0,0 +1,97 @@
+from dataclasses import dataclass
+
+import azure.cognitiveservices.speech as speechsdk
+
+from . import audio_store
+
+PCM_SAMPLE_RATE = 16000
+PCM_SAMPLE_BYTES = 2 # 16-bit signed little-endian, mono
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """
+    A TTS output format clients can ask for.
+
+    Attributes:
+        name (str): Value of the request field 'format'.
+        output_format: speechsdk.SpeechSynthesisOutputFormat used for synthesis (also part of the audio id).
+        extension (str): File extension in the audio store; determines the mimetype.
+        media_types (tuple): Accept header media types (lowercase, without parameters) that select this format.
+    """
+    name: str
+    output_format: speechsdk.SpeechSynthesisOutputFormat
+    extension: str
+    media_types: tuple
+
+    @property
+    def mimetype(self):
+        return audio_store.MIMETYPES[self.extension]
+
+
+MP3 = AudioFormat("mp3", speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3, "mp3", ("audio/mpeg", "audio/mp3"))
+# Opus untuk data seluler: ukuran jauh lebih kecil dari MP3 32 kbps untuk kualitas suara yang setara
+OGG_OPUS = AudioFormat("ogg-opus", speechsdk.SpeechSynthesisOutputFormat.Ogg16Khz16BitMonoOpus, "ogg", ("audio/ogg", "audio/opus"))
+WEBM_OPUS = AudioFormat("webm-opus", speechsdk.SpeechSynthesisOutputFormat.Webm24Khz16Bit24KbpsMonoOpus, "webm", ("audio/webm",))
+# PCM mentah untuk pemrosesan di perangkat (mis. perbandingan dengan rekaman pelafalan)
+PCM = AudioFormat("pcm", speechsdk.SpeechSynthesisOutputFormat.Raw16Khz16BitMonoPcm, "pcm", ("audio/pcm",))
+
+FORMATS = {audio_format.name: audio_format for audio_format in (MP3, OGG_OPUS, WEBM_OPUS, PCM)}
+_ALIASES = {"opus": OGG_OPUS, "ogg": OGG_OPUS, "webm": WEBM_OPUS}
+_BY_MEDIA_TYPE = {media_type: audio_format for audio_format in FORMATS.values() for media_type in audio_format.media_types}
+
+
+def get_format(name):
+    """
+    Returns the AudioFormat for a 'format' value (case-insensitive, aliases 'opus', 'ogg', 'webm'), or None.
+    """
+    if not isinstance(name, str):
+        return None
+    name = name.strip().lower()
+    return FORMATS.get(name) or _ALIASES.get(name)
+
+def parse_accept(header):
+    """
+    Returns the media ranges of an Accept header as [(media_type, q)], highest q first
+    (header order is kept for equal q). Media types are lowercased, parameters other than q dropped.
+    """
+    ranges = []
+    for position, part in enumerate((header or "").split(",")):
+        media_type, *params = [piece.strip() for piece in part.split(";")]
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((-q, position, media_type.lower()))
+    return [(media_type, -negative_q) for negative_q, _, media_type in sorted(ranges)]
+
+def negotiate(requested_name, accept_header, default):
+    """
+    Picks the output format: the request field 'format' if given, otherwise the best supported
+    type in the Accept header. `audio/*`, `*/*` and Accept headers without a supported audio
+    type (e.g. `application/json`) get default, so existing clients keep receiving it.
+
+    Returns:
+        tuple: (AudioFormat or None, vary_accept). The format is None only if requested_name is
+               not a supported format; vary_accept is True if the choice depends on the Accept
+               header (no 'format' field), so responses should carry `Vary: Accept`.
+    """
+    if requested_name is not None:
+        return get_format(requested_name), False
+    if not accept_header:
+        return default, True
+    for media_type, q in parse_accept(accept_header):
+        if q <= 0:
+            continue
+        if media_type in ("*/*", "audio/*"):
+            return default, True
+        audio_format = _BY_MEDIA_TYPE.get(media_type)
+        if audio_format is not None:
+            return audio_format, True
+    return default, True
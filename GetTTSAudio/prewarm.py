@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+import time
+
+import azure.cognitiveservices.speech as speechsdk
+
+from . import TTS_DEFAULT_AUDIO_FORMAT, audio_store, resolve_voice, synthesizer_lease, tts_audio_store
+from .bulk import MAX_TTS_BULK_ITEMS, MAX_TTS_BULK_TEXT_CHARS, BulkSynthesisError
+from shared_code import audio_prewarm
+from shared_code import clients
+from shared_code import metrics
+
+# audioId yang sedang disintesis oleh worker prewarm, supaya pesan yang berjalan bersamaan tidak menyintesis ulang
+_in_progress = set()
+_in_progress_lock = threading.Lock()
+
+
+def _synthesize_each(synthesizer, texts):
+    clips = []
+    for text in texts:
+        result = synthesizer.speak_text_async(text).get()
+        if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+            raise BulkSynthesisError(f"Prewarm synthesis of '{text[:50]}' failed: {result.reason}")
+        clips.append(result.audio_data)
+    return clips
+
+def prewarm_texts(texts, language_code, audio_format=TTS_DEFAULT_AUDIO_FORMAT):
+    """
+    Synthesizes texts into the TTS audio store under the audio ids GetTTSAudio computes for the
+    same text, languageCode (default voice) and format, skipping texts that are already stored
+    or being prewarmed. Uncached texts are synthesized one by one on a single pooled synthesizer,
+    so the stored audio is the same as a GetTTSAudio synthesis (bulk SSML clips would carry the
+    inter-item silence and live under their own ids, see bulk.BULK_CLIP_VARIANT).
+
+    Returns:
+        tuple: (already_cached, synthesized) text counts.
+
+    Raises:
+        BulkSynthesisError: If the synthesis failed (the message may be retried).
+    """
+    speech_key = os.environ.get("AZURE_AI_SERVICES_KEY")
+    speech_region = os.environ.get("AZURE_AI_SERVICES_REGION")
+    voice_name = resolve_voice(language_code)
+    if tts_audio_store is None or not speech_key or not speech_region or not voice_name:
+        logging.info(f"Skipping audio prewarm for '{language_code}' (no audio store, Speech configuration or default voice).")
+        metrics.increment("lesson_audio_prewarm.skipped")
+        return 0, 0
+
+    pending = {}
+    already_cached = 0
+    with _in_progress_lock:
+        for text in texts:
+            if len(pending) >= MAX_TTS_BULK_ITEMS:
+                break
+            if not text.strip() or len(text) > MAX_TTS_BULK_TEXT_CHARS:
+                continue
+            audio_id = audio_store.audio_key(text, voice_name, audio_format.output_format.name)
+            if audio_id in pending or audio_id in _in_progress:
+                continue
+            stored_blob = tts_audio_store.get(audio_id)
+            if stored_blob is not None:
+                stored_blob.close()
+                already_cached += 1
+                continue
+            pending[audio_id] = text
+        _in_progress.update(pending)
+    metrics.increment("lesson_audio_prewarm.already_cached", already_cached)
+    if not pending:
+        return already_cached, 0
+
+    try:
+        start = time.perf_counter()
+        speech_config = clients.get_speech_config(speech_key, speech_region, voice_name=voice_name, output_format=audio_format.output_format)
+        with synthesizer_lease(speech_key, speech_region, voice_name, speech_config, audio_format) as (pooled, _):
+            try:
+                clips = _synthesize_each(pooled.synthesizer, list(pending.values()))
+            except BulkSynthesisError:
+                pooled.mark_broken()
+                raise
+        for audio_id, clip in zip(pending, clips):
+            tts_audio_store.put(audio_id, clip, audio_format.extension)
+    finally:
+        with _in_progress_lock:
+            _in_progress.difference_update(pending)
+    metrics.increment("lesson_audio_prewarm.synthesized", len(pending))
+    logging.info(f"Audio prewarm: {len(pending)} text(s) synthesized, {already_cached} already cached ({(time.perf_counter() - start) * 1000:.1f}ms).")
+    return already_cached, len(pending)
+
+def handle_message(body):
+    """
+    Processes one prewarm message (from the in-process queue or the queue trigger). Malformed
+    messages are logged and dropped; synthesis errors are raised so the queue can retry.
+    """
+    try:
+        texts, language_code = audio_prewarm.decode_message(body)
+    except ValueError as message_err:
+        logging.warning(f"Dropping invalid audio prewarm message: {message_err}")
+        metrics.increment("lesson_audio_prewarm.invalid")
+        return
+    prewarm_texts(texts, language_code)
+
+
+audio_prewarm.set_handler(handle_message) # Konsumen antrean in-process (backend "memory")
@@ -1,6 +1,20 @@
+import asyncio
 import azure.functions as func
+import json
 import logging
-from . import main as get_tts_audio_main
+from . import main as get_tts_audio_main, get_stored_audio, handle_stream_request
+from .bulk import main as get_tts_audio_bulk_main
+from . import prewarm # Mendaftarkan konsumen antrean prewarm audio in-process
+from shared_code import audio_prewarm
+
+# HTTP streaming butuh ekstensi azurefunctions-extensions-http-fastapi (tipe Request/StreamingResponse), yang
+# sengaja tidak ada di requirements.txt: secara default route streaming tersedia tetapi audio dikirim sekaligus
+# setelah sintesis selesai. Tambahkan paket itu ke requirements.txt untuk mengaktifkan streaming.
+try:
+    from azurefunctions.extensions.http.fastapi import Request, Response, StreamingResponse
+    HTTP_STREAMING_AVAILABLE = True
+except ImportError:
+    HTTP_STREAMING_AVAILABLE = False
 
 # Create Blueprint
 bp = func.Blueprint()
@@ -8,4 +22,67 @@ bp = func.Blueprint()
 @bp.route(route="GetTTSAudio", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
 def GetTTSAudio_handler(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Blueprint: Routing to GetTTSAudio")
-    return get_tts_audio_main(req)
\ No newline at end of file
+    return get_tts_audio_main(req)
+
+@bp.route(route="GetTTSAudioBulk", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
+def GetTTSAudioBulk_handler(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Blueprint: Routing to GetTTSAudioBulk")
+    return get_tts_audio_bulk_main(req)
+
+@bp.route(route="GetTTSAudio/{audioId}", auth_level=func.AuthLevel.FUNCTION, methods=["GET"])
+def GetTTSAudioStored_handler(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Blueprint: Routing to GetTTSAudio (stored audio)")
+    return get_stored_audio(req)
+
+
+def _prepare_stream(req_body, accept_header):
+    """
+    Returns (status_code, body, mimetype, headers): body is an audio chunk iterator on success, otherwise a JSON error string.
+    """
+    try:
+        return handle_stream_request(req_body, accept_header)
+    except Exception as e:
+        logging.error(f"Terjadi kesalahan internal di GetTTSAudioStream: {str(e)}", exc_info=True)
+        return 500, json.dumps({"error": "Terjadi kesalahan pada server saat memproses permintaan text-to-speech."}), None, {}
+
+
+if HTTP_STREAMING_AVAILABLE:
+    @bp.route(route="GetTTSAudioStream", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
+    async def GetTTSAudioStream_handler(req: Request) -> StreamingResponse:
+        logging.info("Blueprint: Routing to GetTTSAudioStream (streaming)")
+        try:
+            req_body = await req.json()
+        except ValueError:
+            req_body = None
+        # Menunggu potongan audio pertama (sampai TTS_STREAM_CHUNK_TIMEOUT_SECONDS) di thread, bukan di event loop worker
+        status_code, body, mimetype, headers = await asyncio.to_thread(_prepare_stream, req_body, req.headers.get("accept"))
+        if mimetype is None:
+            return Response(content=body, media_type="application/json", status_code=status_code)
+        # Potongan berikutnya: iterator sinkron dijalankan di threadpool oleh StreamingResponse
+        return StreamingResponse(body, media_type=mimetype, headers=headers)
+else:
+    @bp.route(route="GetTTSAudioStream", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
+    def GetTTSAudioStream_handler(req: func.HttpRequest) -> func.HttpResponse:
+        logging.info("Blueprint: Routing to GetTTSAudioStream (buffered, HTTP streaming extension not installed)")
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            req_body = None
+        status_code, body, mimetype, headers = _prepare_stream(req_body, req.headers.get("Accept"))
+        if mimetype is None:
+            return func.HttpResponse(body, mimetype="application/json", status_code=status_code)
+        try:
+            audio_data = b"".join(body)
+        except Exception as e: # Sintesis gagal setelah potongan pertama
+            logging.error(f"GetTTSAudioStream gagal di tengah sintesis: {str(e)}", exc_info=True)
+            return func.HttpResponse(json.dumps({"error": "Gagal mensintesis audio."}), mimetype="application/json", status_code=500)
+        return func.HttpResponse(audio_data, mimetype=mimetype, status_code=status_code, headers=headers)
+
+
+# Backend "storage": pesan prewarm dari GenerateLesson dikirim lewat Azure Storage Queue ke queue trigger ini.
+# Exception (sintesis gagal) membuat pesan dicoba ulang oleh host, lalu masuk poison queue.
+if audio_prewarm.prewarm_queue is not None and audio_prewarm.LESSON_AUDIO_PREWARM_BACKEND == audio_prewarm.BACKEND_STORAGE:
+    @bp.queue_trigger(arg_name="msg", queue_name=audio_prewarm.LESSON_AUDIO_PREWARM_QUEUE_NAME, connection=audio_prewarm.LESSON_AUDIO_PREWARM_CONNECTION)
+    def GetTTSAudioPrewarm_handler(msg: func.QueueMessage) -> None:
+        logging.info(f"Queue trigger: audio prewarm message {msg.id} (dequeue count {msg.dequeue_count})")
+        prewarm.handle_message(msg.get_body().decode("utf-8"))
@@ -0,0 +1,102 @@
+import logging
+import queue
+
+import azure.cognitiveservices.speech as speechsdk
+
+STREAM_CHUNK_BYTES = 16 * 1024 # Potongan saat audio dari store di-stream ulang
+
+_CHUNK = "chunk"
+_COMPLETED = "completed"
+_CANCELED = "canceled"
+
+
+class SynthesisCanceledError(RuntimeError):
+    """
+    Raised when the Speech service cancels a streamed synthesis.
+
+    Attributes:
+        reason: speechsdk.CancellationReason.
+        error_details (str): Service error details (empty unless reason is Error).
+        audio_sent (bool): True if audio chunks were already yielded before the cancellation.
+    """
+
+    def __init__(self, reason, error_details, audio_sent):
+        super().__init__(f"Synthesis canceled: {reason} {error_details or ''}".strip())
+        self.reason = reason
+        self.error_details = error_details
+        self.audio_sent = audio_sent
+
+    @property
+    def is_error(self):
+        return self.reason == speechsdk.CancellationReason.Error
+
+
+class AudioChunkStream:
+    """
+    Iterates over the audio of one synthesis as the service produces it.
+
+    Chunks come from the synthesizer's `synthesizing` event, so the first chunk is available
+    after the first audio frame instead of after the whole text was synthesized. The event
+    handlers are disconnected when iteration ends, because pooled synthesizers are reused.
+    If the consumer stops early (client disconnected), the synthesis is stopped.
+
+    Attributes (after iteration):
+        result: The final SpeechSynthesisResult (audio_data holds the complete audio).
+        abandoned (bool): True if iteration was stopped before the synthesis finished.
+    """
+
+    def __init__(self, synthesizer, text, chunk_timeout_seconds=30, ssml=False):
+        self.synthesizer = synthesizer
+        self.text = text
+        self.chunk_timeout_seconds = chunk_timeout_seconds
+        self.ssml = ssml
+        self.result = None
+        self.abandoned = False
+
+    def __iter__(self):
+        events = queue.SimpleQueue()
+        signals = (self.synthesizer.synthesizing, self.synthesizer.synthesis_completed, self.synthesizer.synthesis_canceled)
+        self.synthesizer.synthesizing.connect(lambda evt: events.put((_CHUNK, evt.result.audio_data)))
+        self.synthesizer.synthesis_completed.connect(lambda evt: events.put((_COMPLETED, evt.result)))
+        self.synthesizer.synthesis_canceled.connect(lambda evt: events.put((_CANCELED, evt.result)))
+        finished = False
+        audio_sent = False
+        try:
+            if self.ssml:
+                self.synthesizer.speak_ssml_async(self.text)
+            else:
+                self.synthesizer.speak_text_async(self.text)
+            while True:
+                try:
+                    kind, payload = events.get(timeout=self.chunk_timeout_seconds)
+                except queue.Empty:
+                    raise TimeoutError(f"No audio from the Speech service for {self.chunk_timeout_seconds}s.")
+                if kind == _CHUNK:
+                    if payload:
+                        audio_sent = True
+                        yield payload
+                    continue
+                finished = True
+                self.result = payload
+                if kind == _CANCELED:
+                    details = payload.cancellation_details
+                    raise SynthesisCanceledError(details.reason, details.error_details, audio_sent)
+                return
+        finally:
+            if not finished:
+                self.abandoned = True
+                try:
+                    self.synthesizer.stop_speaking_async().get()
+                except Exception as stop_err:
+                    logging.warning(f"Stopping abandoned synthesis failed: {stop_err}")
+            for signal in signals:
+                signal.disconnect_all()
+
+
+def iter_blob_chunks(blob, chunk_bytes=STREAM_CHUNK_BYTES):
+    """
+    Streams a stored AudioBlob in chunks and closes it afterwards.
+    """
+    with blob:
+        for start in range(0, blob.size, chunk_bytes):
+            yield blob.read(start, start + chunk_bytes)
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import azure.cognitiveservices.speech as speechsdk
+
+from shared_code import metrics
+
+
+class PooledSynthesizer:
+    """
+    A SpeechSynthesizer with its pre-opened service connection.
+    """
+
+    __slots__ = ("key", "synthesizer", "connection", "created_at", "last_used", "uses", "disconnected", "broken")
+
+    def __init__(self, key, synthesizer, connection):
+        self.key = key
+        self.synthesizer = synthesizer
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+        self.disconnected = False
+        self.broken = False
+
+    def mark_broken(self):
+        """
+        Marks the synthesizer as unusable (e.g. after a cancellation error); it is closed and
+        replaced instead of being returned to the pool.
+        """
+        self.broken = True
+
+    def close(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.close()
+        except Exception as close_err:
+            logging.debug(f"Closing synthesizer connection failed: {close_err}")
+
+
+def create_warm_synthesizer(key, speech_config):
+    """
+    Builds a SpeechSynthesizer (audio_config=None, audio is returned in result.audio_data) and
+    opens its connection up front, so the first synthesis does not pay for the handshake.
+    """
+    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+    connection = speechsdk.Connection.from_speech_synthesizer(synthesizer)
+    pooled = PooledSynthesizer(key, synthesizer, connection)
+
+    def on_disconnected(evt):
+        pooled.disconnected = True
+    connection.disconnected.connect(on_disconnected)
+    connection.open(True)
+    return pooled
+
+
+class SynthesizerPool:
+    """
+    Bounded pool of warm synthesizers per key (e.g. region/credential/voice/output format).
+
+    A synthesizer is leased by one request at a time. On release it goes back to the idle list
+    of its key unless it is broken, its connection dropped, or the idle bounds
+    (max_idle_per_key, max_idle_total) are reached. Idle synthesizers are health-checked on
+    acquire: disconnected ones and ones idle for longer than max_idle_seconds (the service
+    closes idle connections) are closed. Broken synthesizers are replaced in the background
+    through executor, so the next request still finds a warm one.
+
+    Counters `<name>.warm`, `<name>.cold`, `<name>.discarded` and `<name>.prewarmed` are kept in
+    shared_code.metrics.
+    """
+
+    def __init__(self, max_idle_per_key=2, max_idle_total=16, max_idle_seconds=180, executor=None,
+                 factory=create_warm_synthesizer, name="tts_synthesizer_pool"):
+        self.max_idle_per_key = max_idle_per_key
+        self.max_idle_total = max_idle_total
+        self.max_idle_seconds = max_idle_seconds
+        self.executor = executor
+        self.name = name
+        self._factory = factory
+        self._idle = {} # key -> deque[PooledSynthesizer], terbaru di kanan
+        self._idle_count = 0
+        self._lock = threading.Lock()
+
+    def _healthy(self, pooled, now):
+        return not pooled.broken and not pooled.disconnected and now - pooled.last_used <= self.max_idle_seconds
+
+    def acquire(self, key, speech_config):
+        """
+        Returns (PooledSynthesizer, warm): an idle healthy synthesizer for key, or a new one.
+        """
+        now = time.monotonic()
+        stale = []
+        pooled = None
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                candidate = idle.pop()
+                self._idle_count -= 1
+                if self._healthy(candidate, now):
+                    pooled = candidate
+                    break
+                stale.append(candidate)
+            if idle is not None and not idle:
+                del self._idle[key]
+        for candidate in stale:
+            metrics.increment(f"{self.name}.discarded")
+            candidate.close()
+
+        if pooled is not None:
+            metrics.increment(f"{self.name}.warm")
+            return pooled, True
+        metrics.increment(f"{self.name}.cold")
+        return self._factory(key, speech_config), False
+
+    def release(self, pooled, speech_config=None):
+        """
+        Returns a leased synthesizer to the pool. A broken one is closed and, if speech_config
+        is given, replaced by a new warm synthesizer in the background.
+        """
+        pooled.uses += 1
+        pooled.last_used = time.monotonic()
+        if pooled.broken or pooled.disconnected:
+            metrics.increment(f"{self.name}.discarded")
+            pooled.close()
+            if pooled.broken and speech_config is not None:
+                self.prewarm(pooled.key, speech_config)
+            return
+        self._add_idle(pooled)
+
+    def _add_idle(self, pooled):
+        evicted = None
+        with self._lock:
+            idle = self._idle.setdefault(pooled.key, deque())
+            if len(idle) >= self.max_idle_per_key or self.max_idle_total <= 0:
+                evicted = pooled
+            else:
+                if self._idle_count >= self.max_idle_total:
+                    # Tutup synthesizer idle yang paling lama tidak dipakai dari key mana pun
+                    oldest_key = min((k for k in self._idle if self._idle[k]), key=lambda k: self._idle[k][0].last_used)
+                    evicted = self._idle[oldest_key].popleft()
+                    self._idle_count -= 1
+                    if not self._idle[oldest_key]:
+                        del self._idle[oldest_key]
+                    idle = self._idle.setdefault(pooled.key, deque())
+                idle.append(pooled)
+                self._idle_count += 1
+        if evicted is not None:
+            metrics.increment(f"{self.name}.discarded")
+            evicted.close()
+
+    @contextmanager
+    def lease(self, key, speech_config):
+        """
+        Context manager yielding (PooledSynthesizer, warm); the synthesizer is released on exit
+        and marked broken if the block raised.
+        """
+        pooled, warm = self.acquire(key, speech_config)
+        try:
+            yield pooled, warm
+        except BaseException:
+            pooled.mark_broken()
+            raise
+        finally:
+            self.release(pooled, speech_config)
+
+    def prewarm(self, key, speech_config, count=1):
+        """
+        Adds count warm synthesizers for key in the background (no-op without an executor).
+        """
+        if self.executor is None:
+            return
+
+        def warm_up():
+            try:
+                self._add_idle(self._factory(key, speech_config))
+                metrics.increment(f"{self.name}.prewarmed")
+            except Exception as warm_err:
+                logging.warning(f"Synthesizer pool {self.name}: prewarm for {key} failed: {warm_err}")
+        try:
+            for _ in range(count):
+                self.executor.submit(warm_up)
+        except RuntimeError as submit_err: # Executor sudah dimatikan (worker berhenti)
+            logging.debug(f"Synthesizer pool {self.name}: prewarm skipped: {submit_err}")
+
+    def idle_count(self):
+        with self._lock:
+            return self._idle_count
@@ -4,6 +4,10 @@ import json
 import azure.functions as func
 import azure.cognitiveservices.speech as speechsdk
 
+from shared_code import clients, upload_ingest
+
+MAX_AUDIO_UPLOAD_SIZE_BYTES = int(os.environ.get("MAX_AUDIO_UPLOAD_SIZE_BYTES", 10 * 1024 * 1024)) # 10MB default
+
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request for PronunciationAssessmentFunc.')
 
@@ -18,6 +22,11 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json", status_code=500
             )
 
+        # Tolak request yang terlalu besar sebelum multipart di-parse
+        too_large = upload_ingest.check_request_size(req, MAX_AUDIO_UPLOAD_SIZE_BYTES + upload_ingest.MULTIPART_OVERHEAD_BYTES, "Audio")
+        if too_large:
+            return too_large
+
         audio_file_from_req = req.files.get('audio')
         reference_text = req.form.get('referenceText')
         language_code = req.form.get('languageCode', 'en-US') # Default ke en-US
@@ -31,10 +40,20 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json", status_code=400
             )
 
-        audio_bytes = audio_file_from_req.read() # Baca byte audio
+        try:
+            audio_bytes = upload_ingest.read_upload(audio_file_from_req, MAX_AUDIO_UPLOAD_SIZE_BYTES) # Baca byte audio
+        except upload_ingest.UploadTooLargeError as too_large_err:
+            logging.warning(f"Upload audio ditolak: {too_large_err}")
+            return upload_ingest.too_large_response("Audio", MAX_AUDIO_UPLOAD_SIZE_BYTES)
+        if not audio_bytes:
+            logging.warning("File audio kosong.")
+            return func.HttpResponse(
+                json.dumps({"error": "File audio tidak boleh kosong."}),
+                mimetype="application/json", status_code=400
+            )
 
-        # 4. Inisialisasi konfigurasi Azure AI Speech
-        speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=speech_region)
+        # 4. Ambil konfigurasi Azure AI Speech bersama (per bahasa) dari registry; jangan diubah setelah diambil
+        speech_config = clients.get_speech_config(speech_key, speech_region, recognition_language=language_code)
         
         # --- PERUBAHAN UNTUK AUDIO INPUT ---
         # Tentukan format stream audio jika memungkinkan (misalnya, jika Anda tahu itu MP3)
@@ -75,12 +94,11 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         )
         pronunciation_config.enable_miscue = True # Tambahkan ini untuk tes
         
-        speech_config.speech_recognition_language = language_code
         speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
         pronunciation_config.apply_to(speech_recognizer)
 
         # Tulis byte audio ke stream SEBELUM memulai recognizer
-        push_stream.write(audio_bytes)
+        push_stream.write(audio_bytes.tobytes()) # SDK (ctypes) hanya menerima bytes
         push_stream.close() # Menandakan akhir stream audio
 
         logging.info(f"Melakukan penilaian pelafalan untuk teks: '{reference_text}' bahasa: '{language_code}'...")
@@ -0,0 +1,113 @@
+"""
+Benchmark: lookup skenario mirip (GenerateLesson.similarity.ScenarioIndex) pada 1k-100k skenario.
+
+Target: p99 lookup < 1 ms per query sampai 100k skenario dalam satu bucket bahasa/level, tanpa menurunkan
+recall varian typo dan tanpa menyajikan skenario yang satu katanya diganti.
+
+Jalankan dari root repo:
+    python -m benchmarks.bench_lesson_similarity
+"""
+import random
+import statistics
+import time
+
+from GenerateLesson.cache import normalize_scenario
+from GenerateLesson.similarity import ScenarioIndex
+
+INDEX_SIZES = (1000, 10000, 100000)
+QUERY_COUNT = 500
+BUCKET = ("en", "id", "beginner")
+THRESHOLD = 0.8
+TARGET_P99_MS = 1.0
+
+ACTIONS = ("buying", "ordering", "asking for", "returning", "looking for", "paying for", "booking", "cancelling", "talking about", "describing")
+PLACES = ("at the station", "at a restaurant", "in the city", "at the hotel", "at the mall", "at the pharmacy", "at the airport", "at a cafe",
+          "at the bakery", "at school", "at the clinic", "at the library", "at the market", "at the bus stop", "at the cinema", "at the salon")
+SYLLABLES = ("ba", "ko", "ri", "ta", "me", "lu", "sa", "no", "pe", "di", "ga", "ju", "ne", "fo", "ki", "ra", "to", "ve", "zu", "la")
+VOCABULARY_SIZE = 20000
+
+
+def make_vocabulary(rng):
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def make_scenarios(count, seed=0):
+    # Objek/detail diambil dari kosakata sintetis dengan distribusi Zipf, mirip teks bebas pengguna
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    zipf_weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    scenarios = set()
+    while len(scenarios) < count:
+        objects = rng.choices(vocabulary, weights=zipf_weights, k=rng.randint(2, 4))
+        scenarios.add(f"{rng.choice(ACTIONS)} {' '.join(objects)} {rng.choice(PLACES)}")
+    return sorted(scenarios)
+
+def make_queries(scenarios, count, seed=1):
+    """
+    Returns (normalized_query, expected_scenario) pairs: half are near variants of an indexed
+    scenario (expected is that scenario), half are generic queries with no counterpart (None).
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count // 2):
+        # Varian dekat dari skenario yang ada: huruf besar, tanda baca dan satu huruf hilang (typo)
+        scenario = rng.choice(scenarios)
+        position = rng.randrange(len(scenario))
+        queries.append(((scenario[:position] + scenario[position + 1:]).upper() + "!", scenario))
+    for _ in range(count - count // 2):
+        queries.append((f"{rng.choice(ACTIONS)} {rng.choice(PLACES)}", None)) # Query generik tanpa padanan
+    return [(normalize_scenario(query), expected) for query, expected in queries]
+
+def make_substitutions(scenarios, count, seed=2):
+    """
+    Returns (normalized_query, source_scenario) pairs where the query is source_scenario with its
+    place replaced ("... at the hotel" -> "... at the clinic"); source_scenario must not be served.
+    """
+    rng = random.Random(seed)
+    indexed = set(scenarios)
+    substitutions = []
+    while len(substitutions) < count:
+        scenario = rng.choice(scenarios)
+        place = next(place for place in PLACES if scenario.endswith(place))
+        substituted = scenario[:-len(place)] + rng.choice(PLACES)
+        if substituted not in indexed:
+            substitutions.append((normalize_scenario(substituted), scenario))
+    return substitutions
+
+def main():
+    # recall: varian typo yang mendapat skenario asalnya; false+: query generik yang tetap mendapat match;
+    # subst+: skenario dengan tempat diganti yang tetap mendapat skenario asalnya (keduanya harus 0)
+    print(f"{'docs':>7} {'build s':>8} {'mean ms':>8} {'p50 ms':>7} {'p99 ms':>7} {'recall':>7} {'false+':>7} {'subst+':>7}  p99 < {TARGET_P99_MS} ms")
+    for size in INDEX_SIZES:
+        scenarios = make_scenarios(size)
+        index = ScenarioIndex(max_entries=size)
+        start = time.perf_counter()
+        for scenario in scenarios:
+            index.add(BUCKET, normalize_scenario(scenario), scenario)
+        build_seconds = time.perf_counter() - start
+
+        timings = []
+        hits = false_positives = 0
+        queries = make_queries(scenarios, QUERY_COUNT)
+        for query, expected in queries:
+            start = time.perf_counter()
+            value, _ = index.lookup(BUCKET, query, THRESHOLD)
+            timings.append((time.perf_counter() - start) * 1000)
+            if expected is not None:
+                hits += value == expected
+            else:
+                false_positives += value is not None
+        substituted_hits = sum(index.lookup(BUCKET, query, THRESHOLD)[0] == source for query, source in make_substitutions(scenarios, QUERY_COUNT // 2))
+        timings.sort()
+        near_count = sum(expected is not None for _, expected in queries)
+        p99 = timings[int(len(timings) * 0.99)]
+        print(
+            f"{size:>7} {build_seconds:>8.2f} {statistics.mean(timings):>8.3f} {timings[len(timings) // 2]:>7.3f} "
+            f"{p99:>7.3f} {hits / near_count:>7.1%} {false_positives:>7} {substituted_hits:>7}  {'OK' if p99 < TARGET_P99_MS else 'MISSED'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark: throughput pra-filter lexicon (Aho-Corasick) vs regex alternation naif.
+
+Throughput Aho-Corasick harus konstan (linear terhadap panjang input) berapa pun jumlah term.
+
+Jalankan dari root repo:
+    python -m benchmarks.bench_lexicon_filter
+"""
+import random
+import re
+import time
+
+from shared_code import lexicon_filter
+
+INPUT_SIZES = (200, 2000, 20000, 200000) # Karakter; scenarioDescription umumnya < 500
+SYNTHETIC_TERM_COUNTS = (100, 1000, 10000)
+WORDS = (
+    "saya", "ingin", "belajar", "memesan", "makanan", "di", "restoran", "bersama", "teman",
+    "I", "want", "to", "order", "food", "at", "the", "restaurant", "with", "my", "friends",
+    "quiero", "pedir", "comida", "en", "el", "restaurante", "con", "mis", "amigos", "café",
+)
+
+
+def make_text(size, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        parts.append(word)
+        length += len(word) + 1
+    return " ".join(parts)[:size]
+
+def make_synthetic_entries(count, seed=1):
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [
+        lexicon_filter.LexiconEntry("".join(rng.choice(letters) for _ in range(rng.randint(4, 10))), "en", "Violence", "block")
+        for _ in range(count)
+    ]
+
+def best_of(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    lexicon = lexicon_filter.LexiconFilter.from_file(lexicon_filter.DEFAULT_LEXICON_PATH)
+    print(f"Lexicon data: {len(lexicon.entries)} terms")
+    print(f"{'chars':>8} {'ms':>9} {'MB/s':>8}")
+    for size in INPUT_SIZES:
+        text = make_text(size)
+        seconds = best_of(lambda: lexicon.scan(text), 5 if size <= 20000 else 2)
+        print(f"{size:>8} {seconds * 1000:>9.3f} {size / seconds / 1e6:>8.2f}")
+
+    text = make_text(20000)
+    print("\n20000 chars, synthetic lexicons: Aho-Corasick vs regex alternation")
+    print(f"{'terms':>7} {'build ms':>9} {'ac ms':>8} {'regex ms':>9}")
+    for count in SYNTHETIC_TERM_COUNTS:
+        entries = make_synthetic_entries(count)
+        start = time.perf_counter()
+        synthetic = lexicon_filter.LexiconFilter(entries)
+        build_ms = (time.perf_counter() - start) * 1000
+        pattern = re.compile(r"\b(?:" + "|".join(re.escape(entry.term) for entry in entries) + r")\b")
+        normalized = lexicon_filter.normalize(text)[0]
+        ac_ms = best_of(lambda: synthetic.find_all(text), 3) * 1000
+        regex_ms = best_of(lambda: pattern.findall(normalized), 3) * 1000
+        print(f"{count:>7} {build_ms:>9.2f} {ac_ms:>8.3f} {regex_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
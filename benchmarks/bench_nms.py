@@ -0,0 +1,64 @@
+"""
+Benchmark: NMS Python lama (utils.apply_nms) vs engine NumPy (utils.apply_nms_vectorized).
+
+Jalankan dari root repo:
+    python -m benchmarks.bench_nms
+"""
+import random
+import time
+
+from DetectObjectsVisual import utils
+
+BOX_COUNTS = (10, 100, 1000, 10000)
+LABELS = ("person", "cup", "chair", "bottle", "book")
+IOU_THRESHOLD = 0.4
+SCORE_THRESHOLD = 0.05 # Threshold permisif, skenario terburuk di profil CPU
+IMAGE_SIZE = 1333
+
+
+def make_detections(count, seed=0):
+    rng = random.Random(seed)
+    detections = []
+    for _ in range(count):
+        width = rng.randint(20, 300)
+        height = rng.randint(20, 300)
+        detections.append({
+            'confidence': rng.random(),
+            'objectName': rng.choice(LABELS),
+            'boundingBox': {
+                'x': rng.randint(0, IMAGE_SIZE - width),
+                'y': rng.randint(0, IMAGE_SIZE - height),
+                'width': width,
+                'height': height
+            }
+        })
+    return detections
+
+def time_call(fn, detections, repeats):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(list(detections), iou_threshold=IOU_THRESHOLD, score_threshold=SCORE_THRESHOLD)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+def main():
+    print(f"{'boxes':>7} {'python ms':>11} {'numpy ms':>10} {'speedup':>8} {'kept':>6} {'same':>5}")
+    for count in BOX_COUNTS:
+        detections = make_detections(count)
+        repeats = 5 if count <= 1000 else 1
+        python_ms, python_result = time_call(utils.apply_nms, detections, repeats)
+        numpy_ms, numpy_result = time_call(utils.apply_nms_vectorized, detections, repeats)
+        same = python_result == numpy_result
+        print(f"{count:>7} {python_ms:>11.2f} {numpy_ms:>10.2f} {python_ms / numpy_ms:>7.1f}x {len(numpy_result):>6} {str(same):>5}")
+
+    for method in ("linear", "gaussian"):
+        detections = make_detections(1000)
+        start = time.perf_counter()
+        result = utils.apply_nms_vectorized(detections, IOU_THRESHOLD, SCORE_THRESHOLD, method=method)
+        print(f"soft-nms {method}: 1000 boxes in {(time.perf_counter() - start) * 1000:.2f} ms, kept {len(result)}")
+
+
+if __name__ == "__main__":
+    main()
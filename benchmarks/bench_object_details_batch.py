@@ -0,0 +1,76 @@
+"""
+Benchmark: token usage per object, N panggilan GetObjectDetailsVisual vs satu panggilan batch multi-gambar
+(GetObjectDetailsVisual.batch).
+
+Butuh AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY dan AZURE_OPENAI_DEPLOYMENT_NAME; token diambil dari `usage`
+respons Azure OpenAI, jadi angkanya adalah yang benar-benar ditagih. Crop dioptimasi seperti di endpoint.
+
+Jalankan dari root repo:
+    python -m benchmarks.bench_object_details_batch path/ke/crop1.jpg path/ke/crop2.jpg ...
+"""
+import argparse
+import os
+import sys
+import time
+
+from GetObjectDetailsVisual import batch, image_optimizer
+from shared_code import clients
+
+
+def prepare_crops(paths):
+    crops = []
+    for index, path in enumerate(paths):
+        with open(path, "rb") as image_file:
+            optimized = image_optimizer.optimize_for_vision(
+                image_file.read(),
+                low_detail_max_side=batch.VISION_LOW_DETAIL_MAX_SIDE,
+                target_bytes=batch.VISION_TARGET_BYTES,
+                image_format=batch.VISION_IMAGE_FORMAT,
+                min_quality=batch.VISION_MIN_QUALITY,
+                max_quality=batch.VISION_MAX_QUALITY
+            )
+        data_url = image_optimizer.to_data_url(optimized.image_bytes, optimized.mimetype)
+        crops.append(batch.PreparedCrop(index, os.path.basename(path), data_url, optimized.detail, None, False))
+    return crops
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-object token usage of single vs batched object details calls.")
+    parser.add_argument("images", nargs="+", help="Object crops (2 or more).")
+    parser.add_argument("--target", default="en")
+    parser.add_argument("--source", default="id")
+    args = parser.parse_args()
+
+    endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+    api_key = os.environ.get("AZURE_OPENAI_KEY")
+    deployment = os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME")
+    if not all([endpoint, api_key, deployment]) or len(args.images) < 2:
+        print("Set AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, AZURE_OPENAI_DEPLOYMENT_NAME and pass at least 2 crops.")
+        return 1
+
+    client = clients.get_openai_client(endpoint, api_key, api_version="2024-02-01")
+    crops = prepare_crops(args.images)
+    count = len(crops)
+
+    single_prompt = single_completion = 0
+    start = time.perf_counter()
+    for crop in crops:
+        _, (prompt_tokens, completion_tokens) = batch.request_single_details(client, deployment, crop, args.target, args.source)
+        single_prompt += prompt_tokens
+        single_completion += completion_tokens
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    details_by_index, (batch_prompt, batch_completion) = batch.request_batch_details(client, deployment, crops, args.target, args.source)
+    batch_seconds = time.perf_counter() - start
+
+    print(f"{'mode':>8} {'prompt/obj':>11} {'compl/obj':>10} {'total/obj':>10} {'seconds':>8}")
+    print(f"{'single':>8} {single_prompt / count:>11.0f} {single_completion / count:>10.0f} {(single_prompt + single_completion) / count:>10.0f} {single_seconds:>8.2f}")
+    print(f"{'batch':>8} {batch_prompt / count:>11.0f} {batch_completion / count:>10.0f} {(batch_prompt + batch_completion) / count:>10.0f} {batch_seconds:>8.2f}")
+    single_total = single_prompt + single_completion
+    print(f"token reduction per object: {(1 - (batch_prompt + batch_completion) / single_total) * 100:.1f}%" if single_total else "no usage reported")
+    print(f"batch items usable without fallback: {len(details_by_index)}/{count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
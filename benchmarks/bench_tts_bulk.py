@@ -0,0 +1,75 @@
+"""
+Benchmark: audio satu pelajaran, N panggilan sintesis terpisah (seperti N request GetTTSAudio) vs satu
+dokumen SSML dengan bookmark yang dipotong per item (GetTTSAudio.bulk).
+
+Kedua mode memakai synthesizer hangat dengan koneksi yang sudah dibuka, jadi selisihnya adalah overhead per
+panggilan sintesis; overhead HTTP per request GetTTSAudio dari klien belum termasuk. Butuh
+AZURE_AI_SERVICES_KEY dan AZURE_AI_SERVICES_REGION.
+
+Jalankan dari root repo:
+    python -m benchmarks.bench_tts_bulk
+    python -m benchmarks.bench_tts_bulk --voice id-ID-ArdiNeural --language id-ID --rounds 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from GetTTSAudio import bulk, formats, synthesizer_pool
+from shared_code import clients
+
+# Kosakata, frasa kunci dan contoh grammar seukuran satu pelajaran
+LESSON_TEXTS = (
+    "ticket", "platform", "departure", "luggage", "schedule", "delay",
+    "Where is the train station?", "One ticket to Bandung, please.", "What time does the train leave?",
+    "Is this seat taken?", "The train is delayed by ten minutes.",
+    "I would like to buy a return ticket.", "The train has already left."
+)
+
+
+def run_individual(synthesizer, texts):
+    start = time.perf_counter()
+    total_bytes = 0
+    for text in texts:
+        total_bytes += len(synthesizer.speak_text_async(text).get().audio_data)
+    return (time.perf_counter() - start) * 1000, total_bytes
+
+def run_bulk(synthesizer, texts, language_code, voice_name):
+    start = time.perf_counter()
+    clips = bulk.synthesize_clips(synthesizer, list(texts), language_code, voice_name)
+    return (time.perf_counter() - start) * 1000, sum(len(clip) for clip in clips)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare N single TTS calls with one bookmarked SSML call.")
+    parser.add_argument("--voice", default="en-US-AvaMultilingualNeural")
+    parser.add_argument("--language", default="en-US")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    speech_key = os.environ.get("AZURE_AI_SERVICES_KEY")
+    speech_region = os.environ.get("AZURE_AI_SERVICES_REGION")
+    if not speech_key or not speech_region:
+        print("Set AZURE_AI_SERVICES_KEY and AZURE_AI_SERVICES_REGION to run this benchmark.")
+        return 1
+    speech_config = clients.get_speech_config(speech_key, speech_region, voice_name=args.voice, output_format=formats.MP3.output_format)
+    pooled = synthesizer_pool.create_warm_synthesizer(("bench", args.voice), speech_config)
+    time.sleep(1) # Beri waktu koneksi terbuka
+
+    individual, bulk_runs = [], []
+    for _ in range(args.rounds):
+        individual.append(run_individual(pooled.synthesizer, LESSON_TEXTS))
+        bulk_runs.append(run_bulk(pooled.synthesizer, LESSON_TEXTS, args.language, args.voice))
+    pooled.close()
+
+    count = len(LESSON_TEXTS)
+    print(f"{count} items, {args.rounds} rounds")
+    print(f"{'mode':>11} {'median ms':>10} {'ms/item':>8} {'bytes':>8} {'calls':>6}")
+    for name, runs, calls in (("individual", individual, count), ("bulk", bulk_runs, 1)):
+        median_ms = statistics.median(ms for ms, _ in runs)
+        print(f"{name:>11} {median_ms:>10.0f} {median_ms / count:>8.0f} {runs[-1][1]:>8} {calls:>6}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Benchmark: latency byte pertama GetTTSAudio, SpeechSynthesizer baru per request (perilaku lama) vs pool
+synthesizer hangat dengan koneksi yang sudah dibuka (GetTTSAudio.synthesizer_pool).
+
+Byte pertama = waktu mendapatkan synthesizer + SpeechServiceResponse_SynthesisFirstByteLatencyMs dari SDK.
+Butuh AZURE_AI_SERVICES_KEY dan AZURE_AI_SERVICES_REGION.
+
+Jalankan dari root repo:
+    python -m benchmarks.bench_tts_first_byte
+    python -m benchmarks.bench_tts_first_byte --voice id-ID-ArdiNeural --rounds 30
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import azure.cognitiveservices.speech as speechsdk
+
+from GetTTSAudio import formats, synthesizer_pool
+from shared_code import clients
+
+TEXTS = ("apple", "chair", "Where is the train station?", "I would like a cup of tea, please.", "bicycle")
+
+
+def first_byte_ms(result, acquire_ms):
+    return acquire_ms + int(result.properties.get_property(speechsdk.PropertyId.SpeechServiceResponse_SynthesisFirstByteLatencyMs) or 0)
+
+def run_cold(speech_config, rounds):
+    samples = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        acquire_ms = (time.perf_counter() - start) * 1000
+        result = synthesizer.speak_text_async(TEXTS[i % len(TEXTS)]).get()
+        samples.append(first_byte_ms(result, acquire_ms))
+        del synthesizer
+    return samples
+
+def run_pooled(speech_config, rounds):
+    pool = synthesizer_pool.SynthesizerPool()
+    key = ("bench", speech_config.speech_synthesis_voice_name)
+    pool.release(synthesizer_pool.create_warm_synthesizer(key, speech_config)) # Seperti prewarm saat worker start
+    time.sleep(1) # Beri waktu koneksi terbuka
+    samples = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        with pool.lease(key, speech_config) as (pooled, _):
+            acquire_ms = (time.perf_counter() - start) * 1000
+            result = pooled.synthesizer.speak_text_async(TEXTS[i % len(TEXTS)]).get()
+        samples.append(first_byte_ms(result, acquire_ms))
+    return samples
+
+def summarize(name, samples):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{name:>7} {statistics.median(ordered):>9.0f} {p95:>9.0f} {statistics.mean(ordered):>9.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare TTS first-byte latency with and without the synthesizer pool.")
+    parser.add_argument("--voice", default="en-US-AvaMultilingualNeural")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    speech_key = os.environ.get("AZURE_AI_SERVICES_KEY")
+    speech_region = os.environ.get("AZURE_AI_SERVICES_REGION")
+    if not speech_key or not speech_region:
+        print("Set AZURE_AI_SERVICES_KEY and AZURE_AI_SERVICES_REGION to run this benchmark.")
+        return 1
+    speech_config = clients.get_speech_config(speech_key, speech_region, voice_name=args.voice, output_format=formats.MP3.output_format)
+
+    print(f"{'mode':>7} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+    summarize("cold", run_cold(speech_config, args.rounds))
+    summarize("pooled", run_pooled(speech_config, args.rounds))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Benchmark: ukuran audio di jaringan per format output GetTTSAudio (GetTTSAudio.formats) untuk teks seukuran
+kosakata dan frasa satu pelajaran, relatif terhadap MP3 32 kbps (format default).
+
+Butuh AZURE_AI_SERVICES_KEY dan AZURE_AI_SERVICES_REGION.
+
+Jalankan dari root repo:
+    python -m benchmarks.bench_tts_formats
+    python -m benchmarks.bench_tts_formats --voice id-ID-ArdiNeural
+"""
+import argparse
+import os
+import sys
+import time
+
+import azure.cognitiveservices.speech as speechsdk
+
+from GetTTSAudio import formats
+from shared_code import clients
+
+TEXTS = (
+    "ticket", "platform", "luggage", "Where is the train station?",
+    "One ticket to Bandung, please.", "The train is delayed by ten minutes."
+)
+
+
+def measure(speech_key, speech_region, voice_name, audio_format):
+    speech_config = clients.get_speech_config(speech_key, speech_region, voice_name=voice_name, output_format=audio_format.output_format)
+    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+    total_bytes = 0
+    total_seconds = 0.0
+    start = time.perf_counter()
+    for text in TEXTS:
+        result = synthesizer.speak_text_async(text).get()
+        if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+            raise RuntimeError(f"{audio_format.name}: synthesis failed ({result.reason})")
+        total_bytes += len(result.audio_data)
+        total_seconds += result.audio_duration.total_seconds()
+    return total_bytes, total_seconds, (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare TTS audio bytes per output format.")
+    parser.add_argument("--voice", default="en-US-AvaMultilingualNeural")
+    args = parser.parse_args()
+
+    speech_key = os.environ.get("AZURE_AI_SERVICES_KEY")
+    speech_region = os.environ.get("AZURE_AI_SERVICES_REGION")
+    if not speech_key or not speech_region:
+        print("Set AZURE_AI_SERVICES_KEY and AZURE_AI_SERVICES_REGION to run this benchmark.")
+        return 1
+
+    results = {name: measure(speech_key, speech_region, args.voice, audio_format) for name, audio_format in formats.FORMATS.items()}
+    mp3_bytes = results[formats.MP3.name][0]
+    print(f"{len(TEXTS)} texts, voice {args.voice}")
+    print(f"{'format':>10} {'bytes':>9} {'kbps':>6} {'vs mp3':>7} {'ms':>7}")
+    for name, (total_bytes, total_seconds, elapsed_ms) in results.items():
+        kbps = total_bytes * 8 / 1000 / total_seconds if total_seconds else 0
+        print(f"{name:>10} {total_bytes:>9} {kbps:>6.1f} {total_bytes / mp3_bytes:>7.2f} {elapsed_ms:>7.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Offline job: precompute object details for every label DetectObjectsVisual can emit and write
+the memory-mapped catalog used by GetObjectDetailsVisual (mode 'detectedLabel').
+
+Every entry is generated by Azure OpenAI from the label, must match the details schema
+completely (no truncation repair, no empty object) and must pass Azure AI Content Safety;
+entries that fail are left out, so those labels keep using the vision path.
+
+Jalankan dari root repo (butuh AZURE_OPENAI_* dan CONTENT_SAFETY_* di environment):
+    python -m scripts.precompute_object_catalog
+    python -m scripts.precompute_object_catalog --pairs en:id --labels cup,chair --output /tmp/catalog.bin
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from shared_code import clients, content_safety, llm_json
+from GetObjectDetailsVisual import (
+    LANGUAGE_NAMES, OBJECT_DETAILS_CATALOG_PATH, build_system_prompt, catalog, details_schema, details_texts
+)
+
+DEFAULT_LANGUAGE_PAIRS = "en:id,id:en"
+MAX_TOKENS = 1000
+TEMPERATURE = 0.3
+
+
+def parse_pairs(pairs_arg):
+    pairs = []
+    for pair in pairs_arg.split(","):
+        target_lang_code, _, source_lang_code = pair.strip().partition(":")
+        if target_lang_code not in LANGUAGE_NAMES or source_lang_code not in LANGUAGE_NAMES or target_lang_code == source_lang_code:
+            raise ValueError(f"Invalid language pair '{pair}' (expected target:source from {sorted(LANGUAGE_NAMES)}).")
+        pairs.append((target_lang_code, source_lang_code))
+    return pairs
+
+def generate_entry(client, deployment, label, target_lang_code, source_lang_code):
+    """
+    Returns the verified details for one label and language pair.
+
+    Raises:
+        ValueError: If the output is empty, truncated, off-schema or blocked by Content Safety.
+    """
+    target_language_name = LANGUAGE_NAMES[target_lang_code]
+    source_language_name = LANGUAGE_NAMES[source_lang_code]
+    response = client.chat.completions.create(
+        model=deployment,
+        messages=[
+            {"role": "system", "content": build_system_prompt(target_lang_code, source_lang_code, from_label=True)},
+            {"role": "user", "content": f"The object is: '{label}'. Please provide details in {target_language_name} with {source_language_name} translations."}
+        ],
+        max_tokens=MAX_TOKENS,
+        temperature=TEMPERATURE
+    )
+    content = response.choices[0].message.content if response.choices else None
+    parse_result = llm_json.parse(content, details_schema(target_lang_code, source_lang_code), name="object_catalog_job.llm_json")
+    if not parse_result.value or parse_result.repaired or parse_result.schema_errors:
+        raise ValueError(f"incomplete output (repaired={parse_result.repaired}, schema_errors={parse_result.schema_errors[:3]})")
+
+    verdict = content_safety.analyze_texts(details_texts(parse_result.value))
+    if verdict.blocked:
+        raise ValueError(f"blocked by Content Safety: {', '.join(verdict.blocked_categories)}")
+    return parse_result.value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the object details catalog for all detector labels.")
+    parser.add_argument("--output", default=OBJECT_DETAILS_CATALOG_PATH, help="Catalog file to write.")
+    parser.add_argument("--pairs", default=DEFAULT_LANGUAGE_PAIRS, help="Comma-separated target:source language pairs.")
+    parser.add_argument("--labels", default=None, help="Comma-separated subset of labels (default: all COCO labels).")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent Azure OpenAI calls.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+    api_key = os.environ.get("AZURE_OPENAI_KEY")
+    deployment = os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME")
+    if not all([endpoint, api_key, deployment]):
+        logging.error("AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY and AZURE_OPENAI_DEPLOYMENT_NAME must be set.")
+        return 1
+    if not content_safety.is_configured():
+        # Entri katalog dilayani tanpa pemeriksaan lagi saat request, jadi safety di sini wajib
+        logging.error("Content Safety is not configured; catalog entries cannot be verified.")
+        return 1
+
+    pairs = parse_pairs(args.pairs)
+    labels = [catalog.normalize_label(label) for label in args.labels.split(",")] if args.labels else list(catalog.COCO_LABELS)
+    jobs = [(label, target, source) for label in labels for target, source in pairs]
+    client = clients.get_openai_client(endpoint, api_key)
+
+    def run(job):
+        label, target, source = job
+        try:
+            return job, generate_entry(client, deployment, label, target, source), None
+        except Exception as job_err:
+            return job, None, job_err
+
+    start = time.perf_counter()
+    entries = []
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        for (label, target, source), details, job_err in executor.map(run, jobs):
+            if job_err is not None:
+                logging.warning(f"Skipped '{label}' {target}->{source}: {job_err}")
+                continue
+            entries.append((label, target, source, details))
+
+    written = catalog.write_catalog(args.output, entries)
+    logging.info(
+        f"Wrote {written}/{len(jobs)} entries to {args.output} ({os.path.getsize(args.output)} bytes) "
+        f"in {time.perf_counter() - start:.1f}s."
+    )
+    return 0 if written == len(jobs) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
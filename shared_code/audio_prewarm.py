@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import metrics
+
+# Paket azure-storage-queue hanya dibutuhkan untuk backend "storage" (Azure Storage Queue / Azurite)
+try:
+    from azure.core.exceptions import ResourceExistsError
+    from azure.storage.queue import QueueClient, TextBase64EncodePolicy
+    STORAGE_QUEUE_AVAILABLE = True
+except ImportError:
+    STORAGE_QUEUE_AVAILABLE = False
+
+BACKEND_MEMORY = "memory"
+BACKEND_STORAGE = "storage"
+
+# Kosakata/frasa pelajaran yang baru dibuat disintesis ke store audio TTS sebelum klien memintanya.
+# "memory": antrean di proses ini (juga dipakai untuk test); "storage": Azure Storage Queue + queue trigger
+# (lokal dengan Azurite: LESSON_AUDIO_PREWARM_CONNECTION menunjuk ke "UseDevelopmentStorage=true").
+# Store audio TTS ada di /tmp lokal tiap instance: backend "storage" hanya bermanfaat untuk deployment satu
+# instance, karena setelah scale-out audio tersimpan di instance yang memproses pesan, bukan yang melayani GetTTSAudio.
+LESSON_AUDIO_PREWARM_ENABLED = os.environ.get("LESSON_AUDIO_PREWARM_ENABLED", "true").lower() == "true"
+LESSON_AUDIO_PREWARM_BACKEND = os.environ.get("LESSON_AUDIO_PREWARM_BACKEND", BACKEND_MEMORY).lower()
+LESSON_AUDIO_PREWARM_QUEUE_NAME = os.environ.get("LESSON_AUDIO_PREWARM_QUEUE_NAME", "tts-prewarm")
+LESSON_AUDIO_PREWARM_CONNECTION = os.environ.get("LESSON_AUDIO_PREWARM_CONNECTION", "AzureWebJobsStorage") # Nama app setting connection string
+LESSON_AUDIO_PREWARM_MAX_PENDING = int(os.environ.get("LESSON_AUDIO_PREWARM_MAX_PENDING", 256)) # Pesan di antrean memory
+LESSON_AUDIO_PREWARM_MAX_TEXTS = int(os.environ.get("LESSON_AUDIO_PREWARM_MAX_TEXTS", 24)) # Per pesan (satu pelajaran)
+
+
+def encode_message(texts, language_code):
+    return json.dumps({"texts": texts, "languageCode": language_code}, ensure_ascii=False)
+
+def decode_message(body):
+    """
+    Returns (texts, language_code) from a prewarm message.
+
+    Raises:
+        ValueError: If the message is not a valid prewarm message.
+    """
+    message = json.loads(body)
+    if not isinstance(message, dict):
+        raise ValueError("Prewarm message must be a JSON object.")
+    texts = message.get("texts")
+    language_code = message.get("languageCode")
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts) or not isinstance(language_code, str) or not language_code:
+        raise ValueError("Prewarm message needs 'texts' (list of strings) and 'languageCode'.")
+    return texts, language_code
+
+
+class InProcessQueue:
+    """
+    Bounded in-process queue drained by one background thread that passes each message body to
+    the handler set with set_handler(). Messages put before a handler is set wait in the queue;
+    put() drops the message when max_pending is reached.
+    """
+
+    def __init__(self, max_pending=256, name="lesson_audio_prewarm"):
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._handler = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def set_handler(self, handler):
+        with self._lock:
+            self._handler = handler
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"{self.name}-worker", daemon=True)
+                self._worker.start()
+
+    def put(self, body):
+        try:
+            self._queue.put_nowait(body)
+            return True
+        except queue.Full:
+            return False
+
+    def join(self):
+        """
+        Blocks until every message put so far has been handled (requires a handler).
+        """
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            body = self._queue.get()
+            try:
+                self._handler(body)
+                metrics.increment(f"{self.name}.processed")
+            except Exception as handler_err:
+                metrics.increment(f"{self.name}.failed")
+                logging.error(f"Queue {self.name}: prewarm message failed: {handler_err}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+
+class StorageQueue:
+    """
+    Sends messages to an Azure Storage Queue (base64 text, as the Functions queue trigger expects
+    by default). Sends run on a background thread so they stay off the request path; the queue
+    is created on first use.
+    """
+
+    def __init__(self, connection_setting, queue_name, name="lesson_audio_prewarm"):
+        self.connection_setting = connection_setting
+        self.queue_name = queue_name
+        self.name = name
+        self._client = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lesson-audio-prewarm-send")
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                client = QueueClient.from_connection_string(
+                    os.environ[self.connection_setting], self.queue_name, message_encode_policy=TextBase64EncodePolicy()
+                )
+                try:
+                    client.create_queue()
+                except ResourceExistsError:
+                    pass
+                self._client = client
+            return self._client
+
+    def _send(self, body):
+        try:
+            self._get_client().send_message(body)
+        except Exception as send_err:
+            metrics.increment(f"{self.name}.failed")
+            logging.error(f"Queue {self.name}: failed to send prewarm message to '{self.queue_name}': {send_err}")
+
+    def put(self, body):
+        try:
+            self._executor.submit(self._send, body)
+            return True
+        except RuntimeError: # Executor sudah dimatikan (worker berhenti)
+            return False
+
+
+def _create_queue():
+    if not LESSON_AUDIO_PREWARM_ENABLED:
+        return None
+    if LESSON_AUDIO_PREWARM_BACKEND == BACKEND_STORAGE:
+        if not STORAGE_QUEUE_AVAILABLE:
+            logging.error("LESSON_AUDIO_PREWARM_BACKEND=storage needs the azure-storage-queue package; lesson audio prewarm is disabled.")
+            return None
+        if not os.environ.get(LESSON_AUDIO_PREWARM_CONNECTION):
+            logging.error(f"App setting '{LESSON_AUDIO_PREWARM_CONNECTION}' is not set; lesson audio prewarm is disabled.")
+            return None
+        return StorageQueue(LESSON_AUDIO_PREWARM_CONNECTION, LESSON_AUDIO_PREWARM_QUEUE_NAME)
+    if LESSON_AUDIO_PREWARM_BACKEND != BACKEND_MEMORY:
+        logging.error(f"Unknown LESSON_AUDIO_PREWARM_BACKEND '{LESSON_AUDIO_PREWARM_BACKEND}'; lesson audio prewarm is disabled.")
+        return None
+    return InProcessQueue(LESSON_AUDIO_PREWARM_MAX_PENDING)
+
+prewarm_queue = _create_queue()
+
+
+def set_handler(handler):
+    """
+    Registers the consumer of the in-process queue (no-op for the storage backend, whose
+    messages are delivered to the queue trigger).
+    """
+    if isinstance(prewarm_queue, InProcessQueue):
+        prewarm_queue.set_handler(handler)
+
+def enqueue(texts, language_code):
+    """
+    Enqueues texts (duplicates and blank strings removed) for audio prewarm.
+
+    Returns:
+        bool: True if a message was enqueued.
+    """
+    if prewarm_queue is None:
+        return False
+    # Teks tidak di-strip: audioId dihitung dari teks persis seperti yang nanti dikirim klien ke GetTTSAudio
+    unique_texts = list(dict.fromkeys(text for text in texts if isinstance(text, str) and text.strip()))[:LESSON_AUDIO_PREWARM_MAX_TEXTS]
+    if not unique_texts:
+        return False
+    if not prewarm_queue.put(encode_message(unique_texts, language_code)):
+        metrics.increment("lesson_audio_prewarm.dropped")
+        logging.warning(f"Lesson audio prewarm queue is full, dropped {len(unique_texts)} text(s).")
+        return False
+    metrics.increment("lesson_audio_prewarm.enqueued")
+    metrics.increment("lesson_audio_prewarm.texts", len(unique_texts))
+    return True
@@ -0,0 +1,285 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import azure.cognitiveservices.speech as speechsdk
+import huggingface_hub
+import openai
+import requests
+import urllib3
+from azure.ai.contentsafety import ContentSafetyClient
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+# --- KONFIGURASI ---
+# Satu pool koneksi per upstream per proses. Keep-alive dibuat lebih panjang dari default httpx (5s)
+# agar koneksi TLS tetap hangat di antara request yang jaraknya beberapa detik.
+HTTP_POOL_MAX_CONNECTIONS = int(os.environ.get("HTTP_POOL_MAX_CONNECTIONS", 100))
+HTTP_POOL_MAX_KEEPALIVE = int(os.environ.get("HTTP_POOL_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY_SECONDS", 90))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("HTTP_CONNECT_TIMEOUT_SECONDS", 5))
+
+OPENAI_API_VERSION = os.environ.get("AZURE_OPENAI_API_VERSION", "2024-02-01")
+OPENAI_READ_TIMEOUT_SECONDS = float(os.environ.get("AZURE_OPENAI_READ_TIMEOUT_SECONDS", 60))
+OPENAI_MAX_RETRIES = int(os.environ.get("AZURE_OPENAI_MAX_RETRIES", 2))
+
+CONTENT_SAFETY_READ_TIMEOUT_SECONDS = float(os.environ.get("CONTENT_SAFETY_READ_TIMEOUT_SECONDS", 15))
+
+# SpeechConfig bersifat mutable (voice, format, bahasa), jadi satu instance disimpan per kombinasi setting
+SPEECH_CONFIG_MAX_ENTRIES = int(os.environ.get("SPEECH_CONFIG_MAX_ENTRIES", 64))
+
+UPSTREAMS = ("openai", "content_safety", "huggingface")
+
+
+class ClientRegistry:
+    """
+    Thread-safe registry of long-lived clients, keyed by (upstream, endpoint, credential fingerprint, ...).
+
+    Each client is created once on first use and shared by every request in the process.
+    The optional max_entries bounds the registry with LRU eviction.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, factory):
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+            client = factory()
+            self._clients[key] = client
+            if self.max_entries is not None and len(self._clients) > self.max_entries:
+                self._clients.popitem(last=False)
+            return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+_registry = ClientRegistry()
+_speech_configs = ClientRegistry(max_entries=SPEECH_CONFIG_MAX_ENTRIES)
+
+
+def credential_fingerprint(secret):
+    """
+    Short, non-reversible id for a key/token so it can be part of a registry key or a log line.
+    """
+    return hashlib.sha256((secret or "").encode("utf-8")).hexdigest()[:12]
+
+# --- Statistik reuse koneksi ---
+# requests: jumlah request HTTP; new_connections: koneksi TCP baru (termasuk handshake TLS).
+# Reuse ratio = 1 - new_connections / requests.
+
+def _httpx_trace(upstream):
+    def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            metrics.increment(f"clients.{upstream}.new_connections")
+        elif event_name == "connection.start_tls.complete":
+            metrics.increment(f"clients.{upstream}.tls_handshakes")
+    return trace
+
+def _httpx_request_hook(upstream):
+    trace = _httpx_trace(upstream)
+
+    def on_request(request):
+        metrics.increment(f"clients.{upstream}.requests")
+        request.extensions["trace"] = trace
+    return on_request
+
+def _counting_pool_class(base_class, upstream):
+    class CountingConnectionPool(base_class):
+        def _new_conn(self):
+            metrics.increment(f"clients.{upstream}.new_connections")
+            return super()._new_conn()
+    return CountingConnectionPool
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """
+    requests adapter that counts requests and new urllib3 connections for an upstream.
+    """
+
+    def __init__(self, upstream, **kwargs):
+        self.upstream = upstream
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(urllib3.HTTPConnectionPool, self.upstream),
+            "https": _counting_pool_class(urllib3.HTTPSConnectionPool, self.upstream),
+        }
+
+    def send(self, request, **kwargs):
+        metrics.increment(f"clients.{self.upstream}.requests")
+        return super().send(request, **kwargs)
+
+def connection_stats():
+    """
+    Returns per-upstream request counts, new connections and connection reuse ratio.
+    """
+    stats = {}
+    for upstream in UPSTREAMS:
+        requests_count = metrics.get(f"clients.{upstream}.requests")
+        new_connections = metrics.get(f"clients.{upstream}.new_connections")
+        stats[upstream] = {
+            "requests": requests_count,
+            "new_connections": new_connections,
+            "tls_handshakes": metrics.get(f"clients.{upstream}.tls_handshakes"),
+            "reuse_ratio": round(max(0.0, 1 - new_connections / requests_count), 4) if requests_count else None,
+        }
+    stats["speech_config"] = {
+        "created": metrics.get("clients.speech_config.created"),
+        "reused": metrics.get("clients.speech_config.reused"),
+    }
+    return stats
+
+# --- Factory per upstream ---
+
+# openai < 1.17 tidak punya DefaultHttpxClient/DEFAULT_CONNECTION_LIMITS: pakai HTTP client bawaan SDK
+_OPENAI_HTTPX_AVAILABLE = hasattr(openai, "DefaultHttpxClient") and hasattr(openai, "DEFAULT_CONNECTION_LIMITS")
+
+def _httpx_limits():
+    # Limits diambil dari paket httpx yang dipakai SDK openai, tanpa mengimpor httpx secara langsung
+    return type(openai.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+def get_openai_client(endpoint, api_key, api_version=OPENAI_API_VERSION):
+    """
+    Returns the shared AzureOpenAI client for endpoint/key/api_version.
+
+    The client owns one pooled HTTP client with tuned keep-alive, pool limits and timeouts,
+    so consecutive requests reuse warm TLS connections instead of handshaking every call.
+    """
+    def factory():
+        timeout = openai.Timeout(OPENAI_READ_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+        logging.info(f"Creating shared AzureOpenAI client for {endpoint} (key {credential_fingerprint(api_key)}, api_version {api_version}).")
+        if not _OPENAI_HTTPX_AVAILABLE:
+            logging.warning("openai SDK without DefaultHttpxClient; using its default connection pool (no reuse metrics).")
+            return openai.AzureOpenAI(
+                azure_endpoint=endpoint,
+                api_key=api_key,
+                api_version=api_version,
+                max_retries=OPENAI_MAX_RETRIES,
+                timeout=timeout,
+            )
+        http_client = openai.DefaultHttpxClient(
+            limits=_httpx_limits(),
+            timeout=timeout,
+            event_hooks={"request": [_httpx_request_hook("openai")]},
+        )
+        return openai.AzureOpenAI(
+            azure_endpoint=endpoint,
+            api_key=api_key,
+            api_version=api_version,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=http_client,
+        )
+    return _registry.get_or_create(("openai", endpoint, credential_fingerprint(api_key), api_version), factory)
+
+def get_content_safety_client(endpoint, key):
+    """
+    Returns the shared ContentSafetyClient for endpoint/key, backed by a pooled requests session.
+    """
+    def factory():
+        session = requests.Session()
+        adapter = _CountingHTTPAdapter(
+            "content_safety",
+            pool_connections=1,
+            pool_maxsize=HTTP_POOL_MAX_KEEPALIVE,
+            max_retries=urllib3.Retry(total=False, redirect=False, raise_on_status=False), # Retry ditangani pipeline azure-core
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        transport = RequestsTransport(
+            session=session,
+            session_owner=False,
+            connection_timeout=HTTP_CONNECT_TIMEOUT_SECONDS,
+            read_timeout=CONTENT_SAFETY_READ_TIMEOUT_SECONDS,
+        )
+        logging.info(f"Creating shared ContentSafetyClient for {endpoint} (key {credential_fingerprint(key)}).")
+        return ContentSafetyClient(endpoint, AzureKeyCredential(key), transport=transport)
+    return _registry.get_or_create(("content_safety", endpoint, credential_fingerprint(key)), factory)
+
+_hf_session_configured = False
+
+def _configure_hf_session():
+    """
+    Replaces huggingface_hub's process-wide HTTP client with one that has tuned pool limits
+    and reports connection reuse. InferenceClient instances all share this session.
+    """
+    global _hf_session_configured
+    if _hf_session_configured:
+        return
+    if not hasattr(huggingface_hub, "set_client_factory") or not _OPENAI_HTTPX_AVAILABLE:
+        # huggingface_hub < 1.0 (session requests sendiri) atau openai lama: tetap pakai session bawaan library
+        logging.info("huggingface_hub without set_client_factory; using its default HTTP session (no reuse metrics).")
+        _hf_session_configured = True
+        return
+    default_hooks = []
+    try:
+        from huggingface_hub.utils._http import hf_request_event_hook
+        default_hooks.append(hf_request_event_hook) # Menyisipkan header standar huggingface_hub
+    except ImportError:
+        pass
+
+    def client_factory():
+        # huggingface_hub juga memakai httpx; DefaultHttpxClient adalah httpx.Client biasa dengan default openai
+        return openai.DefaultHttpxClient(
+            limits=_httpx_limits(),
+            event_hooks={"request": default_hooks + [_httpx_request_hook("huggingface")]},
+            follow_redirects=True,
+            timeout=None, # Timeout per request diatur oleh InferenceClient
+        )
+    huggingface_hub.set_client_factory(client_factory)
+    _hf_session_configured = True
+
+def get_hf_inference_client(token, timeout, headers=None):
+    """
+    Returns the shared HuggingFace InferenceClient for token/timeout/headers.
+    """
+    def factory():
+        _configure_hf_session()
+        logging.info(f"Creating shared HuggingFace InferenceClient (token {credential_fingerprint(token)}, timeout {timeout}s).")
+        return huggingface_hub.InferenceClient(token=token, timeout=timeout, headers=headers)
+    header_key = tuple(sorted((headers or {}).items()))
+    return _registry.get_or_create(("huggingface", credential_fingerprint(token), timeout, header_key), factory)
+
+def get_speech_config(key, region, voice_name=None, output_format=None, recognition_language=None):
+    """
+    Returns a shared SpeechConfig for key/region and the given per-request settings.
+
+    SpeechConfig is mutable, so callers must not change the returned instance; a separate
+    instance is kept for each combination of settings (bounded by SPEECH_CONFIG_MAX_ENTRIES).
+    """
+    created = []
+
+    def factory():
+        speech_config = speechsdk.SpeechConfig(subscription=key, region=region)
+        if voice_name:
+            speech_config.speech_synthesis_voice_name = voice_name
+        if output_format is not None:
+            speech_config.set_speech_synthesis_output_format(output_format)
+        if recognition_language:
+            speech_config.speech_recognition_language = recognition_language
+        created.append(True)
+        return speech_config
+
+    speech_config = _speech_configs.get_or_create((region, credential_fingerprint(key), voice_name, output_format, recognition_language), factory)
+    metrics.increment("clients.speech_config.created" if created else "clients.speech_config.reused")
+    return speech_config
@@ -0,0 +1,372 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from azure.ai.contentsafety.models import (
+    AnalyzeImageOptions,
+    AnalyzeTextOptions,
+    ImageCategory,
+    ImageData,
+    TextCategory
+)
+
+from . import clients, metrics
+from .ttl_cache import build_tiered_cache
+
+# --- KONFIGURASI ---
+CONTENT_SAFETY_ENDPOINT = os.environ.get("CONTENT_SAFETY_ENDPOINT")
+CONTENT_SAFETY_KEY = os.environ.get("CONTENT_SAFETY_KEY")
+
+# Nama kategori kanonik (sesuai nilai enum SDK) -> nama yang ditampilkan di pesan error
+CATEGORIES = ("Sexual", "Violence", "Hate", "SelfHarm")
+CATEGORY_DISPLAY_NAMES = {"Sexual": "Sexual", "Violence": "Violence", "Hate": "Hate", "SelfHarm": "Self-Harm"}
+
+# Threshold sensitivitas tinggi (skor rendah) untuk pengguna anak-anak. Severity >= threshold diblokir.
+CATEGORY_THRESHOLDS = {
+    "Sexual": int(os.environ.get("CONTENT_SAFETY_THRESHOLD_SEXUAL", 1)),
+    "Violence": int(os.environ.get("CONTENT_SAFETY_THRESHOLD_VIOLENCE", 1)),
+    "Hate": int(os.environ.get("CONTENT_SAFETY_THRESHOLD_HATE", 1)),
+    "SelfHarm": int(os.environ.get("CONTENT_SAFETY_THRESHOLD_SELF_HARM", 1)),
+}
+
+CONTENT_SAFETY_CACHE_MAX_ENTRIES = int(os.environ.get("CONTENT_SAFETY_CACHE_MAX_ENTRIES", 4096))
+CONTENT_SAFETY_CACHE_TTL_SECONDS = int(os.environ.get("CONTENT_SAFETY_CACHE_TTL_SECONDS", 24 * 3600))
+CONTENT_SAFETY_CACHE_SQLITE_PATH = os.environ.get("CONTENT_SAFETY_CACHE_SQLITE_PATH") # Opsional
+
+# Batas layanan untuk analyze_text adalah 10.000 karakter per request; sisakan margin untuk separator
+CONTENT_SAFETY_TEXT_CHUNK_CHARS = int(os.environ.get("CONTENT_SAFETY_TEXT_CHUNK_CHARS", 7500))
+CONTENT_SAFETY_TEXT_MAX_WORKERS = int(os.environ.get("CONTENT_SAFETY_TEXT_MAX_WORKERS", 4))
+
+_IMAGE_CATEGORY_ENUMS = {
+    "Sexual": ImageCategory.SEXUAL,
+    "Violence": ImageCategory.VIOLENCE,
+    "Hate": ImageCategory.HATE,
+    "SelfHarm": ImageCategory.SELF_HARM,
+}
+_TEXT_CATEGORY_ENUMS = {
+    "Sexual": TextCategory.SEXUAL,
+    "Violence": TextCategory.VIOLENCE,
+    "Hate": TextCategory.HATE,
+    "SelfHarm": TextCategory.SELF_HARM,
+}
+
+# Lookup nama kategori yang sudah dinormalisasi ("self_harm", "Self-Harm", "SELFHARM" -> "SelfHarm")
+_NORMALIZED_CATEGORY_NAMES = {name.lower(): name for name in CATEGORIES}
+
+# Batas kalimat: setelah tanda baca akhir kalimat atau baris baru
+_SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+_CHUNK_SEPARATOR = "\n"
+
+
+class SafetyVerdict:
+    """
+    Severities reported by Content Safety for one input, judged against CATEGORY_THRESHOLDS.
+    """
+
+    __slots__ = ("severities", "blocked_categories", "cached")
+
+    def __init__(self, severities, cached=False):
+        self.severities = severities
+        self.blocked_categories = [
+            f"{CATEGORY_DISPLAY_NAMES[name]} (Score: {severity})"
+            for name, severity in severities.items()
+            if severity >= CATEGORY_THRESHOLDS.get(name, 1)
+        ]
+        self.cached = cached
+
+    @property
+    def blocked(self):
+        return bool(self.blocked_categories)
+
+    @property
+    def details(self):
+        return f"Blocked categories: {', '.join(self.blocked_categories)}"
+
+    def summary(self):
+        return ", ".join(f"{name}={self.severities.get(name, 0)}" for name in CATEGORIES) + (" (cached)" if self.cached else "")
+
+
+_client = None
+_client_lock = threading.Lock()
+_client_init_failed = False
+
+_verdict_cache = build_tiered_cache("safety_verdicts", CONTENT_SAFETY_CACHE_MAX_ENTRIES, CONTENT_SAFETY_CACHE_TTL_SECONDS, CONTENT_SAFETY_CACHE_SQLITE_PATH)
+_text_executor = ThreadPoolExecutor(max_workers=max(1, CONTENT_SAFETY_TEXT_MAX_WORKERS), thread_name_prefix="content-safety-text")
+
+
+def get_client():
+    """
+    Returns the process-wide ContentSafetyClient from the client registry (None if not configured).
+    """
+    global _client, _client_init_failed
+    if _client is not None or _client_init_failed:
+        return _client
+    with _client_lock:
+        if _client is None and not _client_init_failed:
+            if not (CONTENT_SAFETY_ENDPOINT and CONTENT_SAFETY_KEY):
+                logging.warning("Content Safety endpoint or key is not configured. Safety analysis will be skipped.")
+                _client_init_failed = True
+                return None
+            try:
+                _client = clients.get_content_safety_client(CONTENT_SAFETY_ENDPOINT, CONTENT_SAFETY_KEY)
+                logging.info("Shared ContentSafetyClient initialized successfully.")
+            except Exception as cs_init_err:
+                logging.error(f"Failed to initialize shared ContentSafetyClient: {cs_init_err}", exc_info=True)
+                _client_init_failed = True
+    return _client
+
+def is_configured():
+    return get_client() is not None
+
+def normalize_category(category):
+    """
+    Maps an SDK category (enum or string in any casing/separator style) to its canonical name, or None.
+    """
+    value = getattr(category, "value", category)
+    if not isinstance(value, str):
+        return None
+    return _NORMALIZED_CATEGORY_NAMES.get(value.replace("-", "").replace("_", "").replace(" ", "").lower())
+
+def parse_severities(response):
+    """
+    Extracts {category: severity} from an analyze_image/analyze_text response.
+
+    Prefers the public `categories_analysis` attribute and falls back to the raw
+    `_data['categoriesAnalysis']` structure some SDK versions populate instead.
+    Categories that are missing from the response have severity 0.
+    """
+    severities = dict.fromkeys(CATEGORIES, 0)
+
+    items = getattr(response, "categories_analysis", None)
+    if items is not None:
+        for item in items:
+            name = normalize_category(getattr(item, "category", None))
+            if name is not None:
+                severities[name] = int(item.severity or 0)
+        return severities
+
+    data = getattr(response, "_data", None)
+    if isinstance(data, dict) and isinstance(data.get("categoriesAnalysis"), list):
+        for item in data["categoriesAnalysis"]:
+            if isinstance(item, dict):
+                name = normalize_category(item.get("category"))
+                if name is not None and item.get("severity") is not None:
+                    severities[name] = int(item["severity"])
+        return severities
+
+    logging.warning("Content Safety response structure not as expected (neither 'categories_analysis' nor '_data' suitable).")
+    return severities
+
+def content_digest(content):
+    """
+    Returns the SHA-256 hex digest of image bytes or UTF-8 text.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+def _cache_key(kind, digest, categories):
+    return f"{kind}:{','.join(sorted(categories))}:{digest}"
+
+def get_cached_verdict(kind, digest, categories=CATEGORIES):
+    """
+    Returns the cached SafetyVerdict for content of `kind` ("image" or "text") with `digest`, or None.
+    """
+    severities = _verdict_cache.get(_cache_key(kind, digest, categories))
+    return SafetyVerdict(severities, cached=True) if severities is not None else None
+
+def _analyze(kind, content, digest, categories):
+    digest = digest or content_digest(content)
+    key = _cache_key(kind, digest, categories)
+
+    severities = _verdict_cache.get(key)
+    if severities is not None:
+        metrics.increment("content_safety.verdict_cache.hit")
+        return SafetyVerdict(severities, cached=True)
+    metrics.increment("content_safety.verdict_cache.miss")
+
+    client = get_client()
+    if client is None:
+        raise RuntimeError("Content Safety client is not configured.")
+
+    if kind == "image":
+        request = AnalyzeImageOptions(image=ImageData(content=content), categories=[_IMAGE_CATEGORY_ENUMS[name] for name in categories])
+        response = client.analyze_image(request)
+    else:
+        request = AnalyzeTextOptions(text=content, categories=[_TEXT_CATEGORY_ENUMS[name] for name in categories])
+        response = client.analyze_text(request)
+    metrics.increment(f"content_safety.{kind}_calls")
+
+    severities = parse_severities(response)
+    _verdict_cache.set(key, severities)
+    return SafetyVerdict(severities)
+
+def analyze_image(image, digest=None, categories=CATEGORIES):
+    """
+    Analyzes an image (bytes or bytearray) with the shared client, using the verdict cache.
+
+    Args:
+        image: The image payload.
+        digest (str): Optional precomputed SHA-256 hex digest of the image, to avoid hashing twice.
+        categories (tuple): Canonical category names to analyze.
+
+    Returns:
+        SafetyVerdict: The (possibly cached) verdict.
+
+    Raises:
+        RuntimeError: If the client is not configured.
+        azure.core.exceptions.HttpResponseError: On service errors. Callers decide whether to fail open or closed.
+    """
+    return _analyze("image", image, digest, categories)
+
+def analyze_text(text, categories=CATEGORIES):
+    """
+    Analyzes text with the shared client, using the verdict cache. See analyze_image.
+    """
+    return _analyze("text", text, None, categories)
+
+def _split_long_text(text, max_chars):
+    """
+    Splits a string longer than max_chars into pieces on sentence boundaries,
+    falling back to whitespace and finally to a hard cut for very long sentences.
+    """
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_BOUNDARY_PATTERN.split(text):
+        if not sentence:
+            continue
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+def build_text_chunks(texts, max_chars=CONTENT_SAFETY_TEXT_CHUNK_CHARS):
+    """
+    Packs texts into chunks of at most max_chars characters.
+
+    Short texts are kept whole and packed together; texts longer than max_chars are
+    split on sentence boundaries first.
+
+    Returns:
+        list: (chunk_text, source_indices) tuples, where source_indices are the
+              indices in texts that contributed to the chunk.
+    """
+    chunks = []
+    parts = []
+    sources = set()
+    length = 0
+
+    def flush():
+        nonlocal parts, sources, length
+        if parts:
+            chunks.append((_CHUNK_SEPARATOR.join(parts), sorted(sources)))
+        parts, sources, length = [], set(), 0
+
+    for index, text in enumerate(texts):
+        pieces = [text] if len(text) <= max_chars else _split_long_text(text, max_chars)
+        for piece in pieces:
+            added = len(piece) + (len(_CHUNK_SEPARATOR) if parts else 0)
+            if parts and length + added > max_chars:
+                flush()
+                added = len(piece)
+            parts.append(piece)
+            sources.add(index)
+            length += added
+    flush()
+    return chunks
+
+def _merge_severities(target, severities):
+    for name, severity in severities.items():
+        if severity > target.get(name, 0):
+            target[name] = severity
+
+def analyze_texts(texts, categories=CATEGORIES, max_chars=CONTENT_SAFETY_TEXT_CHUNK_CHARS):
+    """
+    Analyzes a collection of generated strings as one verdict.
+
+    Strings already verified (per-string verdict cache) are skipped. The rest are packed
+    into service-sized chunks on sentence boundaries and analyzed concurrently. Severities
+    are merged by taking the maximum per category, and analysis stops as soon as any
+    chunk (or cached string) blocks. When every chunk passes, each string is cached as
+    verified with the merged severities of the chunks it was part of.
+
+    Args:
+        texts (iterable): Strings to analyze. Empty values and duplicates are ignored.
+        categories (tuple): Canonical category names to analyze.
+        max_chars (int): Maximum characters per analyze_text request.
+
+    Returns:
+        SafetyVerdict: The merged verdict (cached=True if no remote call was needed).
+
+    Raises:
+        RuntimeError, azure.core.exceptions.HttpResponseError: As analyze_text. Pending
+        chunks are cancelled when one fails.
+    """
+    unique_texts = list(dict.fromkeys(text.strip() for text in texts if text and text.strip()))
+    merged = dict.fromkeys(CATEGORIES, 0)
+
+    pending_texts = []
+    pending_keys = []
+    for text in unique_texts:
+        key = _cache_key("text", content_digest(text), categories)
+        severities = _verdict_cache.get(key)
+        if severities is None:
+            pending_texts.append(text)
+            pending_keys.append(key)
+            continue
+        metrics.increment("content_safety.text_strings_cached")
+        _merge_severities(merged, severities)
+        verdict = SafetyVerdict(merged, cached=True)
+        if verdict.blocked:
+            return verdict
+
+    if not pending_texts:
+        return SafetyVerdict(merged, cached=True)
+
+    chunks = build_text_chunks(pending_texts, max_chars)
+    metrics.increment("content_safety.text_chunks", len(chunks))
+    per_text_severities = [dict.fromkeys(CATEGORIES, 0) for _ in pending_texts]
+
+    def record(chunk_index, verdict):
+        _merge_severities(merged, verdict.severities)
+        for text_index in chunks[chunk_index][1]:
+            _merge_severities(per_text_severities[text_index], verdict.severities)
+
+    if len(chunks) == 1:
+        verdict = _analyze("text", chunks[0][0], None, categories)
+        record(0, verdict)
+    else:
+        futures = {_text_executor.submit(_analyze, "text", chunk_text, None, categories): index for index, (chunk_text, _) in enumerate(chunks)}
+        not_done = set(futures)
+        try:
+            while not_done:
+                done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+                for future in done:
+                    verdict = future.result()
+                    record(futures[future], verdict)
+                    if verdict.blocked:
+                        logging.info(f"Text chunk {futures[future] + 1}/{len(chunks)} blocked by Content Safety; skipping remaining chunks.")
+                        return SafetyVerdict(merged)
+        finally:
+            for future in not_done:
+                future.cancel()
+
+    final_verdict = SafetyVerdict(merged)
+    if not final_verdict.blocked:
+        for key, severities in zip(pending_keys, per_text_severities):
+            _verdict_cache.set(key, severities)
+    return final_verdict
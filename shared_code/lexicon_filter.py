@@ -0,0 +1,243 @@
+import logging
+import os
+import threading
+import unicodedata
+from collections import deque
+from dataclasses import dataclass
+
+from . import metrics
+
+# --- KONFIGURASI ---
+LEXICON_FILTER_ENABLED = os.environ.get("LEXICON_FILTER_ENABLED", "true").lower() == "true"
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(__file__), "data", "safety_lexicon.tsv")
+LEXICON_FILTER_PATH = os.environ.get("LEXICON_FILTER_PATH", DEFAULT_LEXICON_PATH)
+
+ACTION_BLOCK = "block" # Pelanggaran jelas: ditolak tanpa memanggil Content Safety
+ACTION_REVIEW = "review" # Ambigu: hanya dicatat, keputusan tetap di Content Safety
+ACTIONS = (ACTION_BLOCK, ACTION_REVIEW)
+
+# Leetspeak umum -> huruf. Dipetakan satu karakter ke satu karakter agar posisi match tetap sejajar dengan input.
+# Tanda baca yang biasa muncul di akhir kata ("!", "+") sengaja tidak dipetakan agar batas kata tidak hilang.
+LEET_MAP = {
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "9": "g",
+    "@": "a", "$": "s", "€": "e",
+}
+
+_CATEGORY_DISPLAY_NAMES = {"SelfHarm": "Self-Harm"}
+
+
+@dataclass(frozen=True)
+class LexiconEntry:
+    term: str
+    language: str
+    category: str
+    action: str
+
+
+@dataclass(frozen=True)
+class LexiconMatch:
+    """
+    One lexicon hit. start/end are offsets into the original (un-normalized) text.
+    """
+    entry: LexiconEntry
+    start: int
+    end: int
+
+
+@dataclass
+class LexiconResult:
+    matches: list
+
+    @property
+    def blocked(self):
+        return any(match.entry.action == ACTION_BLOCK for match in self.matches)
+
+    @property
+    def blocked_categories(self):
+        categories = {match.entry.category for match in self.matches if match.entry.action == ACTION_BLOCK}
+        return [f"{_CATEGORY_DISPLAY_NAMES.get(category, category)} (lexicon)" for category in sorted(categories)]
+
+    @property
+    def details(self):
+        return f"Blocked categories: {', '.join(self.blocked_categories)}"
+
+
+_char_cache = {}
+
+def _normalize_char(char):
+    """
+    Maps one character to its normalized form: lowercase, no diacritics, leetspeak decoded,
+    and every non-alphanumeric character (punctuation, whitespace) folded to a single space.
+    """
+    normalized = _char_cache.get(char)
+    if normalized is None:
+        lowered = char.lower()
+        if lowered in LEET_MAP:
+            normalized = LEET_MAP[lowered]
+        else:
+            base = "".join(c for c in unicodedata.normalize("NFKD", lowered) if not unicodedata.combining(c))
+            normalized = base[:1] if len(base) >= 1 and base[:1].isalnum() else " "
+        _char_cache[char] = normalized
+    return normalized
+
+def normalize(text):
+    """
+    Normalizes text for matching and returns (normalized, offsets).
+
+    Runs of separators (whitespace, punctuation) become a single space and leading
+    separators are dropped; offsets[i] is the index in text that normalized[i] came from.
+    Lexicon terms go through the same function, so both sides are normalized alike.
+    """
+    chars = []
+    offsets = []
+    previous = " "
+    for index, char in enumerate(text):
+        normalized = _normalize_char(char)
+        if normalized == " " and previous == " ":
+            continue
+        chars.append(normalized)
+        offsets.append(index)
+        previous = normalized
+    return "".join(chars), offsets
+
+
+class LexiconFilter:
+    """
+    Multi-pattern matcher (Aho-Corasick automaton) over normalized text.
+
+    Building is O(total pattern length); matching is a single pass over the normalized
+    input, O(len(text) + number of matches), regardless of the number of terms.
+    Matches only count on word boundaries, so "skill" does not match "kill".
+    """
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()] # Per state: tuple of (pattern_length, entry)
+        self._build()
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Loads a lexicon from a TSV file with columns: term, language, category, action.
+        Blank lines and lines starting with '#' are ignored.
+        """
+        entries = []
+        with open(path, encoding="utf-8") as lexicon_file:
+            for line_number, line in enumerate(lexicon_file, start=1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                columns = [column.strip() for column in line.split("\t")]
+                if len(columns) != 4 or columns[3] not in ACTIONS:
+                    logging.warning(f"Skipping malformed lexicon line {line_number} in {path}: {line!r}")
+                    continue
+                entries.append(LexiconEntry(*columns))
+        return cls(entries)
+
+    def _build(self):
+        outputs = [[]]
+        for entry in self.entries:
+            pattern = normalize(entry.term)[0].strip()
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    outputs.append([])
+                state = next_state
+            outputs[state].append((len(pattern), entry))
+
+        # BFS: fail link tiap state adalah suffix terpanjang yang juga prefix pattern lain
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                outputs[next_state].extend(outputs[self._fail[next_state]])
+
+        self._output = [tuple(output) for output in outputs]
+
+    def find_all(self, text):
+        """
+        Returns every LexiconMatch in text that falls on word boundaries.
+        """
+        normalized, offsets = normalize(text)
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        length = len(normalized)
+        matches = []
+        state = 0
+        for index, char in enumerate(normalized):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+            at_end_boundary = index + 1 == length or normalized[index + 1] == " "
+            if not at_end_boundary:
+                continue
+            for pattern_length, entry in output[state]:
+                start = index - pattern_length + 1
+                if start == 0 or normalized[start - 1] == " ":
+                    matches.append(LexiconMatch(entry, offsets[start], offsets[index] + 1))
+        return matches
+
+    def scan(self, text):
+        return LexiconResult(self.find_all(text))
+
+
+_default_filter = None
+_default_filter_lock = threading.Lock()
+_default_filter_failed = False
+
+def get_default_filter():
+    """
+    Returns the process-wide LexiconFilter loaded from LEXICON_FILTER_PATH, or None if it is
+    disabled or cannot be loaded (the remote Content Safety check still runs in that case).
+    """
+    global _default_filter, _default_filter_failed
+    if not LEXICON_FILTER_ENABLED or _default_filter_failed:
+        return None
+    if _default_filter is None:
+        with _default_filter_lock:
+            if _default_filter is None and not _default_filter_failed:
+                try:
+                    _default_filter = LexiconFilter.from_file(LEXICON_FILTER_PATH)
+                    logging.info(f"Lexicon pre-filter loaded {len(_default_filter.entries)} terms from {LEXICON_FILTER_PATH}.")
+                except OSError as lexicon_err:
+                    logging.error(f"Failed to load lexicon pre-filter from {LEXICON_FILTER_PATH}: {lexicon_err}")
+                    _default_filter_failed = True
+    return _default_filter
+
+def prefilter_text(text):
+    """
+    Scans text with the default lexicon before any remote safety call.
+
+    Returns:
+        LexiconResult or None: The result, or None if the pre-filter is unavailable.
+        result.blocked means the text contains a clear violation and can be rejected
+        immediately; otherwise the text still goes to Content Safety.
+    """
+    lexicon = get_default_filter()
+    if lexicon is None:
+        return None
+    result = lexicon.scan(text)
+    if result.blocked:
+        metrics.increment("lexicon_filter.blocked")
+    elif result.matches:
+        metrics.increment("lexicon_filter.review")
+    else:
+        metrics.increment("lexicon_filter.clean")
+    return result
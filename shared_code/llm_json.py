@@ -0,0 +1,193 @@
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+
+from . import metrics
+
+# orjson (opsional) jauh lebih cepat untuk parse; fallback ke json standar
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    orjson = None
+    _loads = json.loads
+
+_FENCE_PATTERN = re.compile(r"```[A-Za-z0-9_-]*[ \t]*\r?\n?(.*?)(?:```|\Z)", re.DOTALL)
+_NUMBER_OR_LITERAL_CHARS = frozenset("0123456789+-.eEtruefalsn")
+
+
+class LLMJSONError(ValueError):
+    """
+    Raised when model output contains no JSON value that can be parsed or salvaged.
+    """
+
+
+@dataclass
+class LLMJSONResult:
+    """
+    Parsed model output.
+
+    Attributes:
+        value: The parsed JSON value.
+        repaired: True if the output was truncated and incomplete trailing elements were dropped.
+        schema_errors: Paths that do not match the expected schema (empty if valid or no schema given).
+    """
+    value: object
+    repaired: bool = False
+    schema_errors: list = field(default_factory=list)
+
+
+def validate(value, schema, path="$"):
+    """
+    Checks value against a minimal schema and returns a list of error paths.
+
+    Schema forms: a type (str, int, dict, ...) checked with isinstance; a dict whose keys are
+    all required and checked recursively (extra keys are allowed); a one-element list whose
+    element is the schema of every item.
+    """
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            return [f"{path}: expected object"]
+        errors = []
+        for key, key_schema in schema.items():
+            if key not in value:
+                errors.append(f"{path}.{key}: missing")
+            else:
+                errors.extend(validate(value[key], key_schema, f"{path}.{key}"))
+        return errors
+    if isinstance(schema, list):
+        if not isinstance(value, list):
+            return [f"{path}: expected array"]
+        errors = []
+        for index, item in enumerate(value):
+            errors.extend(validate(item, schema[0], f"{path}[{index}]"))
+        return errors
+    if not isinstance(value, schema):
+        return [f"{path}: expected {schema.__name__}"]
+    return []
+
+def _json_region(text):
+    """
+    Returns the part of text that should hold the JSON value: the body of the first ``` fence
+    if there is one (closed or not), otherwise the whole text.
+    """
+    fence = _FENCE_PATTERN.search(text)
+    region = fence.group(1) if fence else text
+    if not re.search(r"[{\[]", region) and fence: # Fence kosong / berisi prosa saja
+        region = text
+    return region
+
+def _scan(text):
+    """
+    Scans the JSON value at the start of text ("{" or "[").
+
+    Returns (end, frames): end is the index just past the value if it is complete (frames is
+    then empty), otherwise None and frames is the stack of open containers as
+    [opening_char, end_of_last_complete_element, expecting_object_value].
+    """
+    frames = []
+    in_string = False
+    escape = False
+    token_start = None # Awal angka / literal (true, false, null)
+    i = 0
+    length = len(text)
+
+    def complete(end):
+        frame = frames[-1]
+        if frame[0] == "[":
+            frame[1] = end
+        elif frame[2]: # Value (bukan key) dari member objek
+            frame[1] = end
+            frame[2] = False
+
+    while i < length:
+        char = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                complete(i + 1)
+            i += 1
+            continue
+        if token_start is not None:
+            if char in _NUMBER_OR_LITERAL_CHARS:
+                i += 1
+                continue
+            complete(i)
+            token_start = None
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            frames.append([char, i + 1, False])
+        elif char in "}]":
+            frames.pop()
+            if not frames:
+                return i + 1, []
+            complete(i + 1)
+        elif char == ":":
+            frames[-1][2] = True
+        elif char in _NUMBER_OR_LITERAL_CHARS:
+            token_start = i
+        i += 1
+    return None, frames
+
+def _close_truncated(text, frames):
+    """
+    Cuts a truncated value back to the last complete element and closes every open container.
+
+    The cut is made in the innermost open array (the incomplete trailing item is dropped and
+    the complete items are kept); if no array is open, the incomplete trailing member of the
+    outermost object is dropped.
+    """
+    cut_level = 0
+    for level, frame in enumerate(frames):
+        if frame[0] == "[":
+            cut_level = level
+    closers = "".join("}" if frame[0] == "{" else "]" for frame in reversed(frames[:cut_level + 1]))
+    return text[:frames[cut_level][1]] + closers
+
+def parse(text, schema=None, name="llm_json"):
+    """
+    Parses the JSON object/array in LLM output, ignoring ``` fences and surrounding prose.
+
+    If the output was truncated (e.g. by max_tokens), incomplete trailing elements are dropped
+    and open containers are closed. A repaired value must match schema, otherwise LLMJSONError
+    is raised; for complete output, schema mismatches are only reported in schema_errors (and
+    a complete empty object/array is not checked).
+
+    Counters `<name>.parsed`, `<name>.repaired`, `<name>.schema_invalid` and `<name>.failed`
+    are kept in shared_code.metrics.
+    """
+    region = _json_region(text or "")
+    match = re.search(r"[{\[]", region)
+    if match is None:
+        metrics.increment(f"{name}.failed")
+        raise LLMJSONError("No JSON object or array found in model output.")
+
+    body = region[match.start():]
+    end, frames = _scan(body)
+    repaired = end is None
+    json_text = _close_truncated(body, frames) if repaired else body[:end]
+    try:
+        value = _loads(json_text)
+    except ValueError as decode_err: # orjson.JSONDecodeError dan json.JSONDecodeError adalah turunan ValueError
+        metrics.increment(f"{name}.failed")
+        raise LLMJSONError(f"Model output is not valid JSON{' after truncation repair' if repaired else ''}: {decode_err}") from decode_err
+
+    # Objek/array kosong yang lengkap adalah jawaban "tidak ada hasil" yang sah, bukan pelanggaran skema
+    schema_errors = validate(value, schema) if schema is not None and (value or repaired) else []
+    if schema_errors:
+        metrics.increment(f"{name}.schema_invalid")
+        if repaired:
+            metrics.increment(f"{name}.failed")
+            raise LLMJSONError(f"Truncated model output could not be salvaged: {'; '.join(schema_errors[:5])}")
+        logging.warning(f"Model output does not match the expected schema: {'; '.join(schema_errors[:5])}")
+    if repaired:
+        metrics.increment(f"{name}.repaired")
+        logging.warning(f"Model output was truncated after {len(body)} chars; incomplete trailing elements were dropped.")
+    metrics.increment(f"{name}.parsed")
+    return LLMJSONResult(value, repaired, schema_errors)
@@ -0,0 +1,38 @@
+import threading
+from collections import defaultdict
+
+# Counter proses-lokal (per worker). Dibaca lewat ApiHealthCheck?metrics=true.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+
+
+def increment(name, value=1):
+    """
+    Increments the counter `name` by `value`.
+    """
+    with _lock:
+        _counters[name] += value
+
+def get(name):
+    """
+    Returns the current value of the counter `name` (0 if it was never incremented).
+    """
+    with _lock:
+        return _counters.get(name, 0)
+
+def hit_ratio(prefix):
+    """
+    Returns `<prefix>.hit / (<prefix>.hit + <prefix>.miss)`, or None if there were no lookups.
+    """
+    with _lock:
+        hits = _counters.get(f"{prefix}.hit", 0)
+        misses = _counters.get(f"{prefix}.miss", 0)
+    total = hits + misses
+    return hits / total if total else None
+
+def snapshot(prefix=None):
+    """
+    Returns a copy of all counters, optionally only those whose name starts with `prefix`.
+    """
+    with _lock:
+        return {name: value for name, value in sorted(_counters.items()) if prefix is None or name.startswith(prefix)}
@@ -0,0 +1,103 @@
+import logging
+import threading
+
+from . import metrics
+
+
+class SingleFlightTimeout(TimeoutError):
+    """
+    Raised to a waiter whose wait for the in-flight call exceeded wait_timeout.
+    """
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "cancelled", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one execution.
+
+    The first caller for a key (the leader) runs fn; callers that arrive while it is in flight
+    wait and receive the same result, or the same exception if fn raised. Nothing is kept once
+    the call finishes, so later callers start a new call (caching is the caller's job).
+
+    If the leader is cancelled (a BaseException that is not an Exception, e.g. SystemExit or
+    asyncio.CancelledError), waiters are not failed with it: one of them runs fn as the new
+    leader. A waiter that gives up after wait_timeout seconds gets SingleFlightTimeout; the
+    in-flight call keeps running for the others.
+
+    Counters `<name>.leader`, `<name>.coalesced`, `<name>.leader_cancelled` and
+    `<name>.wait_timeout` are kept in shared_code.metrics.
+    """
+
+    def __init__(self, name, wait_timeout=None):
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Runs fn() once for all concurrent callers with key.
+
+        Returns:
+            tuple: (result, shared). shared is True if the result came from another caller's call.
+
+        Raises:
+            SingleFlightTimeout: If this caller waited longer than wait_timeout.
+            Exception: Whatever fn raised (for the leader and every waiter).
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    leader = True
+                else:
+                    call.waiters += 1
+                    leader = False
+
+            if leader:
+                return self._run(key, call, fn), False
+
+            metrics.increment(f"{self.name}.coalesced")
+            if not call.done.wait(self.wait_timeout):
+                metrics.increment(f"{self.name}.wait_timeout")
+                raise SingleFlightTimeout(f"Timed out after {self.wait_timeout}s waiting for the in-flight call '{self.name}'.")
+            if call.cancelled:
+                continue # Leader dibatalkan: coba lagi, salah satu waiter menjadi leader baru
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+    def _run(self, key, call, fn):
+        metrics.increment(f"{self.name}.leader")
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as call_err:
+            call.error = call_err
+            raise
+        except BaseException:
+            call.cancelled = True
+            metrics.increment(f"{self.name}.leader_cancelled")
+            logging.warning(f"Singleflight {self.name}: leader was cancelled, {call.waiters} waiter(s) will retry.")
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logging.info(f"Singleflight {self.name}: result shared with {call.waiters} coalesced caller(s).")
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe, bounded in-memory LRU cache whose entries expire after a TTL.
+
+    If `name` is given, lookups are counted in shared_code.metrics as `<name>.hit` / `<name>.miss`.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, name=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] <= now:
+                del self._entries[key]
+                entry = _MISSING
+            if entry is not _MISSING:
+                self._entries.move_to_end(key)
+        self._count("hit" if entry is not _MISSING else "miss")
+        return entry[1] if entry is not _MISSING else default
+
+    def set(self, key, value, ttl_seconds=None):
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _count(self, outcome):
+        if self.name:
+            metrics.increment(f"{self.name}.{outcome}")
+
+
+class SQLiteCache:
+    """
+    Persistent key/value cache in a SQLite table. Values are stored as JSON and expire after a TTL.
+
+    One connection is shared between threads and serialized with a lock; WAL mode lets
+    several worker processes on the same instance read and write the file concurrently.
+
+    Expired rows are purged when the cache is opened and every purge_interval writes; the
+    purge also deletes the rows closest to expiry beyond max_rows, so the file stays bounded
+    on long-lived instances.
+    """
+
+    def __init__(self, path, table="cache", ttl_seconds=86400, name=None, max_rows=50000, purge_interval=256):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid SQLite table name: {table}")
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self.max_rows = max_rows
+        self.purge_interval = purge_interval
+        self._writes_since_purge = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)")
+        self._conn.commit()
+        self.purge_expired() # Sisa dari proses sebelumnya
+
+    def get_entry(self, key):
+        """
+        Returns (value, expires_at) with expires_at as a time.time() timestamp, or None if missing or expired.
+        """
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            self._count("miss")
+            return None
+        self._count("hit")
+        return json.loads(row[0]), row[1]
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl_seconds=None):
+        expires_at = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        payload = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, payload, expires_at)
+            )
+            self._conn.commit()
+            self._writes_since_purge += 1
+            purge_due = self._writes_since_purge >= self.purge_interval
+        if purge_due:
+            self.purge_expired()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def purge_expired(self):
+        """
+        Deletes expired rows, then the rows closest to expiry beyond max_rows, and returns how many were removed.
+        """
+        with self._lock:
+            self._writes_since_purge = 0
+            removed = self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),)).rowcount
+            if self.max_rows is not None:
+                (row_count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+                if row_count > self.max_rows:
+                    removed += self._conn.execute(
+                        f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY expires_at LIMIT ?)",
+                        (row_count - self.max_rows,)
+                    ).rowcount
+            self._conn.commit()
+        if removed:
+            self._count("purged", removed)
+            logging.info(f"SQLiteCache '{self.table}': purged {removed} row(s).")
+        return removed
+
+    def _count(self, outcome, amount=1):
+        if self.name:
+            metrics.increment(f"{self.name}.{outcome}", amount)
+
+
+class TieredCache:
+    """
+    In-memory TTLCache in front of an optional SQLiteCache. Persistent hits are promoted to memory
+    for the time they have left, so promotion never extends an entry's lifetime.
+
+    Values must be JSON-serializable when a persistent tier is configured.
+    """
+
+    def __init__(self, memory, persistent=None):
+        self.memory = memory
+        self.persistent = persistent
+
+    def get(self, key, default=None):
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.persistent is not None:
+            try:
+                entry = self.persistent.get_entry(key)
+            except sqlite3.Error as db_err:
+                logging.warning(f"TieredCache: persistent tier lookup failed: {db_err}")
+                entry = None
+            if entry is not None:
+                value, expires_at = entry
+                self.memory.set(key, value, ttl_seconds=expires_at - time.time())
+                return value
+        return default
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, value)
+            except sqlite3.Error as db_err:
+                logging.warning(f"TieredCache: persistent tier write failed: {db_err}")
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.persistent is not None:
+            self.persistent.delete(key)
+
+
+def build_tiered_cache(name, max_entries, ttl_seconds, sqlite_path=None, sqlite_max_rows=50000):
+    """
+    Builds a TieredCache with an optional SQLite tier stored in table `name` (at most sqlite_max_rows rows).
+
+    If the SQLite file cannot be opened the cache falls back to memory only.
+    """
+    persistent = None
+    if sqlite_path:
+        try:
+            persistent = SQLiteCache(sqlite_path, table=name, ttl_seconds=ttl_seconds, max_rows=sqlite_max_rows)
+        except Exception as db_err:
+            logging.error(f"Failed to open SQLite cache '{sqlite_path}' for {name}: {db_err}", exc_info=True)
+    return TieredCache(TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds), persistent)
@@ -0,0 +1,148 @@
+import json
+import logging
+
+import azure.functions as func
+
+# Ruang untuk boundary, header part dan field teks kecil di samping file pada multipart/form-data
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# (offset, signature, mimetype). Dicek pada beberapa byte pertama sebelum PIL/SDK menyentuh payload.
+IMAGE_SIGNATURES = (
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"BM", "image/bmp"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (8, b"WEBP", "image/webp"), # RIFF....WEBP
+)
+# Audio tidak dicek: PushAudioInputStream default menerima PCM 16 kHz mentah tanpa header apa pun
+
+
+class UploadTooLargeError(ValueError):
+    """
+    Raised when an upload exceeds its size limit. Stops reading as soon as the limit is crossed.
+    """
+
+    def __init__(self, limit_bytes, size_bytes=None):
+        self.limit_bytes = limit_bytes
+        self.size_bytes = size_bytes
+        super().__init__(f"Upload exceeds the limit of {limit_bytes} bytes" + (f" ({size_bytes} bytes)" if size_bytes is not None else ""))
+
+
+def _format_limit(limit_bytes):
+    if limit_bytes >= 1024 * 1024:
+        return f"{limit_bytes // (1024*1024)}MB"
+    return f"{max(1, limit_bytes // 1024)}KB"
+
+def too_large_response(label, limit_bytes):
+    """
+    Returns the 413 response shared by all upload endpoints.
+    """
+    return func.HttpResponse(
+        json.dumps({"error": f"{label} size exceeds the limit of {_format_limit(limit_bytes)}."}),
+        mimetype="application/json",
+        status_code=413
+    )
+
+def unsupported_media_response(label):
+    """
+    Returns the 415 response for uploads whose content does not match an accepted format.
+    """
+    return func.HttpResponse(
+        json.dumps({"error": f"{label} file format is not supported or the file is corrupted."}),
+        mimetype="application/json",
+        status_code=415
+    )
+
+def check_request_size(req, max_request_bytes, label):
+    """
+    Rejects a request whose body is larger than max_request_bytes before the multipart body is parsed.
+
+    Uses the Content-Length header when present and the received body length otherwise.
+    Accessing req.files parses the whole multipart body (and spools file parts), so this
+    check must run before it.
+
+    Returns:
+        func.HttpResponse or None: A 413 response if the request is too large, otherwise None.
+    """
+    content_length = req.headers.get("Content-Length")
+    try:
+        declared_size = int(content_length) if content_length is not None else None
+    except ValueError:
+        declared_size = None
+
+    size = declared_size if declared_size is not None else len(req.get_body() or b"")
+    if size > max_request_bytes:
+        logging.warning(f"Request body of {size} bytes exceeds limit of {max_request_bytes} bytes. Rejecting before multipart parsing.")
+        return too_large_response(label, max_request_bytes - MULTIPART_OVERHEAD_BYTES)
+    return None
+
+def _remaining_size(stream):
+    try:
+        position = stream.tell()
+        end = stream.seek(0, 2)
+        stream.seek(position)
+        return end - position
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def read_upload(file_storage, max_bytes, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Reads an uploaded multipart file part with a hard size cap.
+
+    The part size is checked from its (spooled) stream before reading. The payload is
+    read in chunks into a single preallocated bytearray and exposed as a memoryview, so
+    no intermediate bytes objects are joined or sliced.
+
+    Args:
+        file_storage: The werkzeug FileStorage from req.files.
+        max_bytes (int): Maximum accepted size of the part.
+
+    Returns:
+        memoryview: The uploaded payload (empty if the part is empty).
+
+    Raises:
+        UploadTooLargeError: If the part is larger than max_bytes.
+    """
+    stream = file_storage.stream
+    size = _remaining_size(stream)
+    if size is not None and size > max_bytes:
+        raise UploadTooLargeError(max_bytes, size)
+
+    buffer = bytearray(size or 0)
+    length = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        end = length + len(chunk)
+        if end > max_bytes:
+            raise UploadTooLargeError(max_bytes)
+        buffer[length:end] = chunk # Mengisi buffer yang sudah dialokasikan (atau memperpanjangnya jika ukuran tidak diketahui)
+        length = end
+
+    if length != len(buffer):
+        del buffer[length:] # Stream lebih pendek dari ukuran yang dilaporkan
+    return memoryview(buffer)
+
+def as_sdk_buffer(payload):
+    """
+    Returns the bytearray behind a read_upload() memoryview without copying, for SDK
+    request models that accept bytes/bytearray but not memoryview (e.g. Content Safety ImageData).
+    Falls back to a bytes copy for other buffers.
+    """
+    if isinstance(payload, memoryview) and isinstance(payload.obj, bytearray) and payload.nbytes == len(payload.obj):
+        return payload.obj
+    return bytes(payload)
+
+def sniff_mimetype(payload, signatures):
+    """
+    Returns the mimetype whose magic bytes match the start of payload, or None.
+    """
+    for offset, signature, mimetype in signatures:
+        if payload[offset:offset + len(signature)] == signature:
+            return mimetype
+    return None
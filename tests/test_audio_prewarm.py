@@ -0,0 +1,98 @@
+import types
+
+import azure.cognitiveservices.speech as speechsdk
+import pytest
+
+import GenerateLesson
+import GetTTSAudio
+from GetTTSAudio import audio_store, bulk, prewarm, synthesizer_pool
+from shared_code import audio_prewarm
+
+MP3_FRAME = bytes([0xFF, 0xF3, 0x48, 0xC4]) + bytes(140) # MPEG-2 Layer III, 16 kHz, 32 kbps: 144 byte = 36 ms
+
+LESSON = {
+    "scenarioTitle": {"en": "At the train station", "id": "Di stasiun kereta"},
+    "vocabulary": [
+        {"term": {"en": "ticket", "id": "tiket"}},
+        {"term": {"en": "platform", "id": "peron"}},
+        {"term": {"en": "departure", "id": "keberangkatan"}}
+    ],
+    "keyPhrases": [
+        {"phrase": {"en": "Where is the train station?", "id": "Di mana stasiun kereta?"}},
+        {"phrase": {"en": "One ticket to Bandung, please.", "id": "Satu tiket ke Bandung."}}
+    ],
+    "grammarTips": []
+}
+LESSON_TEXTS = ("ticket", "platform", "departure", "Where is the train station?", "One ticket to Bandung, please.")
+
+
+class _FakeSynthesizer:
+    """
+    Returns one MP3 frame per character of the text, like a standalone GetTTSAudio synthesis.
+    """
+
+    def __init__(self):
+        self.text_requests = []
+
+    def speak_text_async(self, text):
+        self.text_requests.append(text)
+        result = types.SimpleNamespace(reason=speechsdk.ResultReason.SynthesizingAudioCompleted, audio_data=MP3_FRAME * len(text))
+        return types.SimpleNamespace(get=lambda: result)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    synthesizer = _FakeSynthesizer()
+    tts_audio_store = audio_store.AudioStore(str(tmp_path))
+    monkeypatch.setenv("AZURE_AI_SERVICES_KEY", "test-key")
+    monkeypatch.setenv("AZURE_AI_SERVICES_REGION", "test-region")
+    monkeypatch.setattr(prewarm.clients, "get_speech_config", lambda *args, **kwargs: None)
+    monkeypatch.setattr(GetTTSAudio, "tts_synthesizer_pool", synthesizer_pool.SynthesizerPool(
+        factory=lambda key, speech_config: synthesizer_pool.PooledSynthesizer(key, synthesizer, None)
+    ))
+    monkeypatch.setattr(GetTTSAudio, "tts_audio_store", tts_audio_store)
+    monkeypatch.setattr(prewarm, "tts_audio_store", tts_audio_store)
+    queue = audio_prewarm.InProcessQueue(name="test_lesson_audio_prewarm")
+    queue.set_handler(prewarm.handle_message)
+    monkeypatch.setattr(audio_prewarm, "prewarm_queue", queue)
+    return types.SimpleNamespace(audio_store=tts_audio_store, queue=queue, synthesizer=synthesizer)
+
+
+def _audio_id(text):
+    # audioId yang dihitung GetTTSAudio untuk request dengan languageCode en-US dan format default
+    return audio_store.audio_key(text, GetTTSAudio.resolve_voice("en-US"), GetTTSAudio.TTS_DEFAULT_AUDIO_FORMAT.output_format.name)
+
+
+def test_generated_lesson_audio_is_stored(store):
+    GenerateLesson._prewarm_lesson_audio(LESSON, "en")
+    store.queue.join()
+
+    assert sorted(store.synthesizer.text_requests) == sorted(LESSON_TEXTS)
+    for text in LESSON_TEXTS:
+        stored_blob = store.audio_store.get(_audio_id(text))
+        assert stored_blob is not None, text
+        with stored_blob:
+            assert stored_blob.read() == MP3_FRAME * len(text) # Sama dengan hasil POST /GetTTSAudio
+
+
+def test_cached_texts_are_not_synthesized_again(store):
+    GenerateLesson._prewarm_lesson_audio(LESSON, "en")
+    store.queue.join()
+    GenerateLesson._prewarm_lesson_audio(LESSON, "en")
+    store.queue.join()
+
+    assert len(store.synthesizer.text_requests) == len(LESSON_TEXTS)
+
+
+def test_native_language_texts_are_not_prewarmed(store):
+    GenerateLesson._prewarm_lesson_audio(LESSON, "en")
+    store.queue.join()
+
+    assert store.audio_store.get(_audio_id("tiket")) is None
+
+
+def test_bulk_clips_have_their_own_audio_ids():
+    output_format = GetTTSAudio.TTS_DEFAULT_AUDIO_FORMAT.output_format.name
+    bulk_id = audio_store.audio_key("ticket", "en-US-AvaMultilingualNeural", output_format, variant=bulk.BULK_CLIP_VARIANT)
+    assert audio_store.is_audio_id(bulk_id)
+    assert bulk_id != audio_store.audio_key("ticket", "en-US-AvaMultilingualNeural", output_format)
@@ -0,0 +1,23 @@
+import importlib
+import logging
+
+import DetectObjectsVisual
+
+
+def _reload_with_nms_method(monkeypatch, value):
+    monkeypatch.setenv("NMS_METHOD", value)
+    try:
+        return importlib.reload(DetectObjectsVisual).NMS_METHOD
+    finally:
+        monkeypatch.delenv("NMS_METHOD")
+        importlib.reload(DetectObjectsVisual)
+
+
+def test_invalid_nms_method_falls_back_to_hard(monkeypatch, caplog):
+    with caplog.at_level(logging.ERROR):
+        assert _reload_with_nms_method(monkeypatch, "bogus") == "hard"
+    assert "Unknown NMS_METHOD 'bogus'" in caplog.text
+
+
+def test_valid_nms_method_is_kept(monkeypatch):
+    assert _reload_with_nms_method(monkeypatch, "Gaussian") == "gaussian"
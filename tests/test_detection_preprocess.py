@@ -0,0 +1,32 @@
+import io
+
+from PIL import ExifTags, Image
+
+from DetectObjectsVisual.preprocess import prepare_image_for_detection
+
+
+def _jpeg(size, orientation=None):
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[ExifTags.Base.Orientation] = orientation
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (0, 128, 255)).save(buffer, format="JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+def test_upright_small_jpeg_is_passed_through():
+    prepared = prepare_image_for_detection(_jpeg((640, 480)))
+    assert prepared.passthrough
+    assert prepared.original_size == prepared.sent_size == (640, 480)
+
+
+def test_rotated_small_and_large_jpegs_use_upright_coordinates():
+    # Foto portrait yang sama dalam dua resolusi: kotak harus selalu di koordinat tegak
+    small = prepare_image_for_detection(_jpeg((640, 480), orientation=6))
+    large = prepare_image_for_detection(_jpeg((4000, 3000), orientation=6), max_side=1333)
+    assert not small.passthrough
+    assert small.original_size == small.sent_size == (480, 640)
+    assert Image.open(io.BytesIO(small.image_bytes)).size == (480, 640)
+    assert large.original_size == (3000, 4000)
+    assert large.sent_size[0] < large.sent_size[1]
+    assert abs(large.scale_x - large.scale_y) < 0.01
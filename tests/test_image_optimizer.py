@@ -0,0 +1,49 @@
+import io
+
+from PIL import ExifTags, Image
+
+from GetObjectDetailsVisual.image_optimizer import high_detail_size, optimize_for_vision
+
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+
+def _jpeg(size, orientation=None):
+    # Kiri merah, kanan biru (orientasi tersimpan)
+    pil_image = Image.new("RGB", size, BLUE)
+    pil_image.paste(RED, (0, 0, size[0] // 2, size[1]))
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[ExifTags.Base.Orientation] = orientation
+    buffer = io.BytesIO()
+    pil_image.save(buffer, format="JPEG", quality=90, exif=exif)
+    return buffer.getvalue()
+
+def _is_red(pixel):
+    return pixel[0] > 200 and pixel[2] < 60
+
+
+def test_upright_jpeg_is_passed_through():
+    image_bytes = _jpeg((300, 200))
+    optimized = optimize_for_vision(image_bytes)
+    assert optimized.passthrough
+    assert optimized.image_bytes == image_bytes
+
+
+def test_rotated_jpeg_is_sent_upright():
+    # Orientasi 6: tampil diputar 90 derajat searah jarum jam, jadi sisi kiri menjadi bagian atas
+    optimized = optimize_for_vision(_jpeg((300, 200), orientation=6))
+    assert not optimized.passthrough
+    assert optimized.original_size == (200, 300)
+    assert optimized.sent_size == (200, 300)
+    sent_image = Image.open(io.BytesIO(optimized.image_bytes))
+    assert sent_image.size == (200, 300)
+    assert _is_red(sent_image.getpixel((100, 50)))
+    assert not _is_red(sent_image.getpixel((100, 250)))
+
+
+def test_rotated_large_jpeg_uses_upright_target_size():
+    optimized = optimize_for_vision(_jpeg((3000, 1000), orientation=8))
+    assert optimized.detail == "high"
+    assert optimized.sent_size == high_detail_size((1000, 3000))
+    assert Image.open(io.BytesIO(optimized.image_bytes)).size == optimized.sent_size
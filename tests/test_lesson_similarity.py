@@ -0,0 +1,75 @@
+import pytest
+
+from GenerateLesson.cache import normalize_scenario
+from GenerateLesson.similarity import ScenarioIndex, within_edit_distance
+
+BUCKET = ("en", "id", "beginner")
+THRESHOLD = 0.8
+
+CACHED_SCENARIOS = (
+    "asking for directions to the hotel",
+    "ordering food at a restaurant",
+    "buying a train ticket at the station",
+    "checking in at the airport",
+    "paying for groceries at the market",
+)
+
+
+@pytest.fixture
+def index():
+    scenario_index = ScenarioIndex()
+    for scenario in CACHED_SCENARIOS:
+        scenario_index.add(BUCKET, normalize_scenario(scenario), scenario)
+    return scenario_index
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Asking for directions to the hotel!", "asking for directions to the hotel"),
+    ("asking for direcitons to the hotel", "asking for directions to the hotel"),
+    ("Ordering food in a restaurant", "ordering food at a restaurant"),
+    ("ordering food at a restarant", "ordering food at a restaurant"),
+    ("buying a train ticket at the sation", "buying a train ticket at the station"),
+])
+def test_near_duplicates_are_served(index, query, expected):
+    value, similarity = index.lookup(BUCKET, normalize_scenario(query), THRESHOLD)
+    assert value == expected
+    assert similarity >= THRESHOLD
+
+
+@pytest.mark.parametrize("query", [
+    "asking for directions to the hospital",
+    "asking for directions to the museum",
+    "ordering food at a bakery",
+    "buying a bus ticket at the station",
+    "checking in at the hospital",
+    "paying for medicine at the market",
+])
+def test_one_word_substitutions_are_not_served(index, query):
+    # Cosine n-gram saja (0.82 untuk hotel/hospital) tidak cukup untuk membedakan skenario ini
+    value, _ = index.lookup(BUCKET, normalize_scenario(query), THRESHOLD)
+    assert value is None
+
+
+def test_other_bucket_is_not_served(index):
+    value, _ = index.lookup(("en", "id", "advanced"), normalize_scenario("ordering food at a restaurant"), THRESHOLD)
+    assert value is None
+
+
+def test_removed_scenario_is_not_served(index):
+    index.remove(BUCKET, normalize_scenario("ordering food at a restaurant"))
+    value, _ = index.lookup(BUCKET, normalize_scenario("ordering food at a restarant"), THRESHOLD)
+    assert value is None
+
+
+@pytest.mark.parametrize("text, other_text, distance", [
+    ("hotel", "hotel", 0),
+    ("hotel", "hostel", 1),
+    ("restaurant", "restarant", 1),
+    ("at a cafe", "in a cafe", 2),
+    ("hotel", "hospital", 4),
+    ("", "abc", 3),
+])
+def test_within_edit_distance(text, other_text, distance):
+    assert within_edit_distance(text, other_text, distance)
+    if distance:
+        assert not within_edit_distance(text, other_text, distance - 1)
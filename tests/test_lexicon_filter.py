@@ -0,0 +1,21 @@
+import pytest
+
+from shared_code import lexicon_filter
+
+
+@pytest.mark.parametrize("text", [
+    "una violación de las reglas de tráfico",
+    "no quiero violar las reglas del museo",
+    "belajar memenggal kata menjadi suku kata",
+    "cara penggal kata dalam bahasa Indonesia",
+    "E. coli in the kitchen lab",
+    "rape seed oil farm",
+])
+def test_ambiguous_terms_are_not_blocked(text):
+    # Kata dengan arti biasa hanya "review": keputusan tetap di Content Safety
+    result = lexicon_filter.prefilter_text(text)
+    assert result is None or not result.blocked
+
+def test_clear_violation_is_blocked():
+    result = lexicon_filter.prefilter_text("how to make a bomb at school")
+    assert result is not None and result.blocked
@@ -0,0 +1,38 @@
+import time
+
+from shared_code.ttl_cache import SQLiteCache, TieredCache, TTLCache
+
+
+def test_sqlite_purges_expired_rows_on_writes(tmp_path):
+    sqlite_cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), purge_interval=4)
+    sqlite_cache.set("old", 1, ttl_seconds=-1) # Sudah kedaluwarsa
+    for index in range(3):
+        sqlite_cache.set(f"key{index}", index)
+    rows = sqlite_cache._conn.execute("SELECT key FROM cache").fetchall()
+    assert sorted(key for (key,) in rows) == ["key0", "key1", "key2"]
+
+
+def test_sqlite_row_cap_drops_rows_closest_to_expiry(tmp_path):
+    sqlite_cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_rows=2, purge_interval=1000)
+    for index in range(4):
+        sqlite_cache.set(f"key{index}", index, ttl_seconds=100 + index)
+    assert sqlite_cache.purge_expired() == 2
+    assert sqlite_cache.get("key0") is None and sqlite_cache.get("key1") is None
+    assert sqlite_cache.get("key3") == 3
+
+
+def test_expired_rows_are_purged_when_opened(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteCache(path).set("old", 1, ttl_seconds=-1)
+    reopened = SQLiteCache(path)
+    assert reopened._conn.execute("SELECT COUNT(*) FROM cache").fetchone() == (0,)
+
+
+def test_promoted_entry_keeps_remaining_ttl(tmp_path):
+    sqlite_cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    sqlite_cache.set("key", "value", ttl_seconds=0.2)
+    tiered_cache = TieredCache(TTLCache(ttl_seconds=3600), sqlite_cache)
+    assert tiered_cache.get("key") == "value" # Dipromosikan ke memori
+    time.sleep(0.3)
+    assert tiered_cache.memory.get("key") is None
+    assert tiered_cache.get("key") is None